@@ -1,13 +1,412 @@
+import base64
 import json
+import math
 import os
+from datetime import datetime, timezone
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Dict, Any
+from psycopg2.extras import RealDictCursor, execute_values
+from typing import Dict, Any, List, Optional
+
+from throttle import WriteThrottle, ConcurrencyLimiter, client_ip
+from progress import ProgressBuffer
+
+# Закладка ставится на каждой прочитанной главе, поэтому лимит мягче, чем у комментариев
+bookmark_throttle = WriteThrottle('bookmarks', user_rate=1, user_burst=20, ip_rate=3, ip_burst=60)
+inflight = ConcurrencyLimiter()
+
+MAX_SYNC_BATCH = 500
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Запас на транзакции, которые начались раньше выдачи server_time, а закоммитились позже:
+# следующая дельта повторно захватывает последние секунды, применение изменений идемпотентно
+SYNC_OVERLAP_SECONDS = 30
+
+# Удаленные закладки хранятся как tombstone столько дней (purge_bookmark_tombstones в moderator-bot);
+# клиенту с более старым updated_since нужна полная перезагрузка списка
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('BOOKMARK_TOMBSTONE_DAYS', '90'))
 
 def get_db_connection():
     database_url = os.environ.get('DATABASE_URL')
     return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
 
+# Прогресс чтения одной манхвы пишется в БД не чаще раза в PROGRESS_FLUSH_INTERVAL секунд
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get('PROGRESS_FLUSH_INTERVAL', '15'))
+progress_buffer = ProgressBuffer(get_db_connection, PROGRESS_FLUSH_INTERVAL)
+
+def parse_client_time(value: Any) -> datetime:
+    '''Время изменения на клиенте: ISO 8601 или миллисекунды Unix; хранится как UTC без зоны'''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        parsed = datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+    elif isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+    else:
+        raise ValueError('updated_at required')
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+def serialize_bookmark(bookmark: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': bookmark['id'],
+        'manhwa_id': bookmark['manhwa_id'],
+        'manhwa_title': bookmark['title'],
+        'cover': bookmark['cover_url'],
+        'rating': float(bookmark['rating']) if bookmark['rating'] else 0,
+        'chapter_id': bookmark['chapter_id'],
+        'chapter_number': bookmark['chapter_number'],
+        'chapter_title': bookmark['chapter_title'],
+        'created_at': bookmark['created_at'].isoformat() if bookmark['created_at'] else None,
+        'updated_at': bookmark['updated_at'].isoformat() if bookmark['updated_at'] else None
+    }
+
+def fetch_bookmarks(cur, user_id: str) -> List[Dict[str, Any]]:
+    cur.execute('''
+        SELECT b.id, b.manhwa_id, b.chapter_id, b.created_at, b.updated_at,
+               m.title, m.cover_url, m.rating,
+               c.chapter_number, c.title as chapter_title
+        FROM t_p15993318_manhwa_reader_platfo.bookmarks b
+        JOIN t_p15993318_manhwa_reader_platfo.manhwa m ON b.manhwa_id = m.id
+        LEFT JOIN t_p15993318_manhwa_reader_platfo.chapters c ON b.chapter_id = c.id
+        WHERE b.user_id = %s AND b.deleted_at IS NULL
+        ORDER BY b.created_at DESC, b.id DESC
+    ''', (user_id,))
+    return [serialize_bookmark(bookmark) for bookmark in cur.fetchall()]
+
+def encode_cursor(values: List[Any]) -> str:
+    '''Курсор keyset-пагинации: режим, ключ сортировки последней строки и server_time первой страницы'''
+    raw = json.dumps(values, default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def cursor_value(value: Any, kind: Optional[str]) -> Any:
+    '''Значение курсора ожидаемого типа (number, timestamp, id, text; None - без проверки); ValueError - курсор испорчен'''
+    if kind is None:
+        return value
+    if kind in ('timestamp', 'text'):
+        if not isinstance(value, str):
+            raise ValueError(f'{kind} expected')
+        return datetime.fromisoformat(value) if kind == 'timestamp' else value
+    expected = int if kind == 'id' else (int, float)
+    if isinstance(value, bool) or not isinstance(value, expected) or not math.isfinite(value):
+        raise ValueError(f'{kind} expected')
+    return value
+
+def decode_cursor(cursor: str, kinds: List[Optional[str]]) -> Optional[List[Any]]:
+    '''Значения курсора по типам ключей сортировки или None, если курсор некорректен'''
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(kinds):
+            return None
+        return [cursor_value(value, kind) for value, kind in zip(values, kinds)]
+    except (ValueError, TypeError):
+        return None
+
+def parse_limit(params: Dict[str, Any], default: int) -> int:
+    try:
+        limit = int(params.get('limit', default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def list_bookmarks(cur, user_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Страница закладок. Без updated_since - живые закладки от новых к старым (keyset по created_at, id);
+    с updated_since - все изменения после этого момента, включая удаления, в порядке (updated_at, id).
+    server_time одинаков для всех страниц одного обхода и передается в updated_since в следующий раз.
+    Без limit, cursor и updated_since - весь список одним ответом, как раньше
+    '''
+    paged = any(params.get(key) for key in ('limit', 'cursor', 'updated_since'))
+    limit = parse_limit(params, PAGE_SIZE) if paged else None
+    
+    if params.get('cursor'):
+        cursor_values = decode_cursor(params['cursor'], ['text', 'timestamp', 'id', None])
+        if cursor_values is None or cursor_values[0] not in ('list', 'delta'):
+            raise ValueError('invalid cursor')
+        mode, after_time, after_id, server_time = cursor_values
+        since = None
+    else:
+        mode = 'delta' if params.get('updated_since') else 'list'
+        after_time = after_id = None
+        since = parse_client_time(params['updated_since']) if mode == 'delta' else None
+        cur.execute(
+            "SELECT timezone('UTC', now()) - make_interval(secs => %s) AS server_time, "
+            "timezone('UTC', now()) - make_interval(days => %s) AS retained_since",
+            (SYNC_OVERLAP_SECONDS, TOMBSTONE_RETENTION_DAYS)
+        )
+        clock = cur.fetchone()
+        server_time = clock['server_time'].isoformat()
+        
+        if since is not None and since < clock['retained_since']:
+            return {'bookmarks': [], 'deleted': [], 'reset': True, 'next_cursor': None, 'server_time': server_time}
+    
+    columns = '''
+        SELECT b.id, b.manhwa_id, b.chapter_id, b.created_at, b.updated_at, b.deleted_at,
+               m.title, m.cover_url, m.rating,
+               c.chapter_number, c.title as chapter_title
+        FROM t_p15993318_manhwa_reader_platfo.bookmarks b
+        JOIN t_p15993318_manhwa_reader_platfo.manhwa m ON b.manhwa_id = m.id
+        LEFT JOIN t_p15993318_manhwa_reader_platfo.chapters c ON b.chapter_id = c.id
+    '''
+    
+    if mode == 'list':
+        keyset = 'AND (b.created_at, b.id) < (%s::timestamp, %s)' if after_id is not None else ''
+        cur.execute(columns + f'''
+            WHERE b.user_id = %s AND b.deleted_at IS NULL {keyset}
+            ORDER BY b.created_at DESC, b.id DESC
+            {'LIMIT %s' if limit else ''}
+        ''', [user_id] + ([after_time, after_id] if after_id is not None else []) + ([limit + 1] if limit else []))
+    else:
+        if after_id is not None:
+            keyset, keyset_params = 'AND (b.updated_at, b.id) > (%s::timestamp, %s)', [after_time, after_id]
+        else:
+            keyset, keyset_params = 'AND b.updated_at > %s', [since]
+        cur.execute(columns + f'''
+            WHERE b.user_id = %s {keyset}
+            ORDER BY b.updated_at, b.id
+            LIMIT %s
+        ''', [user_id] + keyset_params + [limit + 1])
+    
+    rows = cur.fetchall()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        sort_time = last['created_at'] if mode == 'list' else last['updated_at']
+        next_cursor = encode_cursor([mode, sort_time.isoformat(), last['id'], server_time])
+    
+    return {
+        'bookmarks': [serialize_bookmark(row) for row in rows if row['deleted_at'] is None],
+        'deleted': [
+            {'manhwa_id': row['manhwa_id'], 'deleted_at': row['deleted_at'].isoformat()}
+            for row in rows if row['deleted_at'] is not None
+        ],
+        'reset': False,
+        'next_cursor': next_cursor,
+        'server_time': server_time
+    }
+
+def sync_bookmarks(cur, user_id: str, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Пакет изменений с клиента (офлайн-очередь, другое устройство) одной транзакцией.
+    Конфликты решаются по времени изменения (last-writer-wins): изменение применяется,
+    только если оно не старше того, что уже лежит в БД. Возвращает итоговое состояние закладок
+    '''
+    changes: Dict[int, Dict[str, Any]] = {}
+    for kind in ('upserts', 'deletes'):
+        for item in body_data.get(kind) or []:
+            change = {
+                'kind': kind,
+                'manhwa_id': int(item['manhwa_id']),
+                'chapter_id': int(item['chapter_id']) if item.get('chapter_id') else None,
+                'updated_at': parse_client_time(item.get('updated_at'))
+            }
+            # Внутри пакета по одной манхве побеждает самое позднее изменение
+            current = changes.get(change['manhwa_id'])
+            if current is None or current['updated_at'] <= change['updated_at']:
+                changes[change['manhwa_id']] = change
+    
+    if len(changes) > MAX_SYNC_BATCH:
+        raise ValueError(f'at most {MAX_SYNC_BATCH} bookmarks per sync')
+    
+    upserts = [c for c in changes.values() if c['kind'] == 'upserts']
+    deletes = [c for c in changes.values() if c['kind'] == 'deletes']
+    upserted: List[int] = []
+    deleted: List[int] = []
+    
+    if upserts:
+        # Время из будущего обрезается до серверного, иначе устройство с уехавшими часами выигрывало бы всегда.
+        # Несуществующая манхва пропускается, чужая или удаленная глава сбрасывается в NULL
+        rows = execute_values(cur, '''
+            INSERT INTO t_p15993318_manhwa_reader_platfo.bookmarks
+                (user_id, manhwa_id, chapter_id, changed_at, updated_at)
+            SELECT v.user_id, v.manhwa_id, c.id, LEAST(v.changed_at, timezone('UTC', now())), timezone('UTC', now())
+            FROM (VALUES %s) AS v(user_id, manhwa_id, chapter_id, changed_at)
+            JOIN t_p15993318_manhwa_reader_platfo.manhwa m ON m.id = v.manhwa_id
+            LEFT JOIN t_p15993318_manhwa_reader_platfo.chapters c
+                ON c.id = v.chapter_id AND c.manhwa_id = v.manhwa_id
+            ON CONFLICT (user_id, manhwa_id)
+            DO UPDATE SET chapter_id = EXCLUDED.chapter_id,
+                          changed_at = EXCLUDED.changed_at,
+                          updated_at = EXCLUDED.updated_at,
+                          created_at = CASE WHEN bookmarks.deleted_at IS NULL
+                                            THEN bookmarks.created_at ELSE EXCLUDED.created_at END,
+                          deleted_at = NULL
+            WHERE bookmarks.changed_at <= EXCLUDED.changed_at
+            RETURNING manhwa_id
+        ''', [(user_id, c['manhwa_id'], c['chapter_id'], c['updated_at']) for c in upserts],
+            template='(%s, %s::integer, %s::integer, %s::timestamp)',
+            page_size=MAX_SYNC_BATCH,
+            fetch=True)
+        upserted = [row['manhwa_id'] for row in rows]
+    
+    if deletes:
+        # Удаление оставляет tombstone, чтобы дельта-синхронизация других устройств увидела его,
+        # а запоздавшее изменение со старым временем не воскресило закладку
+        cur.execute('''
+            UPDATE t_p15993318_manhwa_reader_platfo.bookmarks b
+            SET deleted_at = timezone('UTC', now()),
+                changed_at = LEAST(d.deleted_at, timezone('UTC', now())),
+                updated_at = timezone('UTC', now())
+            FROM unnest(%s::integer[], %s::timestamp[]) AS d(manhwa_id, deleted_at)
+            WHERE b.user_id = %s
+              AND b.manhwa_id = ANY(%s)
+              AND b.manhwa_id = d.manhwa_id
+              AND b.deleted_at IS NULL
+              AND b.changed_at <= LEAST(d.deleted_at, timezone('UTC', now()))
+            RETURNING b.manhwa_id
+        ''', (
+            [c['manhwa_id'] for c in deletes],
+            [c['updated_at'] for c in deletes],
+            user_id,
+            [c['manhwa_id'] for c in deletes]
+        ))
+        deleted = [row['manhwa_id'] for row in cur.fetchall()]
+    
+    applied = set(upserted) | set(deleted)
+    return {
+        'upserted': upserted,
+        'deleted': deleted,
+        'skipped': sorted(manhwa_id for manhwa_id in changes if manhwa_id not in applied),
+        'bookmarks': fetch_bookmarks(cur, user_id)
+    }
+
+CONTINUE_QUERY = '''
+    WITH page AS (
+        SELECT b.id, b.manhwa_id, b.chapter_id, b.created_at, b.updated_at,
+               m.title, m.cover_url, m.rating,
+               m.latest_chapter_number, m.last_chapter_at, m.chapter_count,
+               c.chapter_number, c.title as chapter_title
+        FROM t_p15993318_manhwa_reader_platfo.bookmarks b
+        JOIN t_p15993318_manhwa_reader_platfo.manhwa m ON b.manhwa_id = m.id
+        LEFT JOIN t_p15993318_manhwa_reader_platfo.chapters c ON b.chapter_id = c.id
+        WHERE b.user_id = %(user_id)s
+          AND b.deleted_at IS NULL
+          AND m.last_chapter_at IS NOT NULL
+          AND (%(include_read)s OR m.latest_chapter_number > COALESCE(c.chapter_number, -1))
+          {keyset}
+        ORDER BY m.last_chapter_at DESC, b.id DESC
+        LIMIT %(limit)s
+    )
+    SELECT p.*,
+           CASE WHEN p.chapter_number IS NULL THEN p.chapter_count
+                ELSE COALESCE(u.unread, 0) END AS unread_count,
+           n.id AS next_chapter_id,
+           n.chapter_number AS next_chapter_number
+    FROM page p
+    LEFT JOIN LATERAL (
+        -- Только для страницы и только где есть новые главы; счет по индексу (manhwa_id, chapter_number)
+        SELECT COUNT(*) AS unread
+        FROM t_p15993318_manhwa_reader_platfo.chapters ch
+        WHERE p.latest_chapter_number > p.chapter_number
+          AND ch.manhwa_id = p.manhwa_id
+          AND ch.chapter_number > p.chapter_number
+    ) u ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT ch.id, ch.chapter_number
+        FROM t_p15993318_manhwa_reader_platfo.chapters ch
+        WHERE ch.manhwa_id = p.manhwa_id
+          AND ch.chapter_number > COALESCE(p.chapter_number, -1)
+        ORDER BY ch.chapter_number
+        LIMIT 1
+    ) n ON TRUE
+    ORDER BY p.last_chapter_at DESC, p.id DESC
+'''
+
+def list_continue_reading(cur, user_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Лента "Продолжить чтение": закладки с вышедшими после закладки главами, свежие релизы первыми.
+    Последняя глава и время релиза берутся из сводки в manhwa (триггер на chapters, V0016),
+    поэтому главы считаются только для строк страницы, а не для всех закладок пользователя
+    '''
+    limit = parse_limit(params, PAGE_SIZE)
+    query_params = {
+        'user_id': user_id,
+        'include_read': params.get('include_read') in ('1', 'true'),
+        'limit': limit + 1
+    }
+    
+    keyset = ''
+    if params.get('cursor'):
+        cursor_values = decode_cursor(params['cursor'], ['text', 'timestamp', 'id', None])
+        if cursor_values is None or cursor_values[0] != 'continue':
+            raise ValueError('invalid cursor')
+        keyset = 'AND (m.last_chapter_at, b.id) < (%(after_time)s::timestamp, %(after_id)s)'
+        query_params.update(after_time=cursor_values[1], after_id=cursor_values[2])
+    
+    cur.execute(CONTINUE_QUERY.format(keyset=keyset), query_params)
+    rows = cur.fetchall()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(['continue', last['last_chapter_at'].isoformat(), last['id'], None])
+    
+    items = []
+    for row in rows:
+        item = serialize_bookmark(row)
+        item.update({
+            'unread_count': row['unread_count'],
+            'latest_chapter_number': row['latest_chapter_number'],
+            'last_chapter_at': row['last_chapter_at'].isoformat(),
+            'next_chapter_id': row['next_chapter_id'],
+            'next_chapter_number': row['next_chapter_number']
+        })
+        items.append(item)
+    
+    return {'bookmarks': items, 'next_cursor': next_cursor}
+
+def serialize_progress(progress: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'manhwa_id': progress['manhwa_id'],
+        'chapter_id': progress['chapter_id'],
+        'page': progress['page'],
+        'offset': progress['page_offset'],
+        'updated_at': progress['client_time'].isoformat()
+    }
+
+def save_progress(user_id: str, body_data: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Пинг прогресса чтения. Ответ не ждет записи в БД: пинги одной манхвы объединяются в буфере,
+    flush=true (закрытие читалки) записывает сразу
+    '''
+    entry = {
+        'user_id': user_id,
+        'manhwa_id': int(body_data['manhwa_id']),
+        'chapter_id': int(body_data['chapter_id']) if body_data.get('chapter_id') else None,
+        'page': max(0, int(body_data.get('page') or 0)),
+        'page_offset': min(max(float(body_data.get('offset') or 0), 0.0), 1.0),
+        'client_time': min(
+            parse_client_time(body_data['updated_at']) if body_data.get('updated_at')
+            else datetime.now(timezone.utc).replace(tzinfo=None),
+            datetime.now(timezone.utc).replace(tzinfo=None)
+        )
+    }
+    force = params.get('flush') in ('1', 'true') or bool(body_data.get('flush'))
+    persist_in = progress_buffer.record(entry, force=force)
+    return {'accepted': True, 'persisted': persist_in == 0, 'persist_in': round(persist_in, 1)}
+
+def get_progress(cur, user_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Прогресс по манхве или по всем манхвам пользователя; непрочитанные в БД пинги инстанса поверх'''
+    manhwa_id = int(params['manhwa_id']) if params.get('manhwa_id') else None
+    
+    cur.execute('''
+        SELECT manhwa_id, chapter_id, page, page_offset, client_time
+        FROM t_p15993318_manhwa_reader_platfo.reading_progress
+        WHERE user_id = %s AND (%s::integer IS NULL OR manhwa_id = %s::integer)
+        ORDER BY updated_at DESC
+        LIMIT %s
+    ''', (user_id, manhwa_id, manhwa_id, MAX_PAGE_SIZE))
+    
+    merged = {row['manhwa_id']: dict(row) for row in cur.fetchall()}
+    for entry in progress_buffer.pending(user_id, manhwa_id):
+        current = merged.get(entry['manhwa_id'])
+        if current is None or current['client_time'] <= entry['client_time']:
+            merged[entry['manhwa_id']] = entry
+    
+    progress = sorted(merged.values(), key=lambda p: p['client_time'], reverse=True)
+    return {'progress': [serialize_progress(p) for p in progress]}
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для работы с закладками пользователей
@@ -24,6 +423,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Expose-Headers': 'Retry-After',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -41,37 +441,61 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = get_db_connection()
+    params = event.get('queryStringParameters') or {}
+    
+    # Пинг прогресса обычно не трогает БД, поэтому обслуживается без подключения
+    if method == 'POST' and params.get('resource') == 'progress':
+        try:
+            result = save_progress(user_id, json.loads(event.get('body') or '{}'), params)
+        except (KeyError, TypeError, ValueError) as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'Invalid progress: {e}'}),
+                'isBase64Encoded': False
+            }
+        
+        return {
+            'statusCode': 202,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps(result),
+            'isBase64Encoded': False
+        }
+    
+    if not inflight.acquire():
+        return {
+            'statusCode': 503,
+            'headers': {'Access-Control-Allow-Origin': '*', 'Retry-After': '1'},
+            'body': json.dumps({'error': 'Service overloaded, retry later'}),
+            'isBase64Encoded': False
+        }
+    
+    try:
+        conn = get_db_connection()
+    except Exception:
+        inflight.release()
+        raise
     cur = conn.cursor()
     
     try:
         if method == 'GET':
-            cur.execute('''
-                SELECT b.id, b.manhwa_id, b.chapter_id, b.created_at,
-                       m.title, m.cover_url, m.rating,
-                       c.chapter_number, c.title as chapter_title
-                FROM t_p15993318_manhwa_reader_platfo.bookmarks b
-                JOIN t_p15993318_manhwa_reader_platfo.manhwa m ON b.manhwa_id = m.id
-                LEFT JOIN t_p15993318_manhwa_reader_platfo.chapters c ON b.chapter_id = c.id
-                WHERE b.user_id = '{}'
-                ORDER BY b.created_at DESC
-            '''.format(user_id.replace("'", "''")))
-            
-            bookmarks = cur.fetchall()
-            
-            result = []
-            for bookmark in bookmarks:
-                result.append({
-                    'id': bookmark['id'],
-                    'manhwa_id': bookmark['manhwa_id'],
-                    'manhwa_title': bookmark['title'],
-                    'cover': bookmark['cover_url'],
-                    'rating': float(bookmark['rating']) if bookmark['rating'] else 0,
-                    'chapter_id': bookmark['chapter_id'],
-                    'chapter_number': bookmark['chapter_number'],
-                    'chapter_title': bookmark['chapter_title'],
-                    'created_at': bookmark['created_at'].isoformat() if bookmark['created_at'] else None
-                })
+            try:
+                if params.get('resource') == 'progress':
+                    result = get_progress(cur, user_id, params)
+                elif params.get('resource') == 'continue':
+                    result = list_continue_reading(cur, user_id, params)
+                else:
+                    result = list_bookmarks(cur, user_id, params)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
             
             return {
                 'statusCode': 200,
@@ -79,12 +503,45 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'bookmarks': result}),
+                'body': json.dumps(result),
                 'isBase64Encoded': False
             }
         
         elif method == 'POST':
+            retry_after = bookmark_throttle.check(user_id, client_ip(event), conn)
+            if retry_after:
+                return {
+                    'statusCode': 429,
+                    'headers': {'Access-Control-Allow-Origin': '*', 'Retry-After': str(retry_after)},
+                    'body': json.dumps({'error': 'Too many requests, retry later', 'retry_after': retry_after}),
+                    'isBase64Encoded': False
+                }
+            
             body_data = json.loads(event.get('body', '{}'))
+            
+            if params.get('action') == 'sync':
+                try:
+                    merged = sync_bookmarks(cur, user_id, body_data)
+                except (KeyError, TypeError, ValueError) as e:
+                    conn.rollback()
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': f'Invalid sync batch: {e}'}),
+                        'isBase64Encoded': False
+                    }
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps(merged),
+                    'isBase64Encoded': False
+                }
+            
             manhwa_id = body_data.get('manhwa_id')
             chapter_id = body_data.get('chapter_id')
             
@@ -100,7 +557,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 INSERT INTO t_p15993318_manhwa_reader_platfo.bookmarks (user_id, manhwa_id, chapter_id)
                 VALUES ('{}', {}, {})
                 ON CONFLICT (user_id, manhwa_id) 
-                DO UPDATE SET chapter_id = EXCLUDED.chapter_id
+                DO UPDATE SET chapter_id = EXCLUDED.chapter_id,
+                              changed_at = timezone('UTC', now()),
+                              updated_at = timezone('UTC', now()),
+                              created_at = CASE WHEN bookmarks.deleted_at IS NULL
+                                                THEN bookmarks.created_at ELSE timezone('UTC', now()) END,
+                              deleted_at = NULL
                 RETURNING id
             '''.format(
                 user_id.replace("'", "''"),
@@ -134,9 +596,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             cur.execute('''
-                DELETE FROM t_p15993318_manhwa_reader_platfo.bookmarks
-                WHERE user_id = '{}' AND manhwa_id = {}
-            '''.format(user_id.replace("'", "''"), int(manhwa_id)))
+                UPDATE t_p15993318_manhwa_reader_platfo.bookmarks
+                SET deleted_at = timezone('UTC', now()),
+                    changed_at = timezone('UTC', now()),
+                    updated_at = timezone('UTC', now())
+                WHERE user_id = %s AND manhwa_id = %s AND deleted_at IS NULL
+            ''', (user_id, int(manhwa_id)))
             
             conn.commit()
             
@@ -160,3 +625,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     finally:
         cur.close()
         conn.close()
+        inflight.release()
@@ -0,0 +1,148 @@
+'''
+Business: Прогресс чтения (глава, страница, смещение) с объединением частых записей в памяти инстанса
+Args: connect - функция, открывающая подключение к БД; interval - минимальный интервал записи одного ключа
+Returns: ProgressBuffer - record() для пингов клиента, pending() для чтения еще не записанных значений
+'''
+
+import atexit
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+UPSERT_SQL = '''
+    INSERT INTO t_p15993318_manhwa_reader_platfo.reading_progress
+        (user_id, manhwa_id, chapter_id, page, page_offset, client_time, updated_at)
+    SELECT v.user_id, v.manhwa_id, c.id, v.page, v.page_offset, v.client_time, LOCALTIMESTAMP
+    FROM (VALUES %s) AS v(user_id, manhwa_id, chapter_id, page, page_offset, client_time)
+    JOIN t_p15993318_manhwa_reader_platfo.manhwa m ON m.id = v.manhwa_id
+    LEFT JOIN t_p15993318_manhwa_reader_platfo.chapters c
+        ON c.id = v.chapter_id AND c.manhwa_id = v.manhwa_id
+    ON CONFLICT (user_id, manhwa_id)
+    DO UPDATE SET chapter_id = EXCLUDED.chapter_id,
+                  page = EXCLUDED.page,
+                  page_offset = EXCLUDED.page_offset,
+                  client_time = EXCLUDED.client_time,
+                  updated_at = EXCLUDED.updated_at
+    WHERE reading_progress.client_time <= EXCLUDED.client_time
+'''
+
+UPSERT_TEMPLATE = '(%s, %s::integer, %s::integer, %s::integer, %s::real, %s::timestamp)'
+
+class ProgressBuffer:
+    '''
+    Последний пинг по каждой паре (user_id, manhwa_id) держится в памяти.
+    Первый пинг пары после паузы пишется сразу, следующие в пределах interval только заменяют
+    значение в буфере, и фоновый поток пишет его одной пачкой, когда interval истечет.
+    Так БД видит не больше одной записи на пару за interval, а потерять можно лишь последние секунды
+    '''
+
+    def __init__(self, connect: Callable, interval: float):
+        self.connect = connect
+        self.interval = interval
+        self._pending: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._flushed_at: Dict[Tuple[str, int], float] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.writes = 0
+        self.last_error: Optional[str] = None
+        atexit.register(self.flush_all)
+
+    def record(self, entry: Dict[str, Any], force: bool = False) -> float:
+        '''Принимает пинг; возвращает, через сколько секунд он окажется в БД (0 - уже записан)'''
+        key = (entry['user_id'], entry['manhwa_id'])
+        now = time.monotonic()
+
+        with self._lock:
+            current = self._pending.get(key)
+            if current is None or current['client_time'] <= entry['client_time']:
+                self._pending[key] = entry
+
+            wait = self.interval - (now - self._flushed_at.get(key, float('-inf')))
+            if force or wait <= 0:
+                batch = [self._pending.pop(key)]
+                self._flushed_at[key] = now
+            else:
+                batch = None
+
+        if batch:
+            try:
+                self._write(batch)
+                return 0.0
+            except Exception:
+                # Пинг вернулся в буфер - его допишет фоновый поток
+                wait = self.interval / 2
+
+        self._ensure_flusher()
+        return wait
+
+    def pending(self, user_id: str, manhwa_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        '''Значения, принятые этим инстансом, но еще не записанные - чтобы чтение видело свои же пинги'''
+        with self._lock:
+            return [dict(entry) for (uid, mid), entry in self._pending.items()
+                    if uid == user_id and (manhwa_id is None or mid == manhwa_id)]
+
+    def flush_due(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            due = [key for key in self._pending
+                   if now - self._flushed_at.get(key, float('-inf')) >= self.interval]
+            batch = [self._pending.pop(key) for key in due]
+            for key in due:
+                self._flushed_at[key] = now
+            # Отметки старше интервала больше ничего не ограничивают
+            for key in [k for k, t in self._flushed_at.items() if now - t >= self.interval and k not in self._pending]:
+                del self._flushed_at[key]
+
+        if batch:
+            self._write(batch)
+        return len(batch)
+
+    def flush_all(self) -> int:
+        with self._lock:
+            batch = list(self._pending.values())
+            self._pending.clear()
+        if batch:
+            self._write(batch)
+        return len(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        rows = [(e['user_id'], e['manhwa_id'], e['chapter_id'], e['page'], e['page_offset'], e['client_time'])
+                for e in batch]
+        try:
+            conn = self.connect()
+            try:
+                cursor = conn.cursor()
+                execute_values(cursor, UPSERT_SQL, rows, template=UPSERT_TEMPLATE, page_size=500)
+                conn.commit()
+                cursor.close()
+            finally:
+                conn.close()
+            self.writes += 1
+            self.last_error = None
+        except Exception as e:
+            # Не записанное возвращается в буфер, если его еще не заменил более свежий пинг
+            self.last_error = str(e)
+            with self._lock:
+                for entry in batch:
+                    key = (entry['user_id'], entry['manhwa_id'])
+                    if key not in self._pending:
+                        self._pending[key] = entry
+            raise
+
+    def _ensure_flusher(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='progress-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval / 2)
+            try:
+                self.flush_due()
+            except Exception:
+                # Повтор на следующем тике; ошибка видна в last_error
+                pass
@@ -0,0 +1,196 @@
+"""
+Business: Ограничение частоты записей (token bucket по пользователю и IP) и сброс нагрузки по числу запросов в работе
+Args: переменные окружения THROTTLE_* - backend (memory или postgres), скорость и запас токенов
+Returns: WriteThrottle.check - сколько секунд ждать до следующей записи (None - запись разрешена),
+         ConcurrencyLimiter.acquire - False, если инстанс перегружен и запрос нужно отклонить
+
+Модуль одинаковый в функциях comments и bookmarks: функции деплоятся отдельно и не делят код
+"""
+
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from psycopg2.extras import RealDictCursor
+
+THROTTLE_BACKEND = os.environ.get('THROTTLE_BACKEND', 'memory')
+MAX_INFLIGHT = int(os.environ.get('MAX_INFLIGHT_REQUESTS', '32'))
+
+# Запас ключей в памяти инстанса; вытесняются самые давние - их корзины все равно успели бы наполниться
+MEMORY_MAX_KEYS = 10000
+
+# Доля запросов, которые заодно чистят давно не использованные корзины в rate_limits
+PRUNE_PROBABILITY = 0.001
+
+def client_ip(event: Dict[str, Any]) -> Optional[str]:
+    """IP клиента: из контекста запроса шлюза, иначе первый адрес X-Forwarded-For"""
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    if identity.get('sourceIp'):
+        return identity['sourceIp']
+
+    headers = event.get('headers') or {}
+    forwarded = headers.get('X-Forwarded-For') or headers.get('x-forwarded-for')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return None
+
+class MemoryBuckets:
+    """Корзины в памяти инстанса: без обращений к БД, но лимит действует на каждый инстанс отдельно"""
+
+    def __init__(self, max_keys: int = MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, bucket: str, rate: float, burst: float, conn=None) -> Optional[float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(bucket, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            self._buckets[bucket] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return None if allowed else (1 - tokens) / rate
+
+    def refund(self, bucket: str, rate: float, burst: float, conn=None):
+        with self._lock:
+            if bucket in self._buckets:
+                tokens, updated_at = self._buckets[bucket]
+                self._buckets[bucket] = (min(burst, tokens + 1), updated_at)
+
+class PostgresBuckets:
+    """
+    Общие корзины всех инстансов в UNLOGGED-таблице rate_limits (V0012).
+    Пополнение и списание токена - один upsert; при нехватке токенов строка не меняется
+    """
+
+    TAKE_SQL = """
+        INSERT INTO rate_limits (bucket, tokens, updated_at)
+        VALUES (%(bucket)s, %(burst)s - 1, now())
+        ON CONFLICT (bucket) DO UPDATE
+        SET tokens = LEAST(%(burst)s, rate_limits.tokens
+                           + EXTRACT(EPOCH FROM now() - rate_limits.updated_at) * %(rate)s) - 1,
+            updated_at = now()
+        WHERE LEAST(%(burst)s, rate_limits.tokens
+                    + EXTRACT(EPOCH FROM now() - rate_limits.updated_at) * %(rate)s) >= 1
+        RETURNING tokens
+    """
+
+    REFILL_SQL = """
+        SELECT LEAST(%(burst)s, tokens + EXTRACT(EPOCH FROM now() - updated_at) * %(rate)s) AS tokens
+        FROM rate_limits
+        WHERE bucket = %(bucket)s
+    """
+
+    REFUND_SQL = """
+        UPDATE rate_limits SET tokens = LEAST(%(burst)s, tokens + 1)
+        WHERE bucket = %(bucket)s
+    """
+
+    def take(self, bucket: str, rate: float, burst: float, conn=None) -> Optional[float]:
+        params = {'bucket': bucket, 'rate': rate, 'burst': burst}
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute(self.TAKE_SQL, params)
+            if cursor.fetchone():
+                retry_after = None
+            else:
+                cursor.execute(self.REFILL_SQL, params)
+                row = cursor.fetchone()
+                tokens = float(row['tokens']) if row else burst
+                retry_after = max((1 - tokens) / rate, 0.0)
+
+            if random.random() < PRUNE_PROBABILITY:
+                cursor.execute("DELETE FROM rate_limits WHERE updated_at < now() - interval '1 day'")
+
+            # Списание фиксируется сразу, а не вместе с записью, ради которой берется токен
+            conn.commit()
+        finally:
+            cursor.close()
+
+        return retry_after
+
+    def refund(self, bucket: str, rate: float, burst: float, conn=None):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(self.REFUND_SQL, {'bucket': bucket, 'burst': burst})
+            conn.commit()
+        finally:
+            cursor.close()
+
+BACKENDS = {
+    'memory': MemoryBuckets,
+    'postgres': PostgresBuckets
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if THROTTLE_BACKEND not in BACKENDS:
+                raise Exception(f'Unknown THROTTLE_BACKEND: {THROTTLE_BACKEND}')
+            _backend = BACKENDS[THROTTLE_BACKEND]()
+        return _backend
+
+class WriteThrottle:
+    """
+    Лимит записей одного вида (scope): отдельные корзины на пользователя и на IP.
+    rate - токенов в секунду, burst - сколько записей подряд разрешено после паузы
+    """
+
+    def __init__(self, scope: str, user_rate: float, user_burst: float, ip_rate: float, ip_burst: float):
+        env_prefix = f'THROTTLE_{scope.upper()}'
+        self.scope = scope
+        self.user_rate = float(os.environ.get(f'{env_prefix}_USER_RATE', user_rate))
+        self.user_burst = float(os.environ.get(f'{env_prefix}_USER_BURST', user_burst))
+        self.ip_rate = float(os.environ.get(f'{env_prefix}_IP_RATE', ip_rate))
+        self.ip_burst = float(os.environ.get(f'{env_prefix}_IP_BURST', ip_burst))
+
+    def check(self, user_id: Optional[str], ip: Optional[str], conn=None) -> Optional[int]:
+        """Секунды до следующей разрешенной записи для Retry-After или None, если запись разрешена"""
+        backend = get_backend()
+        buckets: List[Tuple[str, float, float]] = []
+        if user_id:
+            buckets.append((f'{self.scope}:user:{user_id}', self.user_rate, self.user_burst))
+        if ip:
+            buckets.append((f'{self.scope}:ip:{ip}', self.ip_rate, self.ip_burst))
+
+        # Отклоненная запись не тратит токены: уже списанные из других корзин возвращаются,
+        # иначе отказ по IP съедал бы лимит пользователя
+        taken: List[Tuple[str, float, float]] = []
+        for bucket, rate, burst in buckets:
+            retry_after = backend.take(bucket, rate, burst, conn)
+            if retry_after is not None:
+                for taken_bucket, taken_rate, taken_burst in taken:
+                    backend.refund(taken_bucket, taken_rate, taken_burst, conn)
+                return max(1, math.ceil(retry_after))
+            taken.append((bucket, rate, burst))
+        return None
+
+class ConcurrencyLimiter:
+    """
+    Предел одновременных запросов с подключением к БД на инстанс.
+    Запрос сверх предела сразу получает 503, а не ждет в очереди за подключением
+    """
+
+    def __init__(self, limit: int = MAX_INFLIGHT):
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def acquire(self) -> bool:
+        return self._semaphore.acquire(blocking=False)
+
+    def release(self):
+        self._semaphore.release()
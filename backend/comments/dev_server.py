@@ -0,0 +1,141 @@
+'''
+Business: Локальный dev-сервер функции comments с настоящим SSE-потоком живых комментариев
+Args: DATABASE_URL - БД разработки, параметры командной строки (host, port)
+Returns: HTTP-сервер: любые запросы идут в index.handler, GET /stream отдает text/event-stream
+
+Пример:
+    DATABASE_URL=postgres://localhost/dev python dev_server.py --port 8080
+    curl -N 'http://localhost:8080/stream?manhwa_id=1&chapter_id=3'
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any
+from urllib.parse import urlsplit, parse_qsl
+
+from index import handler
+from live import get_hub
+
+HEARTBEAT_INTERVAL = 15.0
+
+class DevRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _event(self, method: str) -> Dict[str, Any]:
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        return {
+            'httpMethod': method,
+            'headers': {key: value for key, value in self.headers.items()},
+            'queryStringParameters': dict(parse_qsl(url.query)),
+            'body': body
+        }
+
+    def _proxy(self, method: str):
+        response = handler(self._event(method), None)
+        body = response.get('body', '')
+        raw = body.encode('utf-8') if isinstance(body, str) else body
+
+        self.send_response(response.get('statusCode', 200))
+        for key, value in (response.get('headers') or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _stream(self):
+        params = dict(parse_qsl(urlsplit(self.path).query))
+        try:
+            thread_key = (int(params['manhwa_id']), int(params.get('chapter_id') or 0))
+        except (KeyError, ValueError):
+            self.send_error(400, 'manhwa_id required')
+            return
+
+        hub = get_hub(os.environ['DATABASE_URL'])
+        stream_id, since = hub.position()
+
+        # Last-Event-ID в формате "<stream>:<seq>" - браузер пришлет его сам при переподключении
+        last_event_id = self.headers.get('Last-Event-ID')
+        if last_event_id and ':' in last_event_id:
+            stream_id, _, seq = last_event_id.partition(':')
+            since = int(seq) if seq.isdigit() else 0
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        try:
+            self._send('ready', f'{hub.stream_id}:{since}', {'stream': hub.stream_id, 'last_seq': since})
+            while True:
+                result = hub.wait_for(thread_key, stream_id, since, HEARTBEAT_INTERVAL)
+                stream_id, since = result['stream'], result['last_seq']
+
+                if result['reset']:
+                    self._send('reset', f'{stream_id}:{since}', {'stream': stream_id, 'last_seq': since})
+                elif result['events']:
+                    for event in result['events']:
+                        self._send(event['type'], f"{stream_id}:{event['seq']}", event)
+                else:
+                    self.wfile.write(b': heartbeat\n\n')
+                    self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def _send(self, event_type: str, event_id: str, data: Dict[str, Any]):
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+        self.wfile.write(f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'.encode('utf-8'))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if urlsplit(self.path).path.rstrip('/') == '/stream':
+            self._stream()
+        else:
+            self._proxy('GET')
+
+    def do_POST(self):
+        self._proxy('POST')
+
+    def do_PUT(self):
+        self._proxy('PUT')
+
+    def do_DELETE(self):
+        self._proxy('DELETE')
+
+    def do_OPTIONS(self):
+        self._proxy('OPTIONS')
+
+    def log_message(self, format: str, *args):
+        print(f'{time.strftime("%H:%M:%S")} {self.address_string()} {format % args}', file=sys.stderr)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Local dev server for the comments function')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        print('DATABASE_URL not found', file=sys.stderr)
+        return 2
+
+    server = ThreadingHTTPServer((args.host, args.port), DevRequestHandler)
+    server.daemon_threads = True
+    print(f'comments dev server on http://{args.host}:{args.port}', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
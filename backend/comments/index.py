@@ -5,12 +5,21 @@ Args: event - dict с httpMethod, body, queryStringParameters
 Returns: HTTP response dict с комментариями или результатом операции
 """
 
+import base64
 import json
+import math
 import os
-from typing import Dict, Any, List, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable
+from datetime import datetime
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from live import get_hub, notify_comment_event
+from throttle import WriteThrottle, ConcurrencyLimiter, client_ip
+
 def get_db_connection():
     """Создает подключение к БД"""
     dsn = os.environ.get('DATABASE_URL')
@@ -18,6 +27,140 @@ def get_db_connection():
         raise Exception('DATABASE_URL not found')
     return psycopg2.connect(dsn)
 
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+REPLY_PREVIEW_SIZE = 3
+MAX_LIKES_BATCH = 100
+STREAM_TIMEOUT = 25.0
+
+# Не больше 6 комментариев в минуту с пользователя (до 5 подряд) и втрое больше с одного IP
+comment_throttle = WriteThrottle('comments', user_rate=0.1, user_burst=5, ip_rate=0.3, ip_burst=15)
+inflight = ConcurrencyLimiter()
+
+# Кэш страниц веток: TTL только страхует память, актуальность обеспечивает версия ветки
+CACHE_MAX_ENTRIES = int(os.environ.get('COMMENTS_CACHE_SIZE', '1000'))
+CACHE_TTL = float(os.environ.get('COMMENTS_CACHE_TTL', '300'))
+CACHE_FILL_TIMEOUT = 5.0
+
+# Сглаживание рейтинга манхвы к априорному среднему; при весе 0 рейтинг - обычное среднее оценок
+RATING_PRIOR_MEAN = float(os.environ.get('RATING_PRIOR_MEAN', '7.0'))
+RATING_PRIOR_WEIGHT = float(os.environ.get('RATING_PRIOR_WEIGHT', '0'))
+
+# Ключи keyset-пагинации корневых комментариев для каждого режима сортировки.
+# rating без оценки считается нулем - это то же, что NULLS LAST при оценках 1-10
+SORT_KEYS = {
+    'new': ['c.created_at', 'c.id'],
+    'popular': ['c.likes', 'c.created_at', 'c.id'],
+    'rating': ['COALESCE(c.rating, 0)', 'c.created_at', 'c.id']
+}
+
+# Типы значений курсора для тех же ключей: курсор приходит от клиента и проверяется до запроса
+SORT_KEY_TYPES = {
+    'new': ['timestamp', 'id'],
+    'popular': ['number', 'timestamp', 'id'],
+    'rating': ['number', 'timestamp', 'id']
+}
+
+def build_roots_query(sort_keys: List[str], with_cursor: bool) -> str:
+    """Страница корневых комментариев ветки; каждому режиму сортировки соответствует свой индекс (V0009)"""
+    keyset_filter = ''
+    if with_cursor:
+        # Все ключи сортировки убывающие, поэтому продолжение страницы - сравнение кортежей
+        keyset_filter = f"AND ({', '.join(sort_keys)}) < ({', '.join(['%s'] * len(sort_keys))})"
+    
+    sort_columns = ', '.join(f'{key} AS sort_key_{idx}' for idx, key in enumerate(sort_keys))
+    order = ', '.join(f'{key} DESC' for key in sort_keys)
+    
+    return f"""
+        SELECT c.*,
+               {sort_columns},
+               c.likes as like_count
+        FROM comments c
+        WHERE c.manhwa_id = %s
+          AND COALESCE(c.chapter_id, 0) = %s
+          AND c.reply_to IS NULL
+          {keyset_filter}
+        ORDER BY {order}
+        LIMIT %s
+    """
+
+def build_replies_query(with_cursor: bool) -> str:
+    """Страница ответов на комментарий от старых к новым"""
+    keyset_filter = 'AND (c.created_at, c.id) > (%s, %s)' if with_cursor else ''
+    
+    return f"""
+        SELECT c.*,
+               c.likes as like_count
+        FROM comments c
+        WHERE c.reply_to = %s
+          {keyset_filter}
+        ORDER BY c.created_at ASC, c.id ASC
+        LIMIT %s
+    """
+
+# Переносит изменение оценок комментариев в агрегат манхвы (rating_sum/rating_count и рейтинг).
+# Подставляется в WITH после CTE rating_change(manhwa_id, old_rating, new_rating)
+RATING_AGGREGATE_CTE = """
+    rating_delta AS (
+        SELECT manhwa_id,
+               SUM(COALESCE(new_rating, 0) - COALESCE(old_rating, 0)) AS sum_delta,
+               SUM((new_rating IS NOT NULL)::int - (old_rating IS NOT NULL)::int) AS count_delta
+        FROM rating_change
+        WHERE old_rating IS DISTINCT FROM new_rating
+        GROUP BY manhwa_id
+    ), manhwa_rating AS (
+        UPDATE manhwa m
+        SET rating_sum = m.rating_sum + d.sum_delta,
+            rating_count = m.rating_count + d.count_delta,
+            rating = COALESCE(
+                manhwa_rating_score(m.rating_sum + d.sum_delta, m.rating_count + d.count_delta,
+                                    %(prior_mean)s, %(prior_weight)s),
+                m.base_rating,
+                0
+            )
+        FROM rating_delta d
+        WHERE m.id = d.manhwa_id
+    )
+"""
+
+# Увеличивает версию веток, затронутых изменением; source - CTE со столбцами manhwa_id, chapter_id
+THREAD_VERSION_SQL = """
+    UPDATE comment_threads t
+    SET version = t.version + 1
+    FROM (SELECT DISTINCT manhwa_id, COALESCE(chapter_id, 0) AS chapter_key FROM {source}) changed
+    WHERE t.manhwa_id = changed.manhwa_id AND t.chapter_key = changed.chapter_key
+"""
+
+def rating_params() -> Dict[str, float]:
+    return {'prior_mean': RATING_PRIOR_MEAN, 'prior_weight': RATING_PRIOR_WEIGHT}
+
+def comment_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка комментария без служебных столбцов RETURNING"""
+    return {k: v for k, v in row.items() if k not in ('old_rating', 'new_rating')}
+
+def parse_rating(value) -> Optional[int]:
+    """Оценка 1-10 или None; ValueError для некорректного значения"""
+    if value is None:
+        return None
+    rating = int(value)
+    if rating < 1 or rating > 10:
+        raise ValueError('rating must be between 1 and 10')
+    return rating
+
+# Первые ответы для всех комментариев страницы одним запросом
+REPLY_PREVIEW_QUERY = """
+    SELECT r.*
+    FROM unnest(%s::int[]) AS p(id)
+    CROSS JOIN LATERAL (
+        SELECT c.*,
+               c.likes as like_count
+        FROM comments c
+        WHERE c.reply_to = p.id
+        ORDER BY c.created_at ASC, c.id ASC
+        LIMIT %s
+    ) r
+"""
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -26,18 +169,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type, X-User-Id'
+        'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+        'Access-Control-Expose-Headers': 'Retry-After'
     }
     
     if method == 'OPTIONS':
         return {'statusCode': 200, 'headers': headers, 'body': ''}
     
+    params = event.get('queryStringParameters', {}) or {}
+    
+    # Long-poll не держит подключение к БД, пока ждет событий
+    if method == 'GET' and params.get('resource') == 'stream':
+        try:
+            return stream_comments(event, headers)
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)})
+            }
+    
+    if not inflight.acquire():
+        return {
+            'statusCode': 503,
+            'headers': {**headers, 'Retry-After': '1'},
+            'body': json.dumps({'error': 'Service overloaded, retry later'})
+        }
+    
     try:
         conn = get_db_connection()
         
         if method == 'GET':
+            if params.get('resource') == 'replies':
+                return get_replies(event, conn, headers)
             return get_comments(event, conn, headers)
         elif method == 'POST':
+            if params.get('resource') == 'likes':
+                return toggle_likes(event, conn, headers)
             return create_comment(event, conn, headers)
         elif method == 'PUT':
             return update_comment(event, conn, headers)
@@ -58,13 +226,101 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     finally:
         if 'conn' in locals():
             conn.close()
+        inflight.release()
+
+class ThreadCache:
+    """
+    Кэш сериализованных страниц веток в памяти инстанса функции.
+    Версия ветки входит в ключ, поэтому после записи старые страницы просто перестают запрашиваться,
+    а одновременные промахи по одному ключу ждут единственного заполнения (single-flight)
+    """
+    
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[tuple, tuple]' = OrderedDict()
+        self._inflight: Dict[tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+    
+    def get_or_fill(self, key: tuple, fill: Callable[[], str]) -> str:
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                
+                event = self._inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = threading.Event()
+                    self._inflight[key] = event
+            
+            if not leader:
+                # Если заполняющий упал, следующий круг цикла сделает заполняющим этот запрос
+                event.wait(CACHE_FILL_TIMEOUT)
+                continue
+            
+            try:
+                value = fill()
+                with self._lock:
+                    self._entries[key] = (time.monotonic() + self.ttl, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                return value
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                event.set()
+
+thread_cache = ThreadCache(CACHE_MAX_ENTRIES, CACHE_TTL)
+
+def encode_cursor(values: List[Any]) -> str:
+    """Курсор keyset-пагинации: значения ключа сортировки последней строки страницы"""
+    raw = json.dumps(values, default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def cursor_value(value: Any, kind: Optional[str]) -> Any:
+    """Значение курсора ожидаемого типа (number, timestamp, id, text; None - без проверки); ValueError - курсор испорчен"""
+    if kind is None:
+        return value
+    if kind in ('timestamp', 'text'):
+        if not isinstance(value, str):
+            raise ValueError(f'{kind} expected')
+        return datetime.fromisoformat(value) if kind == 'timestamp' else value
+    expected = int if kind == 'id' else (int, float)
+    if isinstance(value, bool) or not isinstance(value, expected) or not math.isfinite(value):
+        raise ValueError(f'{kind} expected')
+    return value
+
+def decode_cursor(cursor: str, kinds: List[Optional[str]]) -> Optional[List[Any]]:
+    """Значения курсора по типам ключей сортировки или None, если курсор некорректен"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(kinds):
+            return None
+        return [cursor_value(value, kind) for value, kind in zip(values, kinds)]
+    except (ValueError, TypeError):
+        return None
+        return [cursor_value(value, kind) for value, kind in zip(values, kinds)]
+    except (ValueError, TypeError):
+        return None
+
+def parse_limit(params: Dict[str, Any], default: int) -> int:
+    try:
+        limit = int(params.get('limit', default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
 
 def get_comments(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]:
-    """Получение комментариев"""
+    """Получение страницы корневых комментариев с превью ответов"""
     params = event.get('queryStringParameters', {}) or {}
     manhwa_id = params.get('manhwa_id')
     chapter_id = params.get('chapter_id')
     sort_by = params.get('sort', 'new')
+    limit = parse_limit(params, PAGE_SIZE)
     
     if not manhwa_id:
         return {
@@ -73,75 +329,186 @@ def get_comments(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]:
             'body': json.dumps({'error': 'manhwa_id required'})
         }
     
+    if sort_by not in SORT_KEYS:
+        sort_by = 'new'
+    sort_keys = SORT_KEYS[sort_by]
+    
+    after = None
+    if params.get('cursor'):
+        after = decode_cursor(params['cursor'], SORT_KEY_TYPES[sort_by])
+        if after is None:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'invalid cursor'})
+            }
+    
+    try:
+        # Комментарии к самой манхве хранятся с chapter_id NULL, ключ ветки для них 0
+        manhwa_id = int(manhwa_id)
+        chapter_key = int(chapter_id) if chapter_id else 0
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'manhwa_id and chapter_id must be integers'})
+        }
+    
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
-    # Определяем сортировку
-    if sort_by == 'popular':
-        order = 'ORDER BY c.likes DESC, c.created_at DESC'
-    elif sort_by == 'rating':
-        order = 'ORDER BY c.rating DESC NULLS LAST, c.created_at DESC'
-    else:  # new
-        order = 'ORDER BY c.created_at DESC'
-    
-    # Основной запрос
-    if chapter_id:
-        query = f"""
-            SELECT c.*, 
-                   COUNT(cl.id) as like_count
-            FROM comments c
-            LEFT JOIN comment_likes cl ON c.id = cl.comment_id
-            WHERE c.manhwa_id = {manhwa_id} 
-              AND c.chapter_id = {chapter_id}
-              AND c.reply_to IS NULL
-            GROUP BY c.id
-            {order}
-        """
-    else:
-        query = f"""
-            SELECT c.*,
-                   COUNT(cl.id) as like_count
-            FROM comments c
-            LEFT JOIN comment_likes cl ON c.id = cl.comment_id
-            WHERE c.manhwa_id = {manhwa_id}
-              AND c.chapter_id IS NULL
-              AND c.reply_to IS NULL
-            GROUP BY c.id
-            {order}
-        """
-    
-    cursor.execute(query)
-    comments = cursor.fetchall()
-    
-    # Получаем ответы для каждого комментария
-    result = []
-    for comment in comments:
-        comment_dict = dict(comment)
+    # Счетчик ветки дает и total, и версию для ключа кэша: любая запись в ветку ее увеличивает
+    cursor.execute("""
+        SELECT root_count, version FROM comment_threads
+        WHERE manhwa_id = %s AND chapter_key = %s
+    """, (manhwa_id, chapter_key))
+    thread = cursor.fetchone() or {'root_count': 0, 'version': 0}
+    
+    cache_key = (manhwa_id, chapter_key, thread['version'], sort_by, params.get('cursor') or '', limit)
+    
+    def load_page() -> str:
+        query_params: List[Any] = [manhwa_id, chapter_key]
+        if after:
+            query_params.extend(after)
         
-        # Получаем ответы
-        cursor.execute(f"""
-            SELECT c.*,
-                   COUNT(cl.id) as like_count
-            FROM comments c
-            LEFT JOIN comment_likes cl ON c.id = cl.comment_id
-            WHERE c.reply_to = {comment['id']}
-            GROUP BY c.id
-            ORDER BY c.created_at ASC
-        """)
-        replies = cursor.fetchall()
-        comment_dict['replies'] = [dict(r) for r in replies]
-        comment_dict['likes'] = comment_dict.get('like_count', 0)
+        cursor.execute(build_roots_query(sort_keys, bool(after)), query_params + [limit + 1])
+        comments = cursor.fetchall()
+        
+        next_cursor = None
+        if len(comments) > limit:
+            comments = comments[:limit]
+            last = comments[-1]
+            next_cursor = encode_cursor([last[f'sort_key_{idx}'] for idx in range(len(sort_keys))])
+        
+        # Превью первых ответов для всех комментариев страницы одним запросом
+        replies_by_parent: Dict[int, List[Dict]] = {comment['id']: [] for comment in comments}
+        
+        if replies_by_parent:
+            cursor.execute(REPLY_PREVIEW_QUERY, (list(replies_by_parent), REPLY_PREVIEW_SIZE))
+            
+            for reply in cursor.fetchall():
+                replies_by_parent[reply['reply_to']].append(dict(reply))
         
-        result.append(comment_dict)
+        result = []
+        for comment in comments:
+            comment_dict = {k: v for k, v in comment.items() if not k.startswith('sort_key_')}
+            comment_dict['replies'] = replies_by_parent[comment['id']]
+            result.append(comment_dict)
+        
+        return json.dumps({
+            'comments': result,
+            'total': thread['root_count'],
+            'next_cursor': next_cursor
+        }, default=str)
+    
+    try:
+        body = thread_cache.get_or_fill(cache_key, load_page)
+    finally:
+        cursor.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': body
+    }
+
+def stream_comments(event: Dict[str, Any], headers: Dict) -> Dict[str, Any]:
+    """
+    Long-poll дельт ветки: created/updated/deleted после позиции (stream, since).
+    Клиент сначала берет позицию (запрос без since), затем читает ветку целиком
+    и дальше применяет дельты; reset=true означает, что ветку нужно перечитать
+    """
+    params = event.get('queryStringParameters', {}) or {}
+    manhwa_id = params.get('manhwa_id')
+    
+    if not manhwa_id:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'manhwa_id required'})
+        }
+    
+    try:
+        thread_key = (int(manhwa_id), int(params.get('chapter_id') or 0))
+        since = int(params['since']) if params.get('since') else None
+        timeout = min(float(params.get('timeout', STREAM_TIMEOUT)), STREAM_TIMEOUT)
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'manhwa_id, chapter_id, since and timeout must be numbers'})
+        }
+    
+    hub = get_hub(os.environ['DATABASE_URL'])
     
+    if since is None:
+        stream_id, last_seq = hub.position()
+        result = {'stream': stream_id, 'last_seq': last_seq, 'reset': False, 'events': []}
+    else:
+        result = hub.wait_for(thread_key, params.get('stream'), since, max(timeout, 0))
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps(result, default=str)
+    }
+
+def get_replies(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]:
+    """Постраничная загрузка ответов на один комментарий (от старых к новым)"""
+    params = event.get('queryStringParameters', {}) or {}
+    comment_id = params.get('comment_id')
+    limit = parse_limit(params, PAGE_SIZE)
+    
+    if not comment_id:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'comment_id required'})
+        }
+    
+    after = None
+    if params.get('cursor'):
+        after = decode_cursor(params['cursor'], ['timestamp', 'id'])
+        if after is None:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'invalid cursor'})
+            }
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cursor.execute("SELECT reply_count FROM comments WHERE id = %s", (comment_id,))
+    parent = cursor.fetchone()
+    
+    if not parent:
+        cursor.close()
+        return {
+            'statusCode': 404,
+            'headers': headers,
+            'body': json.dumps({'error': 'Comment not found'})
+        }
+    
+    query_params: List[Any] = [comment_id]
+    if after:
+        query_params.extend(after)
+    
+    cursor.execute(build_replies_query(bool(after)), query_params + [limit + 1])
+    replies = [dict(r) for r in cursor.fetchall()]
     cursor.close()
     
+    next_cursor = None
+    if len(replies) > limit:
+        replies = replies[:limit]
+        next_cursor = encode_cursor([replies[-1]['created_at'], replies[-1]['id']])
+    
     return {
         'statusCode': 200,
         'headers': headers,
         'body': json.dumps({
-            'comments': result,
-            'total': len(result)
-        })
+            'replies': replies,
+            'total': parent['reply_count'],
+            'next_cursor': next_cursor
+        }, default=str)
     }
 
 def create_comment(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]:
@@ -157,7 +524,8 @@ def create_comment(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]
         }
     
     manhwa_id = body.get('manhwa_id')
-    text = body.get('text', '').strip()
+    text = body.get('text')
+    text = text.strip() if isinstance(text, str) else ''
     
     if not manhwa_id or not text:
         return {
@@ -166,27 +534,69 @@ def create_comment(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]
             'body': json.dumps({'error': 'manhwa_id and text required'})
         }
     
+    try:
+        rating = parse_rating(body.get('rating'))
+    except (TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'rating must be between 1 and 10'})
+        }
+    
+    # Токен тратит только запрос, который дойдет до записи: некорректные отклонены выше
+    retry_after = comment_throttle.check(user_id, client_ip(event), conn)
+    if retry_after:
+        return {
+            'statusCode': 429,
+            'headers': {**headers, 'Retry-After': str(retry_after)},
+            'body': json.dumps({'error': 'Too many comments, retry later', 'retry_after': retry_after})
+        }
+    
     chapter_id = body.get('chapter_id')
-    rating = body.get('rating')
     is_spoiler = body.get('is_spoiler', False)
     reply_to = body.get('reply_to')
     username = body.get('username', f'User_{user_id[:8]}')
     
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
-    # Вставка комментария
-    query = """
-        INSERT INTO comments 
-        (manhwa_id, chapter_id, user_id, username, text, rating, is_spoiler, reply_to)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        RETURNING *
+    # Вставка комментария, счетчики ветки и агрегат оценок манхвы - одним запросом
+    query = f"""
+        WITH new_comment AS (
+            INSERT INTO comments 
+            (manhwa_id, chapter_id, user_id, username, text, rating, is_spoiler, reply_to)
+            VALUES (%(manhwa_id)s, %(chapter_id)s, %(user_id)s, %(username)s, %(text)s,
+                    %(rating)s, %(is_spoiler)s, %(reply_to)s)
+            RETURNING *
+        ), parent AS (
+            UPDATE comments SET reply_count = reply_count + 1
+            WHERE id = (SELECT reply_to FROM new_comment)
+        ), thread AS (
+            INSERT INTO comment_threads (manhwa_id, chapter_key, root_count, version)
+            SELECT manhwa_id, COALESCE(chapter_id, 0), (reply_to IS NULL)::int, 1
+            FROM new_comment
+            ON CONFLICT (manhwa_id, chapter_key)
+            DO UPDATE SET root_count = comment_threads.root_count + EXCLUDED.root_count,
+                          version = comment_threads.version + 1
+        ), rating_change AS (
+            SELECT manhwa_id, NULL::int AS old_rating, rating AS new_rating FROM new_comment
+        ), {RATING_AGGREGATE_CTE}
+        SELECT * FROM new_comment
     """
     
-    cursor.execute(query, (
-        manhwa_id, chapter_id, user_id, username, text, rating, is_spoiler, reply_to
-    ))
+    cursor.execute(query, {
+        'manhwa_id': manhwa_id,
+        'chapter_id': chapter_id,
+        'user_id': user_id,
+        'username': username,
+        'text': text,
+        'rating': rating,
+        'is_spoiler': is_spoiler,
+        'reply_to': reply_to,
+        **rating_params()
+    })
     
     comment = dict(cursor.fetchone())
+    notify_comment_event(cursor, 'created', comment)
     conn.commit()
     cursor.close()
     
@@ -196,7 +606,7 @@ def create_comment(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]
         'body': json.dumps({
             'comment': comment,
             'message': 'Comment created'
-        })
+        }, default=str)
     }
 
 def update_comment(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]:
@@ -213,22 +623,61 @@ def update_comment(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]
     
     body = json.loads(event.get('body', '{}'))
     text = body.get('text', '').strip()
+    set_rating = 'rating' in body
     
-    if not text:
+    if not text and not set_rating:
         return {
             'statusCode': 400,
             'headers': headers,
             'body': json.dumps({'error': 'text required'})
         }
     
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE comments SET text = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
-        (text, comment_id)
-    )
+    try:
+        rating = parse_rating(body.get('rating'))
+    except (TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'rating must be between 1 and 10'})
+        }
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    # Старая оценка берется из подзапроса с блокировкой строки, чтобы пересчитать агрегат по разнице
+    cursor.execute(f"""
+        WITH updated AS (
+            UPDATE comments c
+            SET text = COALESCE(%(text)s, c.text),
+                rating = CASE WHEN %(set_rating)s THEN %(rating)s ELSE c.rating END,
+                updated_at = CURRENT_TIMESTAMP
+            FROM (SELECT id, rating FROM comments WHERE id = %(id)s FOR UPDATE) old
+            WHERE c.id = old.id
+            RETURNING c.*, old.rating AS old_rating, c.rating AS new_rating
+        ), thread AS (
+            {THREAD_VERSION_SQL.format(source='updated')}
+        ), rating_change AS (
+            SELECT manhwa_id, old_rating, new_rating FROM updated
+        ), {RATING_AGGREGATE_CTE}
+        SELECT * FROM updated
+    """, {
+        'id': comment_id,
+        'text': text or None,
+        'set_rating': set_rating,
+        'rating': rating,
+        **rating_params()
+    })
+    updated = cursor.fetchone()
+    if updated:
+        notify_comment_event(cursor, 'updated', comment_row(updated))
     conn.commit()
     cursor.close()
     
+    if not updated:
+        return {
+            'statusCode': 404,
+            'headers': headers,
+            'body': json.dumps({'error': 'Comment not found'})
+        }
+    
     return {
         'statusCode': 200,
         'headers': headers,
@@ -247,12 +696,25 @@ def delete_comment(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]
             'body': json.dumps({'error': 'comment id required'})
         }
     
-    cursor = conn.cursor()
-    # Мягкое удаление - заменяем текст
-    cursor.execute(
-        "UPDATE comments SET text = '[удалено]', updated_at = CURRENT_TIMESTAMP WHERE id = %s",
-        (comment_id,)
-    )
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    # Мягкое удаление - заменяем текст; оценка удаленного комментария уходит из рейтинга манхвы
+    cursor.execute(f"""
+        WITH deleted AS (
+            UPDATE comments c
+            SET text = '[удалено]', rating = NULL, updated_at = CURRENT_TIMESTAMP
+            FROM (SELECT id, rating FROM comments WHERE id = %(id)s FOR UPDATE) old
+            WHERE c.id = old.id
+            RETURNING c.*, old.rating AS old_rating, c.rating AS new_rating
+        ), thread AS (
+            {THREAD_VERSION_SQL.format(source='deleted')}
+        ), rating_change AS (
+            SELECT manhwa_id, old_rating, new_rating FROM deleted
+        ), {RATING_AGGREGATE_CTE}
+        SELECT * FROM deleted
+    """, {'id': comment_id, **rating_params()})
+    deleted = cursor.fetchone()
+    if deleted:
+        notify_comment_event(cursor, 'deleted', comment_row(deleted))
     conn.commit()
     cursor.close()
     
@@ -261,3 +723,106 @@ def delete_comment(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]
         'headers': headers,
         'body': json.dumps({'message': 'Comment deleted'})
     }
+
+def toggle_likes(event: Dict[str, Any], conn, headers: Dict) -> Dict[str, Any]:
+    """Лайк/снятие лайка пачкой: comment_likes и comments.likes меняются одним запросом"""
+    body = json.loads(event.get('body', '{}'))
+    request_headers = event.get('headers', {}) or {}
+    user_id = request_headers.get('X-User-Id') or request_headers.get('x-user-id')
+    
+    if not user_id:
+        return {
+            'statusCode': 401,
+            'headers': headers,
+            'body': json.dumps({'error': 'User ID required'})
+        }
+    
+    toggles = body.get('likes')
+    if toggles is None and body.get('comment_id'):
+        toggles = [{'comment_id': body['comment_id'], 'liked': body.get('liked', True)}]
+    
+    if not isinstance(toggles, list) or not toggles:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'likes list required'})
+        }
+    
+    if len(toggles) > MAX_LIKES_BATCH:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': f'Too many likes in one request (max {MAX_LIKES_BATCH})'})
+        }
+    
+    # Для одного комментария в пачке побеждает последнее переключение
+    state: Dict[int, bool] = {}
+    try:
+        for toggle in toggles:
+            state[int(toggle['comment_id'])] = bool(toggle.get('liked', True))
+    except (KeyError, TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'each like needs comment_id'})
+        }
+    
+    like_ids = [comment_id for comment_id, liked in state.items() if liked]
+    unlike_ids = [comment_id for comment_id, liked in state.items() if not liked]
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    # ON CONFLICT и RETURNING отдают только реально изменившиеся строки,
+    # поэтому повторный лайк или снятие несуществующего не сдвигают счетчик
+    cursor.execute(f"""
+        WITH liked AS (
+            INSERT INTO comment_likes (comment_id, user_id)
+            SELECT c.id, %(user_id)s
+            FROM comments c
+            WHERE c.id = ANY(%(like_ids)s::int[])
+            ON CONFLICT (comment_id, user_id) DO NOTHING
+            RETURNING comment_id
+        ), unliked AS (
+            DELETE FROM comment_likes
+            WHERE user_id = %(user_id)s AND comment_id = ANY(%(unlike_ids)s::int[])
+            RETURNING comment_id
+        ), delta AS (
+            SELECT comment_id, SUM(change) AS change
+            FROM (
+                SELECT comment_id, 1 AS change FROM liked
+                UNION ALL
+                SELECT comment_id, -1 AS change FROM unliked
+            ) changes
+            GROUP BY comment_id
+        ), updated AS (
+            UPDATE comments c
+            SET likes = c.likes + delta.change
+            FROM delta
+            WHERE c.id = delta.comment_id
+            RETURNING c.id, c.manhwa_id, c.chapter_id, c.likes
+        ), thread AS (
+            {THREAD_VERSION_SQL.format(source='updated')}
+        )
+        SELECT c.id, COALESCE(u.likes, c.likes) AS likes
+        FROM comments c
+        LEFT JOIN updated u ON u.id = c.id
+        WHERE c.id = ANY(%(all_ids)s::int[])
+    """, {
+        'user_id': user_id,
+        'like_ids': like_ids,
+        'unlike_ids': unlike_ids,
+        'all_ids': list(state)
+    })
+    rows = cursor.fetchall()
+    conn.commit()
+    cursor.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'likes': [
+                {'comment_id': row['id'], 'likes': row['likes'], 'liked': state[row['id']]}
+                for row in rows
+            ]
+        })
+    }
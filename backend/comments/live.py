@@ -0,0 +1,163 @@
+"""
+Business: Живая лента изменений комментариев - LISTEN/NOTIFY и раздача дельт подписчикам внутри инстанса
+Args: dsn - строка подключения к БД, канал NOTIFY заполняется из create/update/delete в index.py
+Returns: CommentHub с ожиданием событий ветки (long-poll) для любого числа подписчиков
+"""
+
+import json
+import select
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+CHANNEL = 'comment_events'
+
+# Лимит NOTIFY - 8000 байт; длинные комментарии отправляются без тела и дочитываются слушателем
+MAX_PAYLOAD_BYTES = 7500
+
+def notify_comment_event(cursor, event_type: str, comment: Dict[str, Any]):
+    """Ставит событие в очередь NOTIFY; доставляется подписчикам только после COMMIT транзакции"""
+    payload = {
+        'type': event_type,
+        'comment_id': comment['id'],
+        'manhwa_id': comment['manhwa_id'],
+        'chapter_key': comment.get('chapter_id') or 0,
+        'comment': comment
+    }
+    raw = json.dumps(payload, default=str)
+    if len(raw.encode('utf-8')) > MAX_PAYLOAD_BYTES:
+        payload['comment'] = None
+        raw = json.dumps(payload, default=str)
+    cursor.execute('SELECT pg_notify(%s, %s)', (CHANNEL, raw))
+
+class CommentHub:
+    """
+    Одно LISTEN-подключение на инстанс и кольцевой буфер последних событий.
+    Подписчики не держат своих очередей: каждый ждет на общем Condition и читает буфер
+    начиная со своего seq, поэтому число подписчиков не влияет на стоимость доставки
+    """
+
+    def __init__(self, dsn: str, buffer_size: int = 2000):
+        self.dsn = dsn
+        self.stream_id = uuid.uuid4().hex
+        self._events: deque = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        with self._condition:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._listen_forever, name='comment-hub', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    def _listen_forever(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception:
+                # Любой сбой слушателя (БД или ошибка в коде) - события за время переподключения потеряны,
+                # новый stream_id заставит клиентов перечитать ветку
+                with self._condition:
+                    self.stream_id = uuid.uuid4().hex
+                    self._events.clear()
+                    self._condition.notify_all()
+                self._stopped.wait(1.0)
+
+    def _listen(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(f'LISTEN {CHANNEL}')
+
+            while not self._stopped.is_set():
+                if select.select([conn], [], [], 5.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    self._dispatch(cursor, notification.payload)
+        finally:
+            conn.close()
+
+    def _dispatch(self, cursor, raw: str):
+        # Испорченное событие пропускается, не прерывая ленту; ошибки БД уходят в переподключение
+        try:
+            event = json.loads(raw)
+            if not isinstance(event, dict):
+                return
+            int(event['manhwa_id'])
+            int(event.get('chapter_key') or 0)
+            comment_id = int(event['comment_id'])
+        except (ValueError, KeyError, TypeError):
+            return
+
+        if event.get('comment') is None and event.get('type') != 'deleted':
+            cursor.execute('SELECT * FROM comments WHERE id = %s', (comment_id,))
+            row = cursor.fetchone()
+            event['comment'] = json.loads(json.dumps(dict(row), default=str)) if row else None
+
+        self.publish(event)
+
+    def publish(self, event: Dict[str, Any]):
+        thread_key = (int(event['manhwa_id']), int(event.get('chapter_key') or 0))
+        with self._condition:
+            self._seq += 1
+            event = dict(event, seq=self._seq)
+            self._events.append((self._seq, thread_key, event))
+            self._condition.notify_all()
+
+    def position(self) -> Tuple[str, int]:
+        with self._condition:
+            return self.stream_id, self._seq
+
+    def wait_for(self, thread_key: Tuple[int, int], stream_id: Optional[str], since: int,
+                 timeout: float) -> Dict[str, Any]:
+        """
+        События ветки после since. reset=True значит, что продолжить с since нельзя
+        (другой инстанс, переподключение или буфер уже вытеснил нужные события) - клиент перечитывает ветку
+        """
+        deadline = time.monotonic() + timeout
+
+        with self._condition:
+            while True:
+                if stream_id != self.stream_id or since > self._seq:
+                    return {'stream': self.stream_id, 'last_seq': self._seq, 'reset': True, 'events': []}
+
+                oldest = self._events[0][0] if self._events else self._seq + 1
+                if since + 1 < oldest and since < self._seq:
+                    return {'stream': self.stream_id, 'last_seq': self._seq, 'reset': True, 'events': []}
+
+                events = [event for seq, key, event in self._events if seq > since and key == thread_key]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0 or self._stopped.is_set():
+                    return {'stream': self.stream_id, 'last_seq': self._seq, 'reset': False, 'events': events}
+
+                # Новые события других веток двигают позицию, но не будят клиента без причины
+                since = self._seq
+                self._condition.wait(remaining)
+
+_hub: Optional[CommentHub] = None
+_hub_lock = threading.Lock()
+
+def get_hub(dsn: str) -> CommentHub:
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = CommentHub(dsn)
+        _hub.start()
+        return _hub
@@ -0,0 +1,206 @@
+'''
+Business: Аудит планов запросов листинга комментариев на синтетическом датасете
+Args: DATABASE_URL - тестовая БД (создается и удаляется отдельная схема), параметры командной строки
+Returns: код выхода 1, если какой-то запрос листинга читает таблицу целиком (Seq Scan) или сортирует (Sort)
+
+Пример:
+    DATABASE_URL=postgres://localhost/scratch python plan_audit.py --rows 1000000
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, Any, List, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from index import (
+    SORT_KEYS, PAGE_SIZE, REPLY_PREVIEW_SIZE, REPLY_PREVIEW_QUERY,
+    build_roots_query, build_replies_query
+)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'db_migrations')
+
+# Таблицы и счетчики; индексы листинга (V0009) строятся после заливки данных - так быстрее
+SCHEMA_MIGRATIONS = [
+    'V0005__add_comments_system.sql',
+    'V0007__add_comment_thread_counters.sql',
+    'V0008__maintain_comment_likes.sql',
+    'V0011__add_comment_thread_version.sql'
+]
+INDEX_MIGRATIONS = [
+    'V0009__add_comment_listing_indexes.sql'
+]
+
+FORBIDDEN_NODES = {'Seq Scan', 'Sort', 'Incremental Sort'}
+
+HOT_THREAD = (1, 1)
+MANHWA_THREAD = (7, 0)
+
+def apply_migrations(cursor, names: List[str]):
+    for name in names:
+        with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+            cursor.execute(f.read())
+
+def seed(cursor, rows: int):
+    '''Корневые комментарии (80%) и ответы на них (20%); каждый десятый корень - в одной горячей главе'''
+    roots = rows * 4 // 5
+    replies = rows - roots
+
+    cursor.execute('SELECT setseed(0.42)')
+    cursor.execute('''
+        INSERT INTO comments (manhwa_id, chapter_id, user_id, username, text, rating, likes, created_at)
+        SELECT CASE WHEN g %% 10 = 0 THEN %(hot_manhwa)s ELSE 1 + g %% 500 END,
+               CASE WHEN g %% 10 = 0 THEN %(hot_chapter)s
+                    WHEN g %% 7 = 0 THEN NULL
+                    ELSE 1 + g %% 60 END,
+               'user_' || g %% 50000,
+               'User',
+               'Комментарий ' || g,
+               CASE WHEN g %% 3 = 0 THEN NULL ELSE 1 + g %% 10 END,
+               (random() * 300)::int,
+               now() - random() * interval '365 days'
+        FROM generate_series(1, %(roots)s) g
+    ''', {'roots': roots, 'hot_manhwa': HOT_THREAD[0], 'hot_chapter': HOT_THREAD[1]})
+
+    cursor.execute('''
+        INSERT INTO comments (manhwa_id, chapter_id, user_id, username, text, likes, reply_to, created_at)
+        SELECT r.manhwa_id, r.chapter_id,
+               'user_' || g %% 50000,
+               'User',
+               'Ответ ' || g,
+               (random() * 20)::int,
+               r.id,
+               r.created_at + (g %% 1000) * interval '1 minute'
+        FROM generate_series(1, %(replies)s) g
+        JOIN comments r ON r.id = 1 + (g::bigint * 7919) %% %(roots)s
+    ''', {'replies': replies, 'roots': roots})
+
+    cursor.execute('''
+        UPDATE comments c
+        SET reply_count = r.total
+        FROM (SELECT reply_to, COUNT(*) AS total FROM comments WHERE reply_to IS NOT NULL GROUP BY reply_to) r
+        WHERE c.id = r.reply_to
+    ''')
+    cursor.execute('''
+        INSERT INTO comment_threads (manhwa_id, chapter_key, root_count)
+        SELECT manhwa_id, COALESCE(chapter_id, 0), COUNT(*)
+        FROM comments
+        WHERE reply_to IS NULL
+        GROUP BY manhwa_id, COALESCE(chapter_id, 0)
+    ''')
+
+def plan_nodes(plan: Dict[str, Any]) -> List[str]:
+    nodes = [plan['Node Type']]
+    for child in plan.get('Plans', []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+def explain(cursor, query: str, params, analyze: bool) -> Tuple[List[str], Dict[str, Any]]:
+    options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+    cursor.execute(f'EXPLAIN ({options}) ' + query, params)
+    result = cursor.fetchone()
+    plan = list(result.values())[0][0]
+    return plan_nodes(plan['Plan']), plan
+
+def listing_queries(cursor) -> List[Tuple[str, str, Any]]:
+    '''Все запросы листинга с реальными значениями курсоров из первой страницы'''
+    queries = []
+
+    for sort_by, sort_keys in SORT_KEYS.items():
+        for manhwa_id, chapter_key in (HOT_THREAD, MANHWA_THREAD):
+            name = f'roots sort={sort_by} manhwa={manhwa_id} chapter={chapter_key}'
+            first_page = build_roots_query(sort_keys, False)
+            params = [manhwa_id, chapter_key, PAGE_SIZE + 1]
+            queries.append((name, first_page, params))
+
+            cursor.execute(first_page, params)
+            rows = cursor.fetchall()
+            if not rows:
+                raise RuntimeError(f'empty thread in seeded data: {name}')
+
+            last = rows[-1]
+            after = [last[f'sort_key_{idx}'] for idx in range(len(sort_keys))]
+            queries.append((f'{name} cursor', build_roots_query(sort_keys, True),
+                            [manhwa_id, chapter_key] + after + [PAGE_SIZE + 1]))
+
+            if sort_by == 'new' and (manhwa_id, chapter_key) == HOT_THREAD:
+                root_ids = [row['id'] for row in rows]
+                queries.append(('reply preview', REPLY_PREVIEW_QUERY, (root_ids, REPLY_PREVIEW_SIZE)))
+
+    cursor.execute('SELECT id FROM comments WHERE reply_count > 0 ORDER BY reply_count DESC LIMIT 1')
+    parent_id = cursor.fetchone()['id']
+    cursor.execute(build_replies_query(False), [parent_id, 2])
+    first_reply = cursor.fetchone()
+
+    queries.append(('replies page', build_replies_query(False), [parent_id, PAGE_SIZE + 1]))
+    queries.append(('replies page cursor', build_replies_query(True),
+                    [parent_id, first_reply['created_at'], first_reply['id'], PAGE_SIZE + 1]))
+    queries.append(('thread counter',
+                    'SELECT root_count, version FROM comment_threads WHERE manhwa_id = %s AND chapter_key = %s',
+                    list(HOT_THREAD)))
+
+    return queries
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='EXPLAIN audit of comment listing queries')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--schema', default=f'plan_audit_{os.getpid()}')
+    parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE вместо оценки плана')
+    parser.add_argument('--keep', action='store_true', help='Не удалять схему после аудита')
+    parser.add_argument('--json', action='store_true', help='Вывести планы в JSON')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL not found', file=sys.stderr)
+        return 2
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+    failures = []
+    report = []
+
+    try:
+        cursor.execute(f'CREATE SCHEMA {args.schema}')
+        cursor.execute(f'SET search_path TO {args.schema}')
+
+        started = time.perf_counter()
+        apply_migrations(cursor, SCHEMA_MIGRATIONS)
+        seed(cursor, args.rows)
+        apply_migrations(cursor, INDEX_MIGRATIONS)
+        cursor.execute('ANALYZE comments')
+        cursor.execute('ANALYZE comment_threads')
+        print(f'seeded {args.rows} comments in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+        for name, query, params in listing_queries(cursor):
+            nodes, plan = explain(cursor, query, params, args.analyze)
+            bad = sorted(FORBIDDEN_NODES.intersection(nodes))
+            status = 'FAIL' if bad else 'ok'
+            timing = f" {plan['Execution Time']:.2f}ms" if 'Execution Time' in plan else ''
+            print(f'[{status}] {name}: {" -> ".join(nodes)}{timing}', file=sys.stderr)
+
+            report.append({'query': name, 'nodes': nodes, 'forbidden': bad, 'plan': plan})
+            if bad:
+                failures.append(name)
+    finally:
+        if not args.keep:
+            cursor.execute(f'DROP SCHEMA IF EXISTS {args.schema} CASCADE')
+        cursor.close()
+        conn.close()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+
+    if failures:
+        print(f'{len(failures)} listing queries fall back to Seq Scan/Sort', file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
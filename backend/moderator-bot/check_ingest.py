@@ -0,0 +1,103 @@
+'''
+Business: Проверка импорта глав на локальном источнике fixture_server.py: повторный sync_chapters получает 304,
+          а импорт диапазона или другой манхвы с той же ссылкой не прячет непроимпортированные главы
+Args: DATABASE_URL - тестовая БД с миграциями; параметры командной строки - число глав и страниц
+Returns: код выхода 1, если какая-то проверка не прошла; все изменения в БД откатываются
+
+Пример:
+    DATABASE_URL=postgres://localhost/scratch python check_ingest.py --chapters 30
+'''
+
+import argparse
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+from typing import List
+
+import psycopg2
+
+from fixture_server import FixtureHandler, FixtureState
+from ingest import ingest_chapters
+
+def start_fixture(chapters: int, pages: int) -> ThreadingHTTPServer:
+    FixtureHandler.state = FixtureState(chapters, pages, delay=0.0, throttle_every=0)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Check chapter ingestion against the local fixture source')
+    parser.add_argument('--chapters', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=5)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL required', file=sys.stderr)
+        return 2
+
+    server = start_fixture(args.chapters, args.pages)
+    state = FixtureHandler.state
+    feed_url = f'http://127.0.0.1:{server.server_address[1]}/feed.json'
+    failures: List[str] = []
+
+    def check(condition: bool, message: str):
+        print(f'{"ok  " if condition else "FAIL"} {message}')
+        if not condition:
+            failures.append(message)
+
+    conn = psycopg2.connect(dsn)
+
+    def create_manhwa(title: str) -> int:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO manhwa (title, cover_url) VALUES (%s, '') RETURNING id", (title,))
+        manhwa_id = cursor.fetchone()[0]
+        cursor.close()
+        return manhwa_id
+
+    def numbers(result) -> List[int]:
+        return [c['chapter_number'] for c in result['imported']]
+
+    try:
+        manhwa_id = create_manhwa('ingest check')
+
+        first = ingest_chapters(conn, manhwa_id, feed_url, {'conditional': True})
+        check(len(first['imported']) == args.chapters, f'first sync imports {args.chapters} chapters')
+        check(not first['failed'], 'first sync has no failed chapters')
+
+        second = ingest_chapters(conn, manhwa_id, feed_url, {'conditional': True})
+        check(second['not_modified'] and not second['imported'], 'second sync is not modified')
+        check(state.not_modified == 1, 'second sync got HTTP 304 from the source')
+        check(second['requests'] == 1, 'second sync made a single request')
+
+        state.set_chapters(args.chapters + 3)
+        third = ingest_chapters(conn, manhwa_id, feed_url, {'conditional': True})
+        check(numbers(third) == list(range(args.chapters + 1, args.chapters + 4)),
+              'sync after the feed changed imports only the new chapters')
+        total = args.chapters + 3
+
+        other_id = create_manhwa('ingest check: same source')
+        other = ingest_chapters(conn, other_id, feed_url, {'conditional': True})
+        check(not other['not_modified'] and numbers(other) == list(range(1, total + 1)),
+              'another manhwa with the same source imports all chapters')
+
+        ranged_id = create_manhwa('ingest check: range')
+        ranged = ingest_chapters(conn, ranged_id, feed_url, {'conditional': True, 'start_chapter': 1, 'end_chapter': 3})
+        check(numbers(ranged) == [1, 2, 3], 'range sync imports only the range')
+        rest = ingest_chapters(conn, ranged_id, feed_url, {'conditional': True})
+        check(not rest['not_modified'] and numbers(rest) == list(range(4, total + 1)),
+              'full sync after a range sync imports the rest of the chapters')
+        again = ingest_chapters(conn, ranged_id, feed_url, {'conditional': True})
+        check(again['not_modified'] and not again['imported'], 'sync after the full import is not modified')
+    finally:
+        conn.rollback()
+        conn.close()
+        server.shutdown()
+        server.server_close()
+
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
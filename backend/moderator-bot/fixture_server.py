@@ -0,0 +1,140 @@
+'''
+Business: Локальный источник глав для проверки импорта parse_chapters / sync_chapters без внешней сети
+Args: параметры командной строки - число глав, страниц, задержка ответа, каждый N-й ответ 429
+Returns: HTTP-сервер с JSON-лентой /feed.json (ETag и Last-Modified) и страницами глав /chapters/<n>.json;
+         /stats показывает число запросов, ответов 304 и максимум одновременных
+
+Пример:
+    python fixture_server.py --port 8090 --chapters 40 --delay 0.2
+    {"command": "sync_chapters", "manhwa_id": 1, "source_url": "http://127.0.0.1:8090/feed.json"}
+    curl -X POST 'http://127.0.0.1:8090/chapters?count=45'   # добавить главы в ленту
+'''
+
+import argparse
+import json
+import sys
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+class FixtureState:
+    def __init__(self, chapters: int, pages: int, delay: float, throttle_every: int):
+        self.chapters = chapters
+        self.pages = pages
+        self.delay = delay
+        self.throttle_every = throttle_every
+        self.version = 1
+        self.modified_at = time.time()
+        self.requests = 0
+        self.not_modified = 0
+        self.inflight = 0
+        self.max_inflight = 0
+        self.lock = threading.Lock()
+
+    def set_chapters(self, count: int):
+        with self.lock:
+            if count != self.chapters:
+                self.chapters = count
+                self.version += 1
+                self.modified_at = time.time()
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state: FixtureState = None
+
+    def _json(self, status: int, data, extra_headers=None):
+        raw = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_GET(self):
+        state = self.state
+        path = urlsplit(self.path).path
+
+        if path == '/stats':
+            self._json(200, {'requests': state.requests, 'not_modified': state.not_modified,
+                             'max_inflight': state.max_inflight,
+                             'chapters': state.chapters, 'version': state.version})
+            return
+
+        with state.lock:
+            state.requests += 1
+            state.inflight += 1
+            state.max_inflight = max(state.max_inflight, state.inflight)
+            throttled = state.throttle_every and state.requests % state.throttle_every == 0
+        try:
+            time.sleep(state.delay)
+            if throttled:
+                self._json(429, {'error': 'slow down'}, {'Retry-After': '0'})
+            elif path == '/feed.json':
+                self._feed()
+            elif path.startswith('/chapters/') and path.endswith('.json'):
+                self._chapter(path[len('/chapters/'):-len('.json')])
+            else:
+                self._json(404, {'error': 'not found'})
+        finally:
+            with state.lock:
+                state.inflight -= 1
+
+    def _feed(self):
+        state = self.state
+        etag = f'"feed-{state.version}"'
+        validators = {'ETag': etag, 'Last-Modified': formatdate(state.modified_at, usegmt=True)}
+        if self.headers.get('If-None-Match') == etag:
+            with state.lock:
+                state.not_modified += 1
+            self._json(304, None, validators)
+            return
+        chapters = [{'number': n, 'title': f'Глава {n}', 'url': f'chapters/{n}.json'}
+                    for n in range(1, state.chapters + 1)]
+        self._json(200, {'chapters': chapters}, validators)
+
+    def _chapter(self, number: str):
+        if not number.isdigit() or not 1 <= int(number) <= self.state.chapters:
+            self._json(404, {'error': 'chapter not found'})
+            return
+        pages = [f'/images/{number}/{page}.jpg' for page in range(1, self.state.pages + 1)]
+        self._json(200, {'pages': pages})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path == '/chapters':
+            self.state.set_chapters(int(dict(parse_qsl(url.query)).get('count', self.state.chapters)))
+            self._json(200, {'chapters': self.state.chapters, 'version': self.state.version})
+        else:
+            self._json(404, {'error': 'not found'})
+
+    def log_message(self, format: str, *args):
+        pass
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Local chapter source for ingestion checks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--chapters', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=12)
+    parser.add_argument('--delay', type=float, default=0.1)
+    parser.add_argument('--throttle-every', type=int, default=0, help='answer every N-th request with 429')
+    args = parser.parse_args()
+
+    FixtureHandler.state = FixtureState(args.chapters, args.pages, args.delay, args.throttle_every)
+    server = ThreadingHTTPServer((args.host, args.port), FixtureHandler)
+    server.daemon_threads = True
+    print(f'chapter fixture on http://{args.host}:{args.port}/feed.json', file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,14 +5,21 @@ Args: event - dict с httpMethod, body для команд бота
 Returns: HTTP response с результатом выполнения команды
 """
 
+import base64
 import json
+import math
 import os
 import re
+import threading
+import time
 from typing import Dict, Any, List, Optional
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from datetime import datetime
 
+from ingest import IngestError, ingest_chapters, pick_adapter
+from roles import get_role_cache
+
 def get_db_connection():
     """Создает подключение к БД"""
     dsn = os.environ.get('DATABASE_URL')
@@ -20,6 +27,187 @@ def get_db_connection():
         raise Exception('DATABASE_URL not found')
     return psycopg2.connect(dsn)
 
+# Должны совпадать с настройками функции comments
+RATING_PRIOR_MEAN = float(os.environ.get('RATING_PRIOR_MEAN', '7.0'))
+RATING_PRIOR_WEIGHT = float(os.environ.get('RATING_PRIOR_WEIGHT', '0'))
+
+# Таблицы со счетчиками в site_counters (V0017)
+COUNTED_TABLES = ['manhwa', 'chapters', 'pages', 'comments']
+MAX_SERIES_DAYS = 366
+
+# Рассылка уведомлений: до порога - одним запросом в add_chapter, больше - заданием пачками
+FANOUT_INLINE_LIMIT = int(os.environ.get('FANOUT_INLINE_LIMIT', '5000'))
+FANOUT_BATCH_SIZE = int(os.environ.get('FANOUT_BATCH_SIZE', '10000'))
+FANOUT_WORKER_BUDGET = 10.0
+
+# Прогресс и скорость рассылки (уведомлений в секунду)
+FANOUT_JOB_QUERY = """
+    SELECT id, manhwa_id, chapter_id, mode, status, delivered, batches, last_subscription_id, error,
+           created_at, started_at, finished_at,
+           ROUND((delivered / GREATEST(EXTRACT(EPOCH FROM COALESCE(finished_at, updated_at) - started_at), 0.001))::numeric, 1)::float
+               AS per_second
+    FROM notification_fanout_jobs
+"""
+
+# Пороги быстрой пробы monitor_site
+DB_LATENCY_WARNING_MS = 200
+CONNECTION_SATURATION_WARNING = 0.8
+
+# Проверки целостности каталога для scan_integrity: violations получает пачку id таблицы
+INTEGRITY_CHECKS = {
+    'manhwa_without_chapters': {
+        'table': 'manhwa',
+        'health_name': 'content_check',
+        'message': 'manhwa without chapters',
+        'ok_message': 'All manhwa have chapters',
+        'violations': """
+            SELECT m.id AS entity_id, jsonb_build_object('title', m.title) AS details
+            FROM manhwa m
+            WHERE m.id = ANY(%(ids)s)
+              AND NOT EXISTS (SELECT 1 FROM chapters c WHERE c.manhwa_id = m.id)
+        """
+    },
+    'chapters_without_pages': {
+        'table': 'chapters',
+        'health_name': 'pages_check',
+        'message': 'chapters without pages',
+        'ok_message': 'All chapters have pages',
+        'violations': """
+            SELECT c.id AS entity_id,
+                   jsonb_build_object('manhwa_id', c.manhwa_id, 'chapter_number', c.chapter_number,
+                                      'title', m.title) AS details
+            FROM chapters c
+            JOIN manhwa m ON c.manhwa_id = m.id
+            WHERE c.id = ANY(%(ids)s)
+              AND NOT EXISTS (SELECT 1 FROM pages p WHERE p.chapter_id = c.id)
+        """
+    }
+}
+
+# Поиск дубликатов тайтлов: от DUPLICATE_CANDIDATE_SCORE совпадение показывается модератору,
+# от DUPLICATE_REJECT_SCORE заявка отклоняется автоматически (1.0 - ключи названий совпали)
+DUPLICATE_CANDIDATE_SCORE = float(os.environ.get('DUPLICATE_CANDIDATE_SCORE', '0.45'))
+DUPLICATE_REJECT_SCORE = float(os.environ.get('DUPLICATE_REJECT_SCORE', '0.9'))
+DUPLICATE_MATCH_LIMIT = 10
+
+DUPLICATE_TITLES_QUERY = """
+    WITH names AS (
+        SELECT DISTINCT name, normalize_title_key(name) AS title_key
+        FROM unnest(%(names)s::text[]) AS name
+    ),
+    matches AS (
+        SELECT DISTINCT ON (k.manhwa_id)
+               k.manhwa_id, k.title AS matched_title, k.source, n.name AS candidate,
+               similarity(k.title_key, n.title_key) AS score
+        FROM names n
+        JOIN manhwa_title_keys k ON k.title_key %% n.title_key
+        WHERE n.title_key <> ''
+        ORDER BY k.manhwa_id, score DESC
+    )
+    SELECT mt.manhwa_id, m.title, mt.matched_title, mt.source, mt.candidate, mt.score
+    FROM matches mt
+    JOIN manhwa m ON m.id = mt.manhwa_id
+    ORDER BY mt.score DESC, mt.manhwa_id
+    LIMIT %(limit)s
+"""
+
+# История изменений: размер страницы get_history и запас месячных секций (V0024)
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 500
+HISTORY_PARTITIONS_AHEAD = 3
+
+# Пакетная обработка заявок: дубликаты для всех названий пакета одним запросом - по индексу названий
+# и среди самих заявок пакета (тем же сравнением триграмм). Для каждой заявки - все совпадения от min_score,
+# по каждой манхве и каждой заявке пакета - лучшее
+MAX_BULK_SUBMISSIONS = 500
+
+BULK_DUPLICATE_QUERY = """
+    WITH names AS (
+        SELECT DISTINCT n.submission_id, n.name, normalize_title_key(n.name) AS title_key
+        FROM unnest(%(submission_ids)s::int[], %(names)s::text[]) AS n(submission_id, name)
+    ),
+    candidates AS (
+        SELECT n.submission_id, k.manhwa_id, NULL::integer AS duplicate_of_submission,
+               k.title AS matched_title, n.name AS candidate,
+               similarity(k.title_key, n.title_key) AS score
+        FROM names n
+        JOIN manhwa_title_keys k ON k.title_key %% n.title_key
+        WHERE n.title_key <> ''
+        UNION ALL
+        SELECT n.submission_id, NULL, o.submission_id, o.name, n.name,
+               similarity(o.title_key, n.title_key)
+        FROM names n
+        JOIN names o ON o.submission_id < n.submission_id AND o.title_key %% n.title_key
+        WHERE n.title_key <> '' AND o.title_key <> ''
+    )
+    SELECT DISTINCT ON (c.submission_id, c.manhwa_id, c.duplicate_of_submission)
+           c.submission_id, c.manhwa_id, m.title, c.duplicate_of_submission, c.matched_title, c.candidate, c.score
+    FROM candidates c
+    LEFT JOIN manhwa m ON m.id = c.manhwa_id
+    WHERE c.score >= %(min_score)s
+    ORDER BY c.submission_id, c.manhwa_id, c.duplicate_of_submission, c.score DESC
+"""
+
+# Очереди модерации (V0025): модератор забирает пачку ожидающих заявок в аренду на lease_seconds,
+# продлевает ее heartbeat_queue и отпускает release_queue; истекшая аренда освобождается сама
+MODERATION_QUEUES = {
+    'submissions': {'table': 'manhwa_submissions', 'status': 'status', 'order': 'submitted_at'},
+    'translator_requests': {'table': 'translator_change_requests', 'status': 'status', 'order': 'submitted_at'},
+    'uploads': {'table': 'user_uploads', 'status': 'moderation_status', 'order': 'created_at'}
+}
+CLAIM_BATCH_SIZE = 10
+MAX_CLAIM_BATCH = 100
+CLAIM_LEASE_SECONDS = int(os.environ.get('CLAIM_LEASE_SECONDS', '300'))
+MAX_CLAIM_LEASE_SECONDS = 3600
+QUEUE_PAGE_SIZE = 100
+MAX_QUEUE_PAGE_SIZE = 500
+
+# Заявка под действующей арендой другого модератора: решение по ней отклоняется (409)
+LEASE_CONFLICT_SQL = (
+    "COALESCE({t}claim_expires_at > CURRENT_TIMESTAMP AND {t}claimed_by IS DISTINCT FROM {user}, FALSE)"
+)
+
+# Должно совпадать с настройкой функции bookmarks
+BOOKMARK_TOMBSTONE_DAYS = int(os.environ.get('BOOKMARK_TOMBSTONE_DAYS', '90'))
+
+# Маршрутизация команд: у всех обработчиков одна сигнатура (body, conn, headers, user_id)
+COMMANDS = {
+    'parse_chapters': lambda body, conn, headers, user_id: parse_chapters_from_url(body, conn, headers, user_id),
+    'update_manhwa': lambda body, conn, headers, user_id: update_manhwa_info(body, conn, headers, user_id),
+    'monitor_site': lambda body, conn, headers, user_id: monitor_site_health(body, conn, headers),
+    'scan_integrity': lambda body, conn, headers, user_id: scan_integrity(body, conn, headers),
+    'process_fanout': lambda body, conn, headers, user_id: process_fanout(body, conn, headers),
+    'add_chapter': lambda body, conn, headers, user_id: add_chapter_manually(body, conn, headers, user_id),
+    'update_cover': lambda body, conn, headers, user_id: update_cover_image(body, conn, headers, user_id),
+    'sync_chapters': lambda body, conn, headers, user_id: sync_chapters_from_source(body, conn, headers, user_id),
+    'get_stats': lambda body, conn, headers, user_id: get_site_statistics(body, conn, headers),
+    'rollup_stats': lambda body, conn, headers, user_id: rollup_site_statistics(conn, headers),
+    'reconcile_counters': lambda body, conn, headers, user_id: reconcile_site_counters(body, conn, headers),
+    'get_submissions': lambda body, conn, headers, user_id: get_pending_submissions(body, conn, headers),
+    'find_duplicates': lambda body, conn, headers, user_id: find_duplicates(body, conn, headers),
+    'approve_submission': lambda body, conn, headers, user_id: approve_submission(body, conn, headers, user_id),
+    'reject_submission': lambda body, conn, headers, user_id: reject_submission(body, conn, headers, user_id),
+    'get_translator_requests': lambda body, conn, headers, user_id: get_translator_requests(body, conn, headers),
+    'claim_queue': lambda body, conn, headers, user_id: claim_queue(body, conn, headers, user_id),
+    'heartbeat_queue': lambda body, conn, headers, user_id: heartbeat_queue(body, conn, headers, user_id),
+    'release_queue': lambda body, conn, headers, user_id: release_queue(body, conn, headers, user_id),
+    'approve_translator': lambda body, conn, headers, user_id: approve_translator_change(body, conn, headers, user_id),
+    'reject_translator': lambda body, conn, headers, user_id: reject_translator_change(body, conn, headers, user_id),
+    'get_history': lambda body, conn, headers, user_id: get_change_history(body, conn, headers),
+    'maintain_history_partitions': lambda body, conn, headers, user_id: maintain_history_partitions(body, conn, headers),
+    'reconcile_ratings': lambda body, conn, headers, user_id: reconcile_ratings(conn, headers),
+    'reconcile_team_counters': lambda body, conn, headers, user_id: reconcile_team_counters(conn, headers),
+    'purge_bookmark_tombstones': lambda body, conn, headers, user_id: purge_bookmark_tombstones(body, conn, headers),
+    'batch': lambda body, conn, headers, user_id: run_batch(body, conn, headers, user_id),
+    'help': lambda body, conn, headers, user_id: get_bot_help(headers)
+}
+
+# Пакет команд: сколько подкоманд за вызов и какие в пакет не входят.
+# Команды с собственным бюджетом времени и коммитами по ходу работы не выполняются атомарно
+MAX_BATCH_COMMANDS = 200
+BATCH_EXCLUDED_COMMANDS = {'batch', 'help'}
+BATCH_NON_ATOMIC_COMMANDS = {'scan_integrity', 'process_fanout', 'purge_bookmark_tombstones', 'reconcile_counters'}
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
@@ -44,71 +232,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Forbidden: Invalid admin key'})
         }
     
-    # Дополнительная проверка роли в БД
-    if user_id:
-        try:
-            conn_check = get_db_connection()
-            cursor_check = conn_check.cursor(cursor_factory=RealDictCursor)
-            cursor_check.execute(f"SELECT role FROM user_roles WHERE user_id = '{user_id}'")
-            user_role = cursor_check.fetchone()
-            cursor_check.close()
-            conn_check.close()
-            
-            if not user_role or user_role['role'] != 'admin':
-                return {
-                    'statusCode': 403,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Forbidden: Admin role required'})
-                }
-        except:
-            pass
-    
     try:
         body = json.loads(event.get('body', '{}'))
         command = body.get('command')
         
-        if not command:
-            return get_bot_help(headers)
-        
         conn = get_db_connection()
         
-        # Маршрутизация команд
-        if command == 'parse_chapters':
-            return parse_chapters_from_url(body, conn, headers)
-        elif command == 'update_manhwa':
-            return update_manhwa_info(body, conn, headers, user_id)
-        elif command == 'monitor_site':
-            return monitor_site_health(body, conn, headers)
-        elif command == 'add_chapter':
-            return add_chapter_manually(body, conn, headers, user_id)
-        elif command == 'update_cover':
-            return update_cover_image(body, conn, headers, user_id)
-        elif command == 'sync_chapters':
-            return sync_chapters_from_source(body, conn, headers)
-        elif command == 'get_stats':
-            return get_site_statistics(conn, headers)
-        elif command == 'get_submissions':
-            return get_pending_submissions(conn, headers)
-        elif command == 'approve_submission':
-            return approve_submission(body, conn, headers, user_id)
-        elif command == 'reject_submission':
-            return reject_submission(body, conn, headers, user_id)
-        elif command == 'get_translator_requests':
-            return get_translator_requests(conn, headers)
-        elif command == 'approve_translator':
-            return approve_translator_change(body, conn, headers, user_id)
-        elif command == 'reject_translator':
-            return reject_translator_change(body, conn, headers, user_id)
-        elif command == 'get_history':
-            return get_change_history(body, conn, headers)
-        elif command == 'help':
-            return get_bot_help(headers)
-        else:
+        # Дополнительная проверка роли в БД - на том же подключении, что и команды
+        if user_id and not has_admin_role(conn, user_id):
             return {
-                'statusCode': 400,
+                'statusCode': 403,
                 'headers': headers,
-                'body': json.dumps({'error': f'Unknown command: {command}. Use "help" for list of commands'})
+                'body': json.dumps({'error': 'Forbidden: Admin role required'})
             }
+        
+        if not command:
+            return get_bot_help(headers)
+        
+        return run_command(command, body, conn, headers, user_id)
     except Exception as e:
         return {
             'statusCode': 500,
@@ -119,21 +260,194 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if 'conn' in locals():
             conn.close()
 
+def has_admin_role(conn, user_id: str) -> bool:
+    """Роль admin из кэша ролей инстанса; при ошибке чтения ролей проверка, как и раньше, не блокирует запрос"""
+    try:
+        role = get_role_cache(os.environ['DATABASE_URL']).role(conn, user_id)
+    except psycopg2.Error:
+        conn.rollback()
+        return True
+    conn.commit()
+    return role == 'admin'
+
+def run_command(command: str, body: Dict, conn, headers: Dict, user_id: Optional[str]) -> Dict[str, Any]:
+    """Маршрутизация команд"""
+    command_handler = COMMANDS.get(command)
+    if not command_handler:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': f'Unknown command: {command}. Use "help" for list of commands'})
+        }
+    return command_handler(body, conn, headers, user_id)
+
+class BatchConnection:
+    """
+    Подключение для подкоманд пакета. В атомарном режиме commit() подкоманд откладывается до конца пакета,
+    rollback() отмечается и проваливает пакет, а действия после коммита (фоновые потоки) ждут настоящего COMMIT;
+    записи истории копятся и пишутся одним INSERT перед этим COMMIT
+    """
+
+    def __init__(self, conn, atomic: bool):
+        self._conn = conn
+        self.atomic = atomic
+        self.rolled_back = False
+        self.logs: List[tuple] = []
+        self._after_commit: List = []
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        if not self.atomic:
+            self._conn.commit()
+
+    def rollback(self):
+        if self.atomic:
+            self.rolled_back = True
+        self._conn.rollback()
+
+    def close(self):
+        pass
+
+    def after_commit(self, callback):
+        if self.atomic:
+            self._after_commit.append(callback)
+        else:
+            callback()
+
+    def flush_logs(self):
+        if not self.logs:
+            return
+        cursor = self._conn.cursor()
+        execute_values(
+            cursor,
+            "INSERT INTO change_history (entity_type, entity_id, action, user_id, changes) VALUES %s",
+            self.logs
+        )
+        cursor.close()
+        self.logs = []
+
+    def finish(self):
+        """Настоящий COMMIT пакета и отложенные действия"""
+        self.flush_logs()
+        self._conn.commit()
+        for callback in self._after_commit:
+            callback()
+        self._after_commit = []
+
+def after_commit(conn, callback):
+    """Действие, которому нужны уже закоммиченные данные: сразу или после COMMIT атомарного пакета"""
+    if isinstance(conn, BatchConnection):
+        conn.after_commit(callback)
+    else:
+        callback()
+
+def run_batch(body: Dict, conn, headers: Dict, user_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Пакет подкоманд на одном подключении с одной проверкой роли.
+    atomic - одна транзакция, первая ошибка откатывает все; best_effort - каждая подкоманда сама по себе
+    """
+    items = body.get('commands')
+    mode = body.get('mode', 'atomic')
+    
+    if mode not in ('atomic', 'best_effort'):
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'mode must be atomic or best_effort'})
+        }
+    
+    if not isinstance(items, list) or not items or len(items) > MAX_BATCH_COMMANDS:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': f'commands must be a list of 1..{MAX_BATCH_COMMANDS} items'})
+        }
+    
+    excluded = BATCH_EXCLUDED_COMMANDS | (BATCH_NON_ATOMIC_COMMANDS if mode == 'atomic' else set())
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('command') or item['command'] in excluded:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'commands[{index}]: command not allowed in {mode} batch'})
+            }
+    
+    atomic = mode == 'atomic'
+    batch_conn = BatchConnection(conn, atomic)
+    results = []
+    failed_index = None
+    
+    for index, item in enumerate(items):
+        try:
+            response = run_command(item['command'], item, batch_conn, headers, user_id)
+            status = response['statusCode']
+            result = json.loads(response['body']) if response.get('body') else None
+        except Exception as e:
+            conn.rollback()
+            status = 500
+            result = {'error': str(e)}
+        
+        if atomic and batch_conn.rolled_back and status < 400:
+            status = 500
+            result = {'error': 'Command rolled back its transaction', 'result': result}
+        
+        results.append({'index': index, 'command': item['command'], 'status': status, 'result': result})
+        
+        if status >= 400:
+            if atomic:
+                failed_index = index
+                break
+            # Незакоммиченная часть неудачной подкоманды отбрасывается
+            conn.rollback()
+    
+    if failed_index is not None:
+        conn.rollback()
+        return {
+            'statusCode': 409,
+            'headers': headers,
+            'body': json.dumps({
+                'error': f'Batch rolled back: commands[{failed_index}] failed',
+                'mode': mode,
+                'committed': False,
+                'failed_index': failed_index,
+                'results': results
+            }, ensure_ascii=False, default=str)
+        }
+    
+    batch_conn.finish()
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'mode': mode,
+            'committed': True,
+            'succeeded': sum(1 for r in results if r['status'] < 400),
+            'failed': sum(1 for r in results if r['status'] >= 400),
+            'results': results
+        }, ensure_ascii=False, default=str)
+    }
+
 def get_bot_help(headers: Dict) -> Dict[str, Any]:
     """Справка по командам бота"""
     commands = {
         'parse_chapters': {
-            'description': 'Парсинг глав с внешнего источника',
+            'description': 'Импорт глав с внешнего источника: добавляются только главы, которых еще нет',
             'params': {
                 'manhwa_id': 'ID манхвы в БД',
-                'source_url': 'URL источника (remanga.org, etc)',
+                'source_url': 'URL источника: JSON-лента глав, пост VK (wall-1_2) или Boosty',
                 'start_chapter': 'С какой главы начать (опционально)',
-                'end_chapter': 'До какой главы (опционально)'
+                'end_chapter': 'До какой главы (опционально)',
+                'chapter_number': 'Номер главы для поста VK/Boosty, если его нет в тексте (опционально)',
+                'dry_run': 'Только показать, какие главы будут импортированы',
+                'notify': 'Уведомить подписчиков о последней импортированной главе (по умолчанию true)'
             },
             'example': {
                 'command': 'parse_chapters',
                 'manhwa_id': 1,
-                'source_url': 'https://remanga.org/manga/solo-leveling',
+                'source_url': 'https://example.com/solo-leveling/chapters.json',
                 'start_chapter': 1,
                 'end_chapter': 10
             }
@@ -162,6 +476,7 @@ def get_bot_help(headers: Dict) -> Dict[str, Any]:
                 'description': 'Описание (опционально)',
                 'cover_url': 'URL обложки (опционально)',
                 'status': 'Статус (ongoing/completed)',
+                'rating': 'Базовый рейтинг, пока нет оценок пользователей (опционально)',
                 'genres': 'Массив жанров'
             }
         },
@@ -173,19 +488,146 @@ def get_bot_help(headers: Dict) -> Dict[str, Any]:
             }
         },
         'sync_chapters': {
-            'description': 'Синхронизировать главы с источником',
+            'description': 'Синхронизировать главы с источником условным запросом (ETag/Last-Modified): неизменившийся источник не разбирается',
             'params': {
                 'manhwa_id': 'ID манхвы',
-                'source_url': 'URL источника'
+                'source_url': 'URL источника',
+                'dry_run': 'Только показать, какие главы будут импортированы',
+                'notify': 'Уведомить подписчиков о последней импортированной главе (по умолчанию true)'
             }
         },
         'monitor_site': {
-            'description': 'Проверить здоровье сайта',
-            'params': {}
+            'description': 'Проверить здоровье сайта: задержка БД, заполненность подключений, сводка нарушений',
+            'params': {
+                'findings': 'Вернуть страницу открытых нарушений',
+                'check': 'Фильтр нарушений по проверке (manhwa_without_chapters, chapters_without_pages)',
+                'after_id': 'Курсор страницы нарушений (next_after_id предыдущей страницы)',
+                'limit': 'Размер страницы нарушений (по умолчанию 50)'
+            }
+        },
+        'process_fanout': {
+            'description': 'Доделать большие рассылки уведомлений о новых главах и показать их прогресс (для периодического запуска)',
+            'params': {
+                'batch_size': 'Уведомлений за пачку (по умолчанию 10000)',
+                'time_budget': 'Сколько секунд работать за запуск (по умолчанию 20)',
+                'limit': 'Сколько последних заданий показать (по умолчанию 20)'
+            }
+        },
+        'scan_integrity': {
+            'description': 'Продолжить проверку целостности каталога пачками по id (для периодического запуска)',
+            'params': {
+                'batch_size': 'Строк за пачку (по умолчанию 5000)',
+                'time_budget': 'Сколько секунд работать за запуск (по умолчанию 20)',
+                'checks': 'Список проверок (по умолчанию все)'
+            }
         },
         'get_stats': {
             'description': 'Получить статистику сайта',
+            'params': {
+                'counts': 'counters (по умолчанию, точные счетчики) или estimate (оценка планировщика)',
+                'series_days': 'Вернуть ряд итогов и прироста за N дней (срезы rollup_stats)'
+            }
+        },
+        'reconcile_ratings': {
+            'description': 'Сверить агрегаты оценок манхвы с комментариями и исправить расхождения (для периодического запуска)',
+            'params': {}
+        },
+        'reconcile_team_counters': {
+            'description': 'Сверить счетчики участников и загрузок команд и исправить расхождения (для периодического запуска)',
+            'params': {}
+        },
+        'rollup_stats': {
+            'description': 'Сохранить срез итогов за текущий день для рядов get_stats (для периодического запуска)',
             'params': {}
+        },
+        'reconcile_counters': {
+            'description': 'Пересчитать счетчики статистики по таблицам точно (блокирует запись в таблицу на время подсчета)',
+            'params': {
+                'tables': 'Список таблиц (по умолчанию manhwa, chapters, pages, comments)'
+            }
+        },
+        'find_duplicates': {
+            'description': 'Найти похожие тайтлы по названиям заявки или произвольному названию',
+            'params': {
+                'submission_id': 'ID заявки (или title)',
+                'title': 'Название',
+                'alternative_titles': 'Альтернативные названия через запятую (опционально)',
+                'limit': 'Сколько совпадений вернуть (по умолчанию 10)'
+            }
+        },
+        'approve_submission': {
+            'description': 'Одобрить заявку на тайтл; похожий на существующий тайтл отклоняется как дубликат',
+            'params': {
+                'submission_id': 'ID заявки',
+                'submission_ids': f'Или список ID заявок (до {MAX_BULK_SUBMISSIONS}) - результат по каждой'
+            }
+        },
+        'reject_submission': {
+            'description': 'Отклонить заявку на тайтл',
+            'params': {
+                'submission_id': 'ID заявки',
+                'submission_ids': f'Или список ID заявок (до {MAX_BULK_SUBMISSIONS})',
+                'reason': 'Причина',
+                'reasons': 'Причины по ID заявки для пакета (опционально, {"12": "..."})'
+            }
+        },
+        'get_submissions': {
+            'description': 'Ожидающие заявки на тайтлы, новые сначала (get_translator_requests - так же для смены переводчика)',
+            'params': {
+                'limit': f'Размер страницы (до {MAX_QUEUE_PAGE_SIZE}; без limit и cursor - весь список)',
+                'cursor': 'next_cursor предыдущей страницы'
+            }
+        },
+        'claim_queue': {
+            'description': 'Забрать в работу пачку ожидающих заявок, старые сначала: другие модераторы их не получат, пока действует аренда',
+            'params': {
+                'queue': f'Очередь: {", ".join(MODERATION_QUEUES)} (по умолчанию submissions)',
+                'limit': f'Сколько заявок забрать (по умолчанию {CLAIM_BATCH_SIZE}, до {MAX_CLAIM_BATCH})',
+                'lease_seconds': f'Срок аренды в секундах (по умолчанию {CLAIM_LEASE_SECONDS})'
+            },
+            'example': {'command': 'claim_queue', 'queue': 'uploads', 'limit': 5}
+        },
+        'heartbeat_queue': {
+            'description': 'Продлить аренду своих заявок; потерянные (решенные или забранные после истечения) - в lost',
+            'params': {
+                'queue': 'Очередь',
+                'ids': 'ID заявок (по умолчанию все свои)',
+                'lease_seconds': 'Новый срок аренды от текущего момента'
+            }
+        },
+        'release_queue': {
+            'description': 'Вернуть свои заявки в очередь',
+            'params': {
+                'queue': 'Очередь',
+                'ids': 'ID заявок (по умолчанию все свои)'
+            }
+        },
+        'batch': {
+            'description': 'Выполнить несколько команд за один вызов на одном подключении',
+            'params': {
+                'commands': f'Список подкоманд в формате обычного тела запроса (до {MAX_BATCH_COMMANDS})',
+                'mode': 'atomic (по умолчанию, одна транзакция - первая ошибка откатывает все) или best_effort (результат по каждой)'
+            },
+            'example': {
+                'command': 'batch',
+                'mode': 'best_effort',
+                'commands': [
+                    {'command': 'approve_submission', 'submission_id': 12},
+                    {'command': 'add_chapter', 'manhwa_id': 1, 'chapter_number': 16, 'pages': []}
+                ]
+            }
+        },
+        'maintain_history_partitions': {
+            'description': 'Создать месячные секции истории изменений наперед (для периодического запуска)',
+            'params': {
+                'months_ahead': 'На сколько месяцев вперед (по умолчанию 3)'
+            }
+        },
+        'purge_bookmark_tombstones': {
+            'description': 'Удалить tombstone удаленных закладок старше срока хранения (для периодического запуска)',
+            'params': {
+                'batch_size': 'Сколько строк удалять за проход (по умолчанию 5000)'
+            }
         }
     }
     
@@ -257,15 +699,15 @@ def add_chapter_manually(body: Dict, conn, headers: Dict, user_id: str = None) -
         )
         pages_added += 1
     
-    conn.commit()
-    
     # Логируем изменение
     if user_id:
         log_change(conn, 'chapter', chapter_id, 'created', user_id,
                    f'Added chapter {chapter_number} with {pages_added} pages')
     
+    conn.commit()
+    
     # Отправляем уведомления подписчикам
-    send_chapter_notifications(conn, manhwa_id, chapter_id, chapter_number)
+    fanout = send_chapter_notifications(conn, manhwa_id, chapter_id, chapter_number)
     
     cursor.close()
     
@@ -276,46 +718,204 @@ def add_chapter_manually(body: Dict, conn, headers: Dict, user_id: str = None) -
             'message': f'Chapter {chapter_number} added successfully',
             'chapter_id': chapter_id,
             'pages_added': pages_added,
-            'manhwa': dict(manhwa)
-        })
+            'manhwa': dict(manhwa),
+            'notifications': fanout
+        }, default=str)
     }
 
-def send_chapter_notifications(conn, manhwa_id: int, chapter_id: int, chapter_number: int):
-    """Отправка уведомлений о новой главе"""
+def send_chapter_notifications(conn, manhwa_id: int, chapter_id: int, chapter_number: int) -> Optional[Dict[str, Any]]:
+    """
+    Уведомления о новой главе. До FANOUT_INLINE_LIMIT подписчиков - один INSERT ... SELECT прямо в запросе,
+    больше - задание, которое пачками по id подписки выполняет фоновый поток (и process_fanout)
+    """
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
-    # Получаем название манхвы
-    cursor.execute(f"SELECT title FROM manhwa WHERE id = {manhwa_id}")
+    cursor.execute("SELECT title FROM manhwa WHERE id = %s", (manhwa_id,))
     manhwa = cursor.fetchone()
     
     if not manhwa:
         cursor.close()
-        return
+        return None
     
-    # Получаем всех подписчиков
-    cursor.execute(f"""
-        SELECT user_id FROM notifications_subscriptions 
-        WHERE manhwa_id = {manhwa_id} AND notify_new_chapters = TRUE
-    """)
-    subscribers = cursor.fetchall()
+    # Считаем подписчиков только до порога - точное число для решения не нужно
+    cursor.execute("""
+        SELECT COUNT(*) AS total FROM (
+            SELECT 1 FROM notifications_subscriptions
+            WHERE manhwa_id = %s AND notify_new_chapters = TRUE
+            LIMIT %s
+        ) s
+    """, (manhwa_id, FANOUT_INLINE_LIMIT + 1))
+    inline = cursor.fetchone()['total'] <= FANOUT_INLINE_LIMIT
     
-    # Создаем уведомления
-    for sub in subscribers:
-        cursor.execute(
-            """INSERT INTO notifications 
-               (user_id, type, title, message, link, created_at)
-               VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)""",
-            (
-                sub['user_id'],
-                'new_chapter',
-                f'Новая глава {chapter_number}',
-                f'{manhwa["title"]} - Глава {chapter_number}',
-                f'/reader/{manhwa_id}?chapter={chapter_id}'
-            )
-        )
+    cursor.execute("""
+        INSERT INTO notification_fanout_jobs
+            (manhwa_id, chapter_id, title, message, link, mode, status, started_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, CASE WHEN %s THEN CURRENT_TIMESTAMP END)
+        RETURNING id
+    """, (
+        manhwa_id, chapter_id,
+        f'Новая глава {chapter_number}',
+        f'{manhwa["title"]} - Глава {chapter_number}',
+        f'/reader/{manhwa_id}?chapter={chapter_id}',
+        'inline' if inline else 'background',
+        'running' if inline else 'pending',
+        inline
+    ))
+    job_id = cursor.fetchone()['id']
+    
+    if inline:
+        run_fanout_batch(cursor, job_id, None)
+        conn.commit()
+        cursor.close()
+        return get_fanout_job(conn, job_id)
     
     conn.commit()
     cursor.close()
+    after_commit(conn, start_fanout_worker)
+    return get_fanout_job(conn, job_id)
+
+def run_fanout_batch(cursor, job_id: int, batch_size: Optional[int]) -> Optional[Dict[str, Any]]:
+    """
+    Следующая пачка задания в текущей транзакции: вставка уведомлений и сдвиг позиции коммитятся вместе,
+    поэтому повтор после сбоя не дублирует уведомления. batch_size=None - все оставшиеся подписчики
+    """
+    cursor.execute("""
+        SELECT * FROM notification_fanout_jobs
+        WHERE id = %s AND status IN ('pending', 'running')
+        FOR UPDATE SKIP LOCKED
+    """, (job_id,))
+    job = cursor.fetchone()
+    if job is None:
+        return None
+    
+    cursor.execute("""
+        WITH batch AS (
+            SELECT id, user_id
+            FROM notifications_subscriptions
+            WHERE manhwa_id = %(manhwa_id)s
+              AND notify_new_chapters = TRUE
+              AND id > %(after_id)s
+            ORDER BY id
+            LIMIT %(batch_size)s
+        ), inserted AS (
+            INSERT INTO notifications (user_id, type, title, message, link, created_at)
+            SELECT user_id, %(type)s, %(title)s, %(message)s, %(link)s, CURRENT_TIMESTAMP
+            FROM batch
+            RETURNING 1
+        )
+        SELECT (SELECT MAX(id) FROM batch) AS last_id,
+               (SELECT COUNT(*) FROM inserted) AS delivered
+    """, {
+        'manhwa_id': job['manhwa_id'],
+        'after_id': job['last_subscription_id'],
+        'batch_size': batch_size,
+        'type': job['type'],
+        'title': job['title'],
+        'message': job['message'],
+        'link': job['link']
+    })
+    result = cursor.fetchone()
+    done = batch_size is None or result['delivered'] < batch_size
+    
+    cursor.execute("""
+        UPDATE notification_fanout_jobs
+        SET last_subscription_id = COALESCE(%s, last_subscription_id),
+            delivered = delivered + %s,
+            batches = batches + 1,
+            status = %s,
+            started_at = COALESCE(started_at, CURRENT_TIMESTAMP),
+            finished_at = CASE WHEN %s THEN clock_timestamp() END,
+            updated_at = clock_timestamp()
+        WHERE id = %s
+    """, (result['last_id'], result['delivered'], 'done' if done else 'running', done, job_id))
+    
+    return {'job_id': job_id, 'delivered': result['delivered'], 'done': done}
+
+def get_fanout_job(conn, job_id: int) -> Dict[str, Any]:
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(FANOUT_JOB_QUERY + " WHERE id = %s", (job_id,))
+    job = dict(cursor.fetchone())
+    cursor.close()
+    return job
+
+def process_fanout_jobs(conn, time_budget: float, batch_size: int) -> Dict[str, Any]:
+    """Выполняет открытые задания рассылки пачками, пока не кончится time_budget"""
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    deadline = time.monotonic() + time_budget
+    processed: Dict[int, int] = {}
+    
+    while time.monotonic() < deadline:
+        cursor.execute("""
+            SELECT id FROM notification_fanout_jobs
+            WHERE status IN ('pending', 'running')
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """)
+        job = cursor.fetchone()
+        if job is None:
+            conn.rollback()
+            break
+        
+        try:
+            result = run_fanout_batch(cursor, job['id'], batch_size)
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            cursor.execute("""
+                UPDATE notification_fanout_jobs
+                SET status = 'failed', error = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """, (str(e), job['id']))
+            conn.commit()
+            continue
+        
+        if result:
+            processed[result['job_id']] = processed.get(result['job_id'], 0) + result['delivered']
+    
+    cursor.close()
+    return {'delivered': processed, 'finished': time.monotonic() < deadline}
+
+_fanout_worker: Optional[threading.Thread] = None
+_fanout_worker_lock = threading.Lock()
+
+def start_fanout_worker():
+    """Фоновый поток инстанса; если инстанс остановят раньше, задания доделает process_fanout"""
+    global _fanout_worker
+    
+    def work():
+        conn = get_db_connection()
+        try:
+            while not process_fanout_jobs(conn, FANOUT_WORKER_BUDGET, FANOUT_BATCH_SIZE)['finished']:
+                pass
+        finally:
+            conn.close()
+    
+    with _fanout_worker_lock:
+        if _fanout_worker and _fanout_worker.is_alive():
+            return
+        _fanout_worker = threading.Thread(target=work, name='notification-fanout', daemon=True)
+        _fanout_worker.start()
+
+def process_fanout(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
+    """Команда: доделать задания рассылки и показать прогресс последних заданий"""
+    batch_size = max(1, min(int(body.get('batch_size', FANOUT_BATCH_SIZE)), 100000))
+    result = process_fanout_jobs(conn, float(body.get('time_budget', 20)), batch_size)
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(FANOUT_JOB_QUERY + " ORDER BY id DESC LIMIT %s", (int(body.get('limit', 20)),))
+    jobs = [dict(r) for r in cursor.fetchall()]
+    cursor.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'delivered': result['delivered'],
+            'all_jobs_finished': result['finished'],
+            'jobs': jobs
+        }, default=str)
+    }
 
 def update_manhwa_info(body: Dict, conn, headers: Dict, user_id: str = None) -> Dict[str, Any]:
     """Обновление информации о манхве"""
@@ -348,9 +948,11 @@ def update_manhwa_info(body: Dict, conn, headers: Dict, user_id: str = None) ->
         updates.append('status = %s')
         values.append(body['status'])
     
+    # Ручной рейтинг - базовый: виден, пока у манхвы нет пользовательских оценок
     if 'rating' in body:
-        updates.append('rating = %s')
-        values.append(body['rating'])
+        updates.append('base_rating = %s')
+        updates.append('rating = CASE WHEN rating_count = 0 THEN %s ELSE rating END')
+        values.extend([body['rating'], body['rating']])
     
     if not updates:
         return {
@@ -401,27 +1003,52 @@ def update_cover_image(body: Dict, conn, headers: Dict, user_id: str = None) ->
         'body': json.dumps({'message': 'Cover updated successfully'})
     }
 
-def get_site_statistics(conn, headers: Dict) -> Dict[str, Any]:
-    """Статистика сайта"""
+def read_site_counters(cursor) -> Dict[str, int]:
+    """Итоги по таблицам из шардов site_counters - десятки строк вместо полных COUNT(*)"""
+    cursor.execute("""
+        SELECT name, SUM(value) AS total
+        FROM site_counters
+        WHERE name = ANY(%s)
+        GROUP BY name
+    """, (COUNTED_TABLES,))
+    totals = {row['name']: int(row['total']) for row in cursor.fetchall()}
+    return {name: totals.get(name, 0) for name in COUNTED_TABLES}
+
+def estimate_row_counts(cursor) -> Dict[str, Optional[int]]:
+    """Оценка числа строк планировщика (pg_class.reltuples, обновляется ANALYZE/autovacuum)"""
+    cursor.execute("""
+        SELECT t.name, c.reltuples
+        FROM unnest(%s::text[]) AS t(name)
+        LEFT JOIN pg_class c ON c.oid = to_regclass(t.name)
+    """, (COUNTED_TABLES,))
+    # reltuples = -1 у таблицы, которую еще ни разу не анализировали
+    return {row['name']: int(row['reltuples']) if row['reltuples'] is not None and row['reltuples'] >= 0 else None
+            for row in cursor.fetchall()}
+
+def get_site_statistics(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
+    """Статистика сайта: итоги из счетчиков (или оценки планировщика) и при необходимости ряд по дням"""
     cursor = conn.cursor(cursor_factory=RealDictCursor)
+    counts_mode = body.get('counts', 'counters')
     
-    stats = {}
-    
-    # Количество манхвы
-    cursor.execute("SELECT COUNT(*) as total FROM manhwa")
-    stats['total_manhwa'] = cursor.fetchone()['total']
+    if counts_mode not in ('counters', 'estimate'):
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'counts must be counters or estimate'})
+        }
     
-    # Количество глав
-    cursor.execute("SELECT COUNT(*) as total FROM chapters")
-    stats['total_chapters'] = cursor.fetchone()['total']
+    stats = {}
     
-    # Количество страниц
-    cursor.execute("SELECT COUNT(*) as total FROM pages")
-    stats['total_pages'] = cursor.fetchone()['total']
+    totals = read_site_counters(cursor)
+    if counts_mode == 'estimate':
+        estimates = estimate_row_counts(cursor)
+        totals = {name: estimates[name] if estimates[name] is not None else totals[name] for name in totals}
     
-    # Количество комментариев
-    cursor.execute("SELECT COUNT(*) as total FROM comments")
-    stats['total_comments'] = cursor.fetchone()['total']
+    stats['total_manhwa'] = totals['manhwa']
+    stats['total_chapters'] = totals['chapters']
+    stats['total_pages'] = totals['pages']
+    stats['total_comments'] = totals['comments']
+    stats['counts_source'] = counts_mode
     
     # Популярные манхвы
     cursor.execute("""
@@ -442,6 +1069,9 @@ def get_site_statistics(conn, headers: Dict) -> Dict[str, Any]:
     """)
     stats['recent_chapters'] = [dict(r) for r in cursor.fetchall()]
     
+    if body.get('series_days'):
+        stats['series'] = get_stats_series(cursor, min(int(body['series_days']), MAX_SERIES_DAYS))
+    
     cursor.close()
     
     return {
@@ -450,170 +1080,703 @@ def get_site_statistics(conn, headers: Dict) -> Dict[str, Any]:
         'body': json.dumps(stats, default=str)
     }
 
-def monitor_site_health(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
-    """Мониторинг здоровья сайта"""
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    health = {
-        'status': 'healthy',
-        'timestamp': datetime.now().isoformat(),
-        'checks': []
-    }
-    
-    # Проверка подключения к БД
-    try:
-        cursor.execute("SELECT 1")
-        health['checks'].append({
-            'name': 'database',
-            'status': 'ok',
-            'message': 'Database connection successful'
-        })
-    except Exception as e:
-        health['status'] = 'unhealthy'
-        health['checks'].append({
-            'name': 'database',
-            'status': 'error',
-            'message': str(e)
-        })
-    
-    # Проверка манхвы без глав
+def get_stats_series(cursor, days: int) -> List[Dict[str, Any]]:
+    """Итоги по дням из site_stats_daily и прирост относительно предыдущего среза"""
+    # Срез за день до начала окна читается только ради прироста первого дня
     cursor.execute("""
-        SELECT m.id, m.title 
-        FROM manhwa m
-        LEFT JOIN chapters c ON m.id = c.manhwa_id
-        WHERE c.id IS NULL
-    """)
-    manhwa_no_chapters = cursor.fetchall()
-    
-    if manhwa_no_chapters:
-        health['checks'].append({
-            'name': 'content_check',
-            'status': 'warning',
-            'message': f'{len(manhwa_no_chapters)} manhwa without chapters',
-            'details': [dict(m) for m in manhwa_no_chapters]
-        })
-    else:
-        health['checks'].append({
-            'name': 'content_check',
-            'status': 'ok',
-            'message': 'All manhwa have chapters'
-        })
+        SELECT * FROM (
+            SELECT day, total_manhwa, total_chapters, total_pages, total_comments,
+                   total_manhwa - LAG(total_manhwa) OVER w AS new_manhwa,
+                   total_chapters - LAG(total_chapters) OVER w AS new_chapters,
+                   total_pages - LAG(total_pages) OVER w AS new_pages,
+                   total_comments - LAG(total_comments) OVER w AS new_comments
+            FROM site_stats_daily
+            WHERE day >= CURRENT_DATE - %(days)s
+            WINDOW w AS (ORDER BY day)
+        ) s
+        WHERE day > CURRENT_DATE - %(days)s
+        ORDER BY day
+    """, {'days': days})
+    return [dict(r) for r in cursor.fetchall()]
+
+def rollup_site_statistics(conn, headers: Dict) -> Dict[str, Any]:
+    """Срез итогов за текущий день (для периодического запуска; повторный запуск в тот же день обновляет срез)"""
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
     
-    # Проверка глав без страниц
     cursor.execute("""
-        SELECT c.id, c.chapter_number, m.title
-        FROM chapters c
-        JOIN manhwa m ON c.manhwa_id = m.id
-        LEFT JOIN pages p ON c.id = p.chapter_id
-        WHERE p.id IS NULL
+        INSERT INTO site_stats_daily (day, total_manhwa, total_chapters, total_pages, total_comments)
+        SELECT CURRENT_DATE,
+               COALESCE(SUM(value) FILTER (WHERE name = 'manhwa'), 0),
+               COALESCE(SUM(value) FILTER (WHERE name = 'chapters'), 0),
+               COALESCE(SUM(value) FILTER (WHERE name = 'pages'), 0),
+               COALESCE(SUM(value) FILTER (WHERE name = 'comments'), 0)
+        FROM site_counters
+        ON CONFLICT (day) DO UPDATE
+        SET total_manhwa = EXCLUDED.total_manhwa,
+            total_chapters = EXCLUDED.total_chapters,
+            total_pages = EXCLUDED.total_pages,
+            total_comments = EXCLUDED.total_comments,
+            captured_at = CURRENT_TIMESTAMP
+        RETURNING *
     """)
-    chapters_no_pages = cursor.fetchall()
-    
-    if chapters_no_pages:
-        health['checks'].append({
-            'name': 'pages_check',
-            'status': 'warning',
-            'message': f'{len(chapters_no_pages)} chapters without pages',
-            'details': [dict(c) for c in chapters_no_pages]
-        })
-    else:
-        health['checks'].append({
-            'name': 'pages_check',
-            'status': 'ok',
-            'message': 'All chapters have pages'
-        })
-    
+    snapshot = dict(cursor.fetchone())
+    conn.commit()
     cursor.close()
     
     return {
         'statusCode': 200,
         'headers': headers,
-        'body': json.dumps(health, default=str, ensure_ascii=False, indent=2)
-    }
-
-def parse_chapters_from_url(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
-    """Парсинг глав с внешнего источника (заглушка для расширения)"""
-    return {
-        'statusCode': 501,
-        'headers': headers,
-        'body': json.dumps({
-            'message': 'Feature in development',
-            'note': 'Используйте add_chapter для ручного добавления глав. Парсинг требует дополнительных библиотек (beautifulsoup4, requests)'
-        })
+        'body': json.dumps({'message': 'Daily statistics captured', 'snapshot': snapshot}, default=str)
     }
 
-def sync_chapters_from_source(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
-    """Синхронизация глав с источником"""
-    return {
-        'statusCode': 501,
+def reconcile_site_counters(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
+    """
+    Точный пересчет счетчиков по таблицам. На время подсчета таблица блокируется от записи (SHARE),
+    иначе строки, вставленные во время COUNT(*), посчитались бы дважды - запускать вне пиковых часов
+    """
+    tables = body.get('tables') or COUNTED_TABLES
+    unknown = [t for t in tables if t not in COUNTED_TABLES]
+    if unknown:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': f'Unknown tables: {unknown}'})
+        }
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    fixed = {}
+    
+    for table in tables:
+        cursor.execute(f"LOCK TABLE {table} IN SHARE MODE")
+        cursor.execute(f"SELECT COUNT(*) AS total FROM {table}")
+        actual = cursor.fetchone()['total']
+        cursor.execute("SELECT COALESCE(SUM(value), 0) AS total FROM site_counters WHERE name = %s", (table,))
+        counted = int(cursor.fetchone()['total'])
+        
+        if actual != counted:
+            cursor.execute("DELETE FROM site_counters WHERE name = %s", (table,))
+            cursor.execute("INSERT INTO site_counters (name, shard, value) VALUES (%s, 0, %s)", (table, actual))
+            fixed[table] = {'counted': counted, 'actual': actual}
+        conn.commit()
+    
+    cursor.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({'message': 'Site counters reconciled', 'fixed': fixed})
+    }
+
+def reconcile_ratings(conn, headers: Dict) -> Dict[str, Any]:
+    """Пересчет rating_sum/rating_count по комментариям и исправление рассинхрона"""
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cursor.execute("""
+        WITH actual AS (
+            SELECT m.id,
+                   COALESCE(r.total, 0) AS total,
+                   COALESCE(r.votes, 0) AS votes
+            FROM manhwa m
+            LEFT JOIN (
+                SELECT manhwa_id, SUM(rating) AS total, COUNT(rating) AS votes
+                FROM comments
+                WHERE rating IS NOT NULL
+                GROUP BY manhwa_id
+            ) r ON r.manhwa_id = m.id
+        )
+        UPDATE manhwa m
+        SET rating_sum = a.total,
+            rating_count = a.votes,
+            rating = COALESCE(manhwa_rating_score(a.total, a.votes, %(prior_mean)s, %(prior_weight)s), m.base_rating, 0)
+        FROM actual a
+        WHERE m.id = a.id
+          AND (m.rating_sum <> a.total
+               OR m.rating_count <> a.votes
+               OR m.rating IS DISTINCT FROM COALESCE(
+                   manhwa_rating_score(a.total, a.votes, %(prior_mean)s, %(prior_weight)s), m.base_rating, 0))
+        RETURNING m.id, m.rating_sum, m.rating_count, m.rating
+    """, {'prior_mean': RATING_PRIOR_MEAN, 'prior_weight': RATING_PRIOR_WEIGHT})
+    fixed = [dict(r) for r in cursor.fetchall()]
+    conn.commit()
+    cursor.close()
+    
+    return {
+        'statusCode': 200,
         'headers': headers,
         'body': json.dumps({
-            'message': 'Feature in development',
-            'note': 'Используйте add_chapter для добавления новых глав'
-        })
+            'message': 'Ratings reconciled',
+            'fixed': fixed,
+            'total_fixed': len(fixed)
+        }, default=str)
     }
 
-def log_change(conn, entity_type: str, entity_id: int, action: str, user_id: str, changes: str):
-    """Логирование изменений в историю"""
-    cursor = conn.cursor()
-    cursor.execute(
-        """INSERT INTO change_history (entity_type, entity_id, action, user_id, changes)
-           VALUES (%s, %s, %s, %s, %s)""",
-        (entity_type, entity_id, action, user_id or 'system', changes)
-    )
+def reconcile_team_counters(conn, headers: Dict) -> Dict[str, Any]:
+    """
+    Пересчет teams.member_count/manhwa_count по участникам и загрузкам (V0026) и исправление рассинхрона.
+    Строки команд блокируются до подсчета: запись uploads, уже обновившая счетчик, к этому моменту
+    зафиксирована и попадает в подсчет, а следующая ждет и прибавляет к исправленному значению
+    """
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    
+    cursor.execute("SELECT id FROM teams ORDER BY id FOR UPDATE")
+    cursor.execute("""
+        WITH actual AS (
+            SELECT t.id,
+                   (SELECT COUNT(*) FROM team_members tm WHERE tm.team_id = t.id) AS members,
+                   (SELECT COUNT(*) FROM user_uploads uu WHERE uu.team_id = t.id) AS uploads
+            FROM teams t
+        )
+        UPDATE teams t
+        SET member_count = a.members,
+            manhwa_count = a.uploads
+        FROM actual a
+        WHERE t.id = a.id
+          AND (t.member_count <> a.members OR t.manhwa_count <> a.uploads)
+        RETURNING t.id, t.member_count, t.manhwa_count
+    """)
+    fixed = [dict(r) for r in cursor.fetchall()]
     conn.commit()
     cursor.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'message': 'Team counters reconciled',
+            'fixed': fixed,
+            'total_fixed': len(fixed)
+        })
+    }
 
-def check_duplicate_title(conn, title: str, alternative_titles: str = None) -> bool:
-    """Проверка на дубликаты названий"""
+def purge_bookmark_tombstones(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
+    """Физическое удаление старых tombstone закладок короткими транзакциями"""
+    batch_size = int(body.get('batch_size', 5000))
     cursor = conn.cursor(cursor_factory=RealDictCursor)
+    purged = 0
+    
+    while True:
+        cursor.execute("""
+            DELETE FROM t_p15993318_manhwa_reader_platfo.bookmarks
+            WHERE id IN (
+                SELECT id FROM t_p15993318_manhwa_reader_platfo.bookmarks
+                WHERE deleted_at IS NOT NULL
+                  AND deleted_at < LOCALTIMESTAMP - make_interval(days => %s)
+                LIMIT %s
+            )
+        """, (BOOKMARK_TOMBSTONE_DAYS, batch_size))
+        deleted = cursor.rowcount
+        conn.commit()
+        purged += deleted
+        if deleted < batch_size:
+            break
     
-    # Проверка основного названия
-    cursor.execute(
-        f"SELECT id, title FROM manhwa WHERE LOWER(title) = LOWER('{title}')"
-    )
-    if cursor.fetchone():
+    cursor.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'message': 'Bookmark tombstones purged',
+            'purged': purged,
+            'retention_days': BOOKMARK_TOMBSTONE_DAYS
+        })
+    }
+
+def monitor_site_health(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
+    """
+    Мониторинг здоровья сайта: быстрая проба БД (задержка, заполненность подключений)
+    и сводка нарушений из integrity_findings. Сами проверки каталога выполняет scan_integrity
+    """
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    
+    health = {
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'checks': []
+    }
+    
+    # Проверка подключения к БД и задержки запроса
+    try:
+        started = time.perf_counter()
+        cursor.execute("SELECT 1")
+        latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        status = 'ok' if latency_ms < DB_LATENCY_WARNING_MS else 'warning'
+        health['checks'].append({
+            'name': 'database',
+            'status': status,
+            'message': f'Database responded in {latency_ms} ms',
+            'latency_ms': latency_ms
+        })
+    except Exception as e:
+        health['status'] = 'unhealthy'
+        health['checks'].append({
+            'name': 'database',
+            'status': 'error',
+            'message': str(e)
+        })
         cursor.close()
-        return True
+        return {
+            'statusCode': 503,
+            'headers': headers,
+            'body': json.dumps(health, default=str, ensure_ascii=False, indent=2)
+        }
     
-    # Проверка альтернативных названий
-    if alternative_titles:
-        alt_list = [t.strip() for t in alternative_titles.split(',')]
-        for alt in alt_list:
-            if alt:
-                cursor.execute(
-                    f"SELECT id FROM manhwa WHERE LOWER(title) = LOWER('{alt}')"
-                )
-                if cursor.fetchone():
-                    cursor.close()
-                    return True
+    # Заполненность подключений: pg_stat_activity читается из разделяемой памяти, без обращения к таблицам
+    cursor.execute("""
+        SELECT COUNT(*) AS connections,
+               COUNT(*) FILTER (WHERE state = 'active') AS active,
+               current_setting('max_connections')::int AS max_connections
+        FROM pg_stat_activity
+        WHERE backend_type = 'client backend'
+    """)
+    usage = cursor.fetchone()
+    saturation = round(usage['connections'] / usage['max_connections'], 3)
+    health['checks'].append({
+        'name': 'connections',
+        'status': 'ok' if saturation < CONNECTION_SATURATION_WARNING else 'warning',
+        'message': f"{usage['connections']} of {usage['max_connections']} connections in use",
+        'connections': usage['connections'],
+        'active': usage['active'],
+        'max_connections': usage['max_connections'],
+        'saturation': saturation
+    })
+    
+    # Нарушения целостности из последних проходов scan_integrity
+    cursor.execute("""
+        SELECT s.check_name, s.last_id, s.rows_scanned, s.last_pass_completed_at, s.updated_at,
+               (SELECT COUNT(*) FROM integrity_findings f
+                WHERE f.check_name = s.check_name AND f.resolved_at IS NULL) AS open_findings
+        FROM integrity_scan_state s
+    """)
+    scan_state = {row['check_name']: row for row in cursor.fetchall()}
+    
+    for check_name, check in INTEGRITY_CHECKS.items():
+        state = scan_state.get(check_name)
+        if state is None:
+            health['checks'].append({
+                'name': check['health_name'],
+                'status': 'unknown',
+                'message': 'Not scanned yet, run scan_integrity'
+            })
+            continue
+        
+        health['checks'].append({
+            'name': check['health_name'],
+            'status': 'warning' if state['open_findings'] else 'ok',
+            'message': f"{state['open_findings']} {check['message']}" if state['open_findings'] else check['ok_message'],
+            'open_findings': state['open_findings'],
+            'last_pass_completed_at': state['last_pass_completed_at'],
+            'scan_position': state['last_id']
+        })
+    
+    if body.get('findings'):
+        health['findings'] = list_integrity_findings(cursor, body)
     
     cursor.close()
-    return False
+    
+    if any(check['status'] == 'warning' for check in health['checks']) and health['status'] == 'healthy':
+        health['status'] = 'degraded'
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps(health, default=str, ensure_ascii=False, indent=2)
+    }
+
+def list_integrity_findings(cursor, body: Dict) -> Dict[str, Any]:
+    """Страница открытых нарушений (keyset по id); after_id - последний id предыдущей страницы"""
+    limit = max(1, min(int(body.get('limit', 50)), 500))
+    check_name = body.get('check')
+    after_id = int(body.get('after_id') or 0)
+    
+    cursor.execute("""
+        SELECT id, check_name, entity_id, details, first_seen_at, last_seen_at
+        FROM integrity_findings
+        WHERE resolved_at IS NULL
+          AND (%(check)s::varchar IS NULL OR check_name = %(check)s::varchar)
+          AND id > %(after_id)s
+        ORDER BY id
+        LIMIT %(limit)s
+    """, {'check': check_name, 'after_id': after_id, 'limit': limit + 1})
+    rows = [dict(r) for r in cursor.fetchall()]
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'items': rows,
+        'next_after_id': rows[-1]['id'] if has_more else None
+    }
 
-def get_pending_submissions(conn, headers: Dict) -> Dict[str, Any]:
-    """Получение заявок на модерацию"""
+def scan_integrity(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
+    """
+    Инкрементальная проверка каталога: каждая проверка идет по таблице пачками по id,
+    после каждой пачки фиксирует позицию и нарушения. Вызывается периодически и укладывается в time_budget
+    """
+    batch_size = max(1, min(int(body.get('batch_size', 5000)), 50000))
+    time_budget = float(body.get('time_budget', 20))
+    checks = body.get('checks') or list(INTEGRITY_CHECKS)
+    
+    unknown = [c for c in checks if c not in INTEGRITY_CHECKS]
+    if unknown:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': f'Unknown checks: {unknown}'})
+        }
+    
     cursor = conn.cursor(cursor_factory=RealDictCursor)
+    deadline = time.monotonic() + time_budget
+    report = {name: {'batches': 0, 'scanned': 0, 'found': 0, 'resolved': 0, 'passes_completed': 0}
+              for name in checks}
+    
+    active = list(checks)
+    while active and time.monotonic() < deadline:
+        for check_name in list(active):
+            result = scan_integrity_batch(cursor, check_name, batch_size)
+            conn.commit()
+            
+            if result is None:
+                # Проверку уже ведет другой запуск
+                active.remove(check_name)
+                continue
+            
+            stats = report[check_name]
+            stats['batches'] += 1
+            stats['scanned'] += result['scanned']
+            stats['found'] += result['found']
+            stats['resolved'] += result['resolved']
+            if result['pass_completed']:
+                stats['passes_completed'] += 1
+                # Одного полного прохода за запуск достаточно
+                active.remove(check_name)
+            
+            if time.monotonic() >= deadline:
+                break
+    
+    cursor.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({'message': 'Integrity scan step finished', 'checks': report})
+    }
+
+def scan_integrity_batch(cursor, check_name: str, batch_size: int) -> Optional[Dict[str, Any]]:
+    """Одна пачка проверки в текущей транзакции; None, если позиция заблокирована другим сканером"""
+    check = INTEGRITY_CHECKS[check_name]
     
     cursor.execute("""
-        SELECT * FROM manhwa_submissions 
-        WHERE status = 'pending'
-        ORDER BY submitted_at DESC
-    """)
-    submissions = [dict(s) for s in cursor.fetchall()]
+        INSERT INTO integrity_scan_state (check_name) VALUES (%s)
+        ON CONFLICT (check_name) DO NOTHING
+    """, (check_name,))
+    cursor.execute("""
+        SELECT last_id FROM integrity_scan_state
+        WHERE check_name = %s
+        FOR UPDATE SKIP LOCKED
+    """, (check_name,))
+    state = cursor.fetchone()
+    if state is None:
+        return None
+    last_id = state['last_id']
+    
+    cursor.execute(
+        f"SELECT id FROM {check['table']} WHERE id > %s ORDER BY id LIMIT %s",
+        (last_id, batch_size)
+    )
+    ids = [row['id'] for row in cursor.fetchall()]
+    
+    if not ids:
+        # Конец таблицы: закрываем нарушения удаленных строк за последним id и начинаем новый проход
+        cursor.execute("""
+            UPDATE integrity_findings SET resolved_at = CURRENT_TIMESTAMP
+            WHERE check_name = %s AND entity_id > %s AND resolved_at IS NULL
+        """, (check_name, last_id))
+        resolved = cursor.rowcount
+        cursor.execute("""
+            UPDATE integrity_scan_state
+            SET last_id = 0,
+                last_pass_completed_at = CURRENT_TIMESTAMP,
+                pass_started_at = CURRENT_TIMESTAMP,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE check_name = %s
+        """, (check_name,))
+        return {'scanned': 0, 'found': 0, 'resolved': resolved, 'pass_completed': True}
+    
+    upper_id = ids[-1]
+    cursor.execute(check['violations'], {'ids': ids})
+    violations = cursor.fetchall()
+    violating_ids = [row['entity_id'] for row in violations]
+    
+    if violations:
+        execute_values(cursor, """
+            INSERT INTO integrity_findings (check_name, entity_id, details)
+            VALUES %s
+            ON CONFLICT (check_name, entity_id) DO UPDATE
+            SET details = EXCLUDED.details,
+                last_seen_at = CURRENT_TIMESTAMP,
+                resolved_at = NULL
+        """, [(check_name, row['entity_id'], json.dumps(row['details'], default=str, ensure_ascii=False))
+              for row in violations], template='(%s, %s, %s::jsonb)')
+    
+    cursor.execute("""
+        UPDATE integrity_findings SET resolved_at = CURRENT_TIMESTAMP
+        WHERE check_name = %s
+          AND entity_id > %s AND entity_id <= %s
+          AND resolved_at IS NULL
+          AND entity_id <> ALL(%s)
+    """, (check_name, last_id, upper_id, violating_ids))
+    resolved = cursor.rowcount
+    
+    cursor.execute("""
+        UPDATE integrity_scan_state
+        SET last_id = %s, rows_scanned = rows_scanned + %s, updated_at = CURRENT_TIMESTAMP
+        WHERE check_name = %s
+    """, (upper_id, len(ids), check_name))
+    
+    return {'scanned': len(ids), 'found': len(violations), 'resolved': resolved, 'pass_completed': False}
+
+def parse_chapters_from_url(body: Dict, conn, headers: Dict, user_id: str = None) -> Dict[str, Any]:
+    """Импорт глав с внешнего источника: список глав читается заново, импортируются отсутствующие"""
+    return import_chapters(body, conn, headers, user_id, conditional=False)
+
+def sync_chapters_from_source(body: Dict, conn, headers: Dict, user_id: str = None) -> Dict[str, Any]:
+    """Синхронизация глав с источником: условный запрос, неизменившийся источник не разбирается"""
+    return import_chapters(body, conn, headers, user_id, conditional=True)
+
+def import_chapters(body: Dict, conn, headers: Dict, user_id: Optional[str], conditional: bool) -> Dict[str, Any]:
+    """Общая часть parse_chapters и sync_chapters поверх движка импорта ingest.py"""
+    manhwa_id = body.get('manhwa_id')
+    source_url = (body.get('source_url') or '').strip()
+    
+    if not manhwa_id or not source_url:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'manhwa_id and source_url required'})
+        }
+    
+    if not pick_adapter(source_url):
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Unsupported source URL. Use a JSON chapter feed, VK or Boosty link'})
+        }
+    
+    try:
+        options = {
+            'conditional': conditional,
+            'dry_run': bool(body.get('dry_run')),
+            'start_chapter': int(body['start_chapter']) if body.get('start_chapter') is not None else None,
+            'end_chapter': int(body['end_chapter']) if body.get('end_chapter') is not None else None,
+            'chapter_number': int(body['chapter_number']) if body.get('chapter_number') is not None else None,
+            'title': body.get('title')
+        }
+    except (TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'chapter numbers must be integers'})
+        }
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute("SELECT id, title FROM manhwa WHERE id = %s", (manhwa_id,))
+    manhwa = cursor.fetchone()
     cursor.close()
     
+    if not manhwa:
+        return {
+            'statusCode': 404,
+            'headers': headers,
+            'body': json.dumps({'error': 'Manhwa not found'})
+        }
+    
+    try:
+        result = ingest_chapters(conn, manhwa['id'], source_url, options)
+    except IngestError as e:
+        conn.rollback()
+        return {
+            'statusCode': 502,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)}, ensure_ascii=False)
+        }
+    
+    imported = result['imported']
+    if imported:
+        log_change(conn, 'manhwa', manhwa['id'], 'chapters_imported', user_id,
+                   f'Imported {len(imported)} chapters ({imported[0]["chapter_number"]}-{imported[-1]["chapter_number"]}) '
+                   f'from {source_url}')
+    
+    conn.commit()
+    
+    if imported:
+        # Подписчикам - одно уведомление о последней импортированной главе, а не по каждой из пачки
+        if body.get('notify', True):
+            latest = imported[-1]
+            result['notifications'] = send_chapter_notifications(
+                conn, manhwa['id'], latest['chapter_id'], latest['chapter_number']
+            )
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({'manhwa': dict(manhwa), **result}, ensure_ascii=False, default=str)
+    }
+
+def log_change(conn, entity_type: str, entity_id: int, action: str, user_id: str, changes: str):
+    """
+    Запись в историю изменений в транзакции самого изменения - вызывается до conn.commit(),
+    поэтому изменение и его запись в истории фиксируются одним COMMIT.
+    В атомарном пакете команд записи копятся и пишутся одним INSERT перед общим COMMIT
+    """
+    row = (entity_type, entity_id, action, user_id or 'system', changes)
+    if isinstance(conn, BatchConnection) and conn.atomic:
+        conn.logs.append(row)
+        return
+    
+    cursor = conn.cursor()
+    cursor.execute(
+        """INSERT INTO change_history (entity_type, entity_id, action, user_id, changes)
+           VALUES (%s, %s, %s, %s, %s)""",
+        row
+    )
+    cursor.close()
+
+def submission_title_names(title: str, alternative_titles: str = None) -> List[str]:
+    """Все названия заявки: основное и альтернативные через запятую"""
+    names = [title or '']
+    if alternative_titles:
+        names.extend(alt.strip() for alt in alternative_titles.split(','))
+    return [name for name in names if name.strip()]
+
+def find_duplicate_titles(conn, names: List[str], limit: int = DUPLICATE_MATCH_LIMIT) -> List[Dict[str, Any]]:
+    """
+    Похожие тайтлы для набора названий одним запросом по триграммному индексу manhwa_title_keys (V0021).
+    По каждой манхве - лучшее совпадение из ее названий; score 1.0 - совпадение ключей после нормализации
+    """
+    if not names:
+        return []
+
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    # Порог оператора % действует до конца транзакции
+    cursor.execute(
+        "SELECT set_config('pg_trgm.similarity_threshold', %s, true)",
+        (str(DUPLICATE_CANDIDATE_SCORE),)
+    )
+    cursor.execute(DUPLICATE_TITLES_QUERY, {'names': names, 'limit': limit})
+    matches = [dict(row) for row in cursor.fetchall()]
+    cursor.close()
+
+    for match in matches:
+        match['score'] = round(float(match['score']), 3)
+    return matches
+
+def find_duplicates(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
+    """Ранжированный список похожих тайтлов для заявки или названия"""
+    title = body.get('title')
+    alternative_titles = body.get('alternative_titles')
+
+    if body.get('submission_id'):
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(
+            "SELECT title, alternative_titles FROM manhwa_submissions WHERE id = %s",
+            (body['submission_id'],)
+        )
+        submission = cursor.fetchone()
+        cursor.close()
+        if not submission:
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({'error': 'Submission not found'})
+            }
+        title, alternative_titles = submission['title'], submission['alternative_titles']
+
+    names = submission_title_names(title, alternative_titles)
+    if not names:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'submission_id or title required'})
+        }
+
+    limit = max(1, min(int(body.get('limit', DUPLICATE_MATCH_LIMIT)), 100))
+    matches = find_duplicate_titles(conn, names, limit)
+
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'names': names,
+            'matches': matches,
+            'duplicate': bool(matches) and matches[0]['score'] >= DUPLICATE_REJECT_SCORE
+        }, ensure_ascii=False)
+    }
+
+def get_pending_submissions(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
+    """Получение заявок на модерацию, новые сначала, страницами по курсору"""
+    page = fetch_pending_page(conn, """
+        SELECT * FROM manhwa_submissions s
+        WHERE s.status = 'pending'
+    """, 's', body)
+    if page is None:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'invalid cursor'})
+        }
+    submissions, next_cursor = page
+    
     return {
         'statusCode': 200,
         'headers': headers,
         'body': json.dumps({
             'submissions': submissions,
-            'total': len(submissions)
+            'total': len(submissions),
+            'next_cursor': next_cursor
         }, default=str)
     }
 
+def fetch_pending_page(conn, query: str, alias: str, body: Dict) -> Optional[tuple]:
+    """
+    Страница ожидающих заявок по курсору (submitted_at, id) - короткий проход по индексу (status, submitted_at, id).
+    Без limit и cursor - весь список, как раньше. Возвращает (строки, next_cursor) или None при некорректном курсоре
+    """
+    limit = None
+    if body.get('limit') or body.get('cursor'):
+        try:
+            limit = max(1, min(int(body.get('limit', QUEUE_PAGE_SIZE)), MAX_QUEUE_PAGE_SIZE))
+        except (TypeError, ValueError):
+            limit = QUEUE_PAGE_SIZE
+    
+    params: List[Any] = []
+    if body.get('cursor'):
+        after = decode_cursor(body['cursor'], ['timestamp', 'id'])
+        if after is None:
+            return None
+        query += f' AND ({alias}.submitted_at, {alias}.id) < (%s::timestamp, %s)'
+        params.extend(after)
+    
+    query += f' ORDER BY {alias}.submitted_at DESC, {alias}.id DESC'
+    if limit:
+        query += ' LIMIT %s'
+        params.append(limit + 1)
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(query, params)
+    rows = [dict(r) for r in cursor.fetchall()]
+    cursor.close()
+    
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]['submitted_at'].isoformat(), rows[-1]['id']])
+    return rows, next_cursor
+
 def approve_submission(body: Dict, conn, headers: Dict, user_id: str) -> Dict[str, Any]:
-    """Одобрение заявки на добавление тайтла"""
+    """Одобрение заявки на добавление тайтла (submission_ids - пакетом)"""
+    if body.get('submission_ids') is not None:
+        return bulk_approve_submissions(body, conn, headers, user_id)
+    
     submission_id = body.get('submission_id')
     
     if not submission_id:
@@ -625,8 +1788,14 @@ def approve_submission(body: Dict, conn, headers: Dict, user_id: str) -> Dict[st
     
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
-    # Получаем заявку
-    cursor.execute(f"SELECT * FROM manhwa_submissions WHERE id = {submission_id}")
+    # Заявка блокируется до коммита: статус и аренда проверяются под блокировкой,
+    # параллельное одобрение той же заявки ждет и видит уже новый статус
+    cursor.execute(f"""
+        SELECT *, {LEASE_CONFLICT_SQL.format(t='', user='%s')} AS leased
+        FROM manhwa_submissions
+        WHERE id = %s
+        FOR UPDATE
+    """, (user_id, submission_id))
     submission = cursor.fetchone()
     
     if not submission:
@@ -643,17 +1812,23 @@ def approve_submission(body: Dict, conn, headers: Dict, user_id: str) -> Dict[st
             'body': json.dumps({'error': f'Submission already {submission["status"]}'})
         }
     
-    # Проверка дубликатов
-    if check_duplicate_title(conn, submission['title'], submission.get('alternative_titles')):
+    if submission['leased']:
+        return lease_conflict_response(headers)
+    
+    # Проверка дубликатов: все названия заявки одним запросом
+    similar = find_duplicate_titles(
+        conn, submission_title_names(submission['title'], submission.get('alternative_titles'))
+    )
+    if similar and similar[0]['score'] >= DUPLICATE_REJECT_SCORE:
         # Автоматический отказ
         cursor.execute(
             """UPDATE manhwa_submissions 
                SET status = 'rejected', 
-                   rejection_reason = 'Duplicate title detected',
+                   rejection_reason = %s,
                    moderator_id = %s,
                    moderated_at = CURRENT_TIMESTAMP
                WHERE id = %s""",
-            (user_id, submission_id)
+            (f"Duplicate title detected: #{similar[0]['manhwa_id']} {similar[0]['title']}", user_id, submission_id)
         )
         conn.commit()
         cursor.close()
@@ -663,8 +1838,9 @@ def approve_submission(body: Dict, conn, headers: Dict, user_id: str) -> Dict[st
             'headers': headers,
             'body': json.dumps({
                 'error': 'Duplicate title detected',
-                'message': 'Заявка автоматически отклонена - тайтл уже существует'
-            })
+                'message': 'Заявка автоматически отклонена - тайтл уже существует',
+                'matches': similar
+            }, ensure_ascii=False)
         }
     
     # Создаем манхву
@@ -683,16 +1859,15 @@ def approve_submission(body: Dict, conn, headers: Dict, user_id: str) -> Dict[st
                manhwa_id = %s,
                moderator_id = %s,
                moderated_at = CURRENT_TIMESTAMP
-           WHERE id = %s""",
+           WHERE id = %s AND status = 'pending'""",
         (manhwa_id, user_id, submission_id)
     )
     
-    conn.commit()
-    
     # Логируем
     log_change(conn, 'manhwa', manhwa_id, 'created', user_id, 
                f'Approved submission #{submission_id}')
     
+    conn.commit()
     cursor.close()
     
     return {
@@ -700,12 +1875,16 @@ def approve_submission(body: Dict, conn, headers: Dict, user_id: str) -> Dict[st
         'headers': headers,
         'body': json.dumps({
             'message': 'Submission approved',
-            'manhwa_id': manhwa_id
-        })
+            'manhwa_id': manhwa_id,
+            'similar_titles': similar
+        }, ensure_ascii=False)
     }
 
 def reject_submission(body: Dict, conn, headers: Dict, user_id: str) -> Dict[str, Any]:
-    """Отклонение заявки"""
+    """Отклонение заявки (submission_ids - пакетом)"""
+    if body.get('submission_ids') is not None:
+        return bulk_reject_submissions(body, conn, headers, user_id)
+    
     submission_id = body.get('submission_id')
     reason = body.get('reason', 'Not specified')
     
@@ -718,43 +1897,266 @@ def reject_submission(body: Dict, conn, headers: Dict, user_id: str) -> Dict[str
     
     cursor = conn.cursor()
     cursor.execute(
-        """UPDATE manhwa_submissions 
+        f"""UPDATE manhwa_submissions 
            SET status = 'rejected',
                rejection_reason = %s,
                moderator_id = %s,
                moderated_at = CURRENT_TIMESTAMP
-           WHERE id = %s AND status = 'pending'""",
-        (reason, user_id, submission_id)
+           WHERE id = %s AND status = 'pending' AND NOT {LEASE_CONFLICT_SQL.format(t='', user='%s')}""",
+        (reason, user_id, submission_id, user_id)
     )
+    rejected = cursor.rowcount
     conn.commit()
     cursor.close()
     
+    if not rejected and lease_conflict(conn, 'manhwa_submissions', submission_id, user_id):
+        return lease_conflict_response(headers)
+    
     return {
         'statusCode': 200,
         'headers': headers,
         'body': json.dumps({'message': 'Submission rejected'})
     }
 
-def get_translator_requests(conn, headers: Dict) -> Dict[str, Any]:
-    """Получение запросов на смену переводчика"""
+def parse_submission_ids(body: Dict) -> Optional[List[int]]:
+    """Список id заявок пакетной операции без повторов, с сохранением порядка; None - список некорректен"""
+    ids = body.get('submission_ids')
+    if not isinstance(ids, list) or not ids or len(ids) > MAX_BULK_SUBMISSIONS:
+        return None
+    try:
+        return list(dict.fromkeys(int(submission_id) for submission_id in ids))
+    except (TypeError, ValueError):
+        return None
+
+def log_changes(conn, rows: List[tuple]):
+    """Несколько записей истории одним INSERT в транзакции изменения; rows - как аргументы log_change"""
+    rows = [(entity_type, entity_id, action, user_id or 'system', changes)
+            for entity_type, entity_id, action, user_id, changes in rows]
+    if not rows:
+        return
+    if isinstance(conn, BatchConnection) and conn.atomic:
+        conn.logs.extend(rows)
+        return
+    
+    cursor = conn.cursor()
+    execute_values(
+        cursor,
+        "INSERT INTO change_history (entity_type, entity_id, action, user_id, changes) VALUES %s",
+        rows
+    )
+    cursor.close()
+
+def bulk_approve_submissions(body: Dict, conn, headers: Dict, user_id: str) -> Dict[str, Any]:
+    """
+    Пакетное одобрение: дубликаты для всех заявок - одним запросом, манхвы - одним многострочным INSERT
+    с заранее выделенными id, заявки - одним UPDATE ... FROM (VALUES ...), все в одной транзакции
+    """
+    submission_ids = parse_submission_ids(body)
+    if submission_ids is None:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': f'submission_ids must be a list of 1..{MAX_BULK_SUBMISSIONS} integers'})
+        }
+    
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
-    cursor.execute("""
+    # Блокировка строк не дает параллельному модератору обработать те же заявки
+    cursor.execute(f"""
+        SELECT id, title, alternative_titles, description, cover_url, status,
+               {LEASE_CONFLICT_SQL.format(t='', user='%s')} AS leased
+        FROM manhwa_submissions
+        WHERE id = ANY(%s)
+        ORDER BY id
+        FOR UPDATE
+    """, (user_id, submission_ids))
+    submissions = {row['id']: row for row in cursor.fetchall()}
+    pending = [submissions[i] for i in submission_ids
+               if i in submissions and submissions[i]['status'] == 'pending' and not submissions[i]['leased']]
+    
+    # Как в approve_submission: от DUPLICATE_REJECT_SCORE - отказ, более слабые совпадения - в ответ модератору
+    similar: Dict[int, List[Dict[str, Any]]] = {}
+    if pending:
+        pairs = [(s['id'], name) for s in pending
+                 for name in submission_title_names(s['title'], s.get('alternative_titles'))]
+        cursor.execute(
+            "SELECT set_config('pg_trgm.similarity_threshold', %s, true)",
+            (str(DUPLICATE_CANDIDATE_SCORE),)
+        )
+        cursor.execute(BULK_DUPLICATE_QUERY, {
+            'submission_ids': [pair[0] for pair in pairs],
+            'names': [pair[1] for pair in pairs],
+            'min_score': DUPLICATE_CANDIDATE_SCORE
+        })
+        for row in cursor.fetchall():
+            match = dict(row)
+            match['score'] = round(float(match['score']), 3)
+            similar.setdefault(match.pop('submission_id'), []).append(match)
+    
+    duplicates: Dict[int, Dict[str, Any]] = {}
+    for submission_id, matches in similar.items():
+        matches.sort(key=lambda m: (-m['score'], m['manhwa_id'] or 0, m['duplicate_of_submission'] or 0))
+        del matches[DUPLICATE_MATCH_LIMIT:]
+        if matches[0]['score'] >= DUPLICATE_REJECT_SCORE:
+            duplicates[submission_id] = matches[0]
+    
+    to_approve = [s for s in pending if s['id'] not in duplicates]
+    
+    # id манхв выделяются заранее: связь заявка -> манхва известна до INSERT и не зависит от порядка RETURNING
+    manhwa_ids: Dict[int, int] = {}
+    if to_approve:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence('manhwa', 'id')) AS id FROM generate_series(1, %s)",
+            (len(to_approve),)
+        )
+        manhwa_ids = {s['id']: row['id'] for s, row in zip(to_approve, cursor.fetchall())}
+        execute_values(
+            cursor,
+            "INSERT INTO manhwa (id, title, description, cover_url, status, created_at) VALUES %s",
+            [(manhwa_ids[s['id']], s['title'], s.get('description'), s.get('cover_url')) for s in to_approve],
+            template="(%s, %s, %s, %s, 'ongoing', CURRENT_TIMESTAMP)",
+            page_size=MAX_BULK_SUBMISSIONS
+        )
+    
+    updates = [(s['id'], 'approved', manhwa_ids[s['id']], None) for s in to_approve] + [
+        (s['id'], 'rejected', None, f"Duplicate title detected: {describe_duplicate(duplicates[s['id']])}")
+        for s in pending if s['id'] in duplicates
+    ]
+    if updates:
+        execute_values(cursor, """
+            UPDATE manhwa_submissions s
+            SET status = v.status,
+                manhwa_id = v.manhwa_id,
+                rejection_reason = v.reason,
+                moderator_id = v.moderator_id,
+                moderated_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(id, status, manhwa_id, reason, moderator_id)
+            WHERE s.id = v.id AND s.status = 'pending'
+        """, [update + (user_id,) for update in updates],
+            template='(%s::integer, %s, %s::integer, %s, %s)', page_size=MAX_BULK_SUBMISSIONS)
+    
+    log_changes(conn, [('manhwa', manhwa_ids[s['id']], 'created', user_id, f'Approved submission #{s["id"]}')
+                       for s in to_approve])
+    
+    conn.commit()
+    cursor.close()
+    
+    results = []
+    for submission_id in submission_ids:
+        submission = submissions.get(submission_id)
+        if not submission:
+            results.append({'submission_id': submission_id, 'outcome': 'not_found'})
+        elif submission['status'] != 'pending':
+            results.append({'submission_id': submission_id, 'outcome': f'already_{submission["status"]}'})
+        elif submission['leased']:
+            results.append({'submission_id': submission_id, 'outcome': 'claimed_by_other'})
+        elif submission_id in duplicates:
+            results.append({'submission_id': submission_id, 'outcome': 'rejected_duplicate',
+                            'match': duplicates[submission_id]})
+        else:
+            results.append({'submission_id': submission_id, 'outcome': 'approved',
+                            'manhwa_id': manhwa_ids[submission_id],
+                            'similar_titles': similar.get(submission_id, [])})
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'approved': len(to_approve),
+            'rejected_duplicates': len(duplicates),
+            'skipped': len(submission_ids) - len(pending),
+            'results': results
+        }, ensure_ascii=False)
+    }
+
+def describe_duplicate(match: Dict[str, Any]) -> str:
+    if match.get('manhwa_id'):
+        return f"#{match['manhwa_id']} {match['title']}"
+    return f"submission #{match['duplicate_of_submission']} in the same batch"
+
+def bulk_reject_submissions(body: Dict, conn, headers: Dict, user_id: str) -> Dict[str, Any]:
+    """Пакетное отклонение одним UPDATE ... FROM (VALUES ...); reasons - причины по id поверх общей reason"""
+    submission_ids = parse_submission_ids(body)
+    if submission_ids is None:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': f'submission_ids must be a list of 1..{MAX_BULK_SUBMISSIONS} integers'})
+        }
+    
+    reason = body.get('reason', 'Not specified')
+    reasons = body.get('reasons') or {}
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    # Прежние статусы читаются в том же запросе: CTE видит строки до UPDATE
+    rows = execute_values(cursor, f"""
+        WITH v(id, reason, moderator_id) AS (VALUES %s),
+        updated AS (
+            UPDATE manhwa_submissions s
+            SET status = 'rejected',
+                rejection_reason = v.reason,
+                moderator_id = v.moderator_id,
+                moderated_at = CURRENT_TIMESTAMP
+            FROM v
+            WHERE s.id = v.id AND s.status = 'pending'
+              AND NOT {LEASE_CONFLICT_SQL.format(t='s.', user='v.moderator_id')}
+            RETURNING s.id
+        )
+        SELECT v.id, s.status AS previous_status, u.id IS NOT NULL AS rejected
+        FROM v
+        LEFT JOIN manhwa_submissions s ON s.id = v.id
+        LEFT JOIN updated u ON u.id = v.id
+    """, [(submission_id, str(reasons.get(str(submission_id), reason)), user_id) for submission_id in submission_ids],
+        template='(%s::integer, %s, %s::varchar)', fetch=True, page_size=MAX_BULK_SUBMISSIONS)
+    conn.commit()
+    cursor.close()
+    
+    outcomes = {row['id']: row for row in rows}
+    results = []
+    for submission_id in submission_ids:
+        row = outcomes[submission_id]
+        if row['rejected']:
+            outcome = 'rejected'
+        elif row['previous_status'] is None:
+            outcome = 'not_found'
+        elif row['previous_status'] == 'pending':
+            outcome = 'claimed_by_other'
+        else:
+            outcome = f'already_{row["previous_status"]}'
+        results.append({'submission_id': submission_id, 'outcome': outcome})
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'rejected': sum(1 for r in results if r['outcome'] == 'rejected'),
+            'results': results
+        })
+    }
+
+def get_translator_requests(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
+    """Получение запросов на смену переводчика, новые сначала, страницами по курсору"""
+    page = fetch_pending_page(conn, """
         SELECT tr.*, m.title as manhwa_title
         FROM translator_change_requests tr
         JOIN manhwa m ON tr.manhwa_id = m.id
         WHERE tr.status = 'pending'
-        ORDER BY tr.submitted_at DESC
-    """)
-    requests = [dict(r) for r in cursor.fetchall()]
-    cursor.close()
+    """, 'tr', body)
+    if page is None:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'invalid cursor'})
+        }
+    requests, next_cursor = page
     
     return {
         'statusCode': 200,
         'headers': headers,
         'body': json.dumps({
             'requests': requests,
-            'total': len(requests)
+            'total': len(requests),
+            'next_cursor': next_cursor
         }, default=str)
     }
 
@@ -771,7 +2173,12 @@ def approve_translator_change(body: Dict, conn, headers: Dict, user_id: str) ->
     
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
-    cursor.execute(f"SELECT * FROM translator_change_requests WHERE id = {request_id}")
+    cursor.execute(f"""
+        SELECT *, {LEASE_CONFLICT_SQL.format(t='', user='%s')} AS leased
+        FROM translator_change_requests
+        WHERE id = %s
+        FOR UPDATE
+    """, (user_id, request_id))
     request = cursor.fetchone()
     
     if not request or request['status'] != 'pending':
@@ -781,6 +2188,9 @@ def approve_translator_change(body: Dict, conn, headers: Dict, user_id: str) ->
             'body': json.dumps({'error': 'Invalid request'})
         }
     
+    if request['leased']:
+        return lease_conflict_response(headers)
+    
     # Обновляем команду в manhwa (если есть связь)
     # Здесь может быть логика обновления team_id
     
@@ -789,14 +2199,14 @@ def approve_translator_change(body: Dict, conn, headers: Dict, user_id: str) ->
            SET status = 'approved',
                moderator_id = %s,
                moderated_at = CURRENT_TIMESTAMP
-           WHERE id = %s""",
+           WHERE id = %s AND status = 'pending'""",
         (user_id, request_id)
     )
-    conn.commit()
     
     log_change(conn, 'translator_request', request_id, 'approved', user_id,
                f'Changed translator for manhwa {request["manhwa_id"]}')
     
+    conn.commit()
     cursor.close()
     
     return {
@@ -812,52 +2222,291 @@ def reject_translator_change(body: Dict, conn, headers: Dict, user_id: str) -> D
     
     cursor = conn.cursor()
     cursor.execute(
-        """UPDATE translator_change_requests
+        f"""UPDATE translator_change_requests
            SET status = 'rejected',
                moderator_id = %s,
                moderated_at = CURRENT_TIMESTAMP
-           WHERE id = %s AND status = 'pending'""",
-        (user_id, request_id)
+           WHERE id = %s AND status = 'pending' AND NOT {LEASE_CONFLICT_SQL.format(t='', user='%s')}""",
+        (user_id, request_id, user_id)
     )
+    rejected = cursor.rowcount
     conn.commit()
     cursor.close()
     
+    if not rejected and lease_conflict(conn, 'translator_change_requests', request_id, user_id):
+        return lease_conflict_response(headers)
+    
     return {
         'statusCode': 200,
         'headers': headers,
         'body': json.dumps({'message': 'Translator change rejected'})
     }
 
+def parse_queue_request(body: Dict, user_id: Optional[str]) -> tuple:
+    """Очередь и id заявок команды аренды: (config, ids или None - все свои, None) или (None, None, текст ошибки)"""
+    queue = MODERATION_QUEUES.get(body.get('queue', 'submissions'))
+    if not queue:
+        return None, None, f'queue must be one of: {", ".join(MODERATION_QUEUES)}'
+    if not user_id:
+        return None, None, 'X-User-Id required to claim moderation items'
+    
+    ids = body.get('ids')
+    if ids is not None:
+        try:
+            ids = [int(item_id) for item_id in ids]
+        except (TypeError, ValueError):
+            return None, None, 'ids must be a list of integers'
+    return queue, ids, None
+
+def parse_lease_seconds(body: Dict) -> int:
+    try:
+        return max(30, min(int(body.get('lease_seconds', CLAIM_LEASE_SECONDS)), MAX_CLAIM_LEASE_SECONDS))
+    except (TypeError, ValueError):
+        return CLAIM_LEASE_SECONDS
+
+def claim_queue(body: Dict, conn, headers: Dict, user_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Забрать пачку ожидающих заявок в аренду, старые сначала. FOR UPDATE SKIP LOCKED пропускает строки,
+    которые в этот момент забирает другой модератор, а условие на аренду - уже выданные: параллельные
+    модераторы получают разные заявки. Собственные аренды модератора выдаются повторно и продлеваются
+    """
+    queue, _, error = parse_queue_request(body, user_id)
+    if error:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': error})
+        }
+    
+    try:
+        limit = max(1, min(int(body.get('limit', CLAIM_BATCH_SIZE)), MAX_CLAIM_BATCH))
+    except (TypeError, ValueError):
+        limit = CLAIM_BATCH_SIZE
+    lease_seconds = parse_lease_seconds(body)
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(f"""
+        WITH picked AS (
+            SELECT id FROM {queue['table']}
+            WHERE {queue['status']} = 'pending'
+              AND (claim_expires_at IS NULL OR claim_expires_at <= CURRENT_TIMESTAMP OR claimed_by = %(user_id)s)
+            ORDER BY {queue['order']}, id
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE {queue['table']} q
+        SET claimed_by = %(user_id)s,
+            claim_expires_at = CURRENT_TIMESTAMP + make_interval(secs => %(lease)s)
+        FROM picked
+        WHERE q.id = picked.id
+        RETURNING q.*
+    """, {'user_id': user_id, 'limit': limit, 'lease': lease_seconds})
+    items = sorted((dict(row) for row in cursor.fetchall()), key=lambda row: (row[queue['order']], row['id']))
+    conn.commit()
+    cursor.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'queue': body.get('queue', 'submissions'),
+            'items': items,
+            'claimed': len(items),
+            'lease_seconds': lease_seconds
+        }, default=str, ensure_ascii=False)
+    }
+
+def heartbeat_queue(body: Dict, conn, headers: Dict, user_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Продлить аренду своих заявок (ids - выбранных, по умолчанию всех). Заявка, которую после истечения
+    аренды забрал другой модератор или по которой уже принято решение, возвращается в lost
+    """
+    queue, ids, error = parse_queue_request(body, user_id)
+    if error:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': error})
+        }
+    
+    lease_seconds = parse_lease_seconds(body)
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(f"""
+        UPDATE {queue['table']}
+        SET claim_expires_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+        WHERE claimed_by = %s AND {queue['status']} = 'pending'
+          {'AND id = ANY(%s::int[])' if ids is not None else ''}
+        RETURNING id, claim_expires_at
+    """, [lease_seconds, user_id] + ([ids] if ids is not None else []))
+    extended = [dict(row) for row in cursor.fetchall()]
+    conn.commit()
+    cursor.close()
+    
+    extended_ids = {row['id'] for row in extended}
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'extended': extended,
+            'lost': [i for i in (ids or []) if i not in extended_ids],
+            'lease_seconds': lease_seconds
+        }, default=str)
+    }
+
+def release_queue(body: Dict, conn, headers: Dict, user_id: Optional[str]) -> Dict[str, Any]:
+    """Вернуть свои заявки в очередь (ids - выбранные, по умолчанию все) - их сразу может забрать другой модератор"""
+    queue, ids, error = parse_queue_request(body, user_id)
+    if error:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': error})
+        }
+    
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        UPDATE {queue['table']}
+        SET claimed_by = NULL, claim_expires_at = NULL
+        WHERE claimed_by = %s AND {queue['status']} = 'pending'
+          {'AND id = ANY(%s::int[])' if ids is not None else ''}
+        RETURNING id
+    """, [user_id] + ([ids] if ids is not None else []))
+    released = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+    cursor.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({'released': released})
+    }
+
+def lease_conflict(conn, table: str, item_id: int, user_id: Optional[str]) -> bool:
+    """Заявка под действующей арендой другого модератора"""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT {LEASE_CONFLICT_SQL.format(t='', user='%s')} FROM {table} WHERE id = %s",
+        (user_id, item_id)
+    )
+    row = cursor.fetchone()
+    cursor.close()
+    return bool(row and row[0])
+
+def lease_conflict_response(headers: Dict) -> Dict[str, Any]:
+    return {
+        'statusCode': 409,
+        'headers': headers,
+        'body': json.dumps({'error': 'Claimed by another moderator'})
+    }
+
 def get_change_history(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
-    """История изменений для конкретной сущности"""
+    """
+    История изменений сущности или всего сайта, новые сначала. Страницы по курсору (created_at, id):
+    каждая страница - короткий проход по индексу, а условие на created_at отсекает лишние месячные секции
+    """
     entity_type = body.get('entity_type')
     entity_id = body.get('entity_id')
-    limit = body.get('limit', 50)
     
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        limit = max(1, min(int(body.get('limit', HISTORY_PAGE_SIZE)), MAX_HISTORY_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = HISTORY_PAGE_SIZE
     
+    filters = []
+    params: List[Any] = []
     if entity_type and entity_id:
-        cursor.execute(
-            f"""SELECT * FROM change_history 
-                WHERE entity_type = '{entity_type}' AND entity_id = {entity_id}
-                ORDER BY created_at DESC 
-                LIMIT {limit}"""
-        )
-    else:
-        cursor.execute(
-            f"""SELECT * FROM change_history 
-                ORDER BY created_at DESC 
-                LIMIT {limit}"""
-        )
+        filters.append('entity_type = %s AND entity_id = %s')
+        params.extend([entity_type, entity_id])
     
+    if body.get('cursor'):
+        after = decode_cursor(body['cursor'], ['timestamp', 'id'])
+        if after is None:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'invalid cursor'})
+            }
+        filters.append('(created_at, id) < (%s::timestamp, %s)')
+        params.extend(after)
+    
+    params.append(limit + 1)
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute(f"""
+        SELECT * FROM change_history
+        {'WHERE ' + ' AND '.join(filters) if filters else ''}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, params)
     history = [dict(h) for h in cursor.fetchall()]
     cursor.close()
     
+    next_cursor = None
+    if len(history) > limit:
+        history = history[:limit]
+        last = history[-1]
+        next_cursor = encode_cursor([last['created_at'].isoformat(), last['id']])
+    
     return {
         'statusCode': 200,
         'headers': headers,
         'body': json.dumps({
             'history': history,
-            'total': len(history)
+            'total': len(history),
+            'next_cursor': next_cursor
         }, default=str)
-    }
\ No newline at end of file
+    }
+
+def maintain_history_partitions(body: Dict, conn, headers: Dict) -> Dict[str, Any]:
+    """Команда: месячные секции change_history на months_ahead месяцев вперед (V0024)"""
+    months_ahead = max(0, min(int(body.get('months_ahead', HISTORY_PARTITIONS_AHEAD)), 24))
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    cursor.execute("SELECT ensure_change_history_partitions(%s) AS created", (months_ahead,))
+    created = cursor.fetchone()['created']
+    cursor.execute("SELECT COUNT(*) AS total FROM change_history_default")
+    unpartitioned = cursor.fetchone()['total']
+    conn.commit()
+    cursor.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'created': created,
+            'months_ahead': months_ahead,
+            'rows_in_default_partition': unpartitioned
+        })
+    }
+
+def encode_cursor(values: List[Any]) -> str:
+    """Курсор keyset-пагинации: значения ключа сортировки последней строки страницы"""
+    raw = json.dumps(values, default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def cursor_value(value: Any, kind: Optional[str]) -> Any:
+    """Значение курсора ожидаемого типа (number, timestamp, id, text; None - без проверки); ValueError - курсор испорчен"""
+    if kind is None:
+        return value
+    if kind in ('timestamp', 'text'):
+        if not isinstance(value, str):
+            raise ValueError(f'{kind} expected')
+        return datetime.fromisoformat(value) if kind == 'timestamp' else value
+    expected = int if kind == 'id' else (int, float)
+    if isinstance(value, bool) or not isinstance(value, expected) or not math.isfinite(value):
+        raise ValueError(f'{kind} expected')
+    return value
+
+def decode_cursor(cursor: str, kinds: List[Optional[str]]) -> Optional[List[Any]]:
+    """Значения курсора по типам ключей сортировки или None, если курсор некорректен"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(kinds):
+            return None
+        return [cursor_value(value, kind) for value, kind in zip(values, kinds)]
+    except (ValueError, TypeError):
+        return None
+        return [cursor_value(value, kind) for value, kind in zip(values, kinds)]
+    except (ValueError, TypeError):
+        return None
@@ -0,0 +1,481 @@
+"""
+Business: Импорт глав с внешних источников - адаптеры источников, параллельная загрузка с лимитами по хостам,
+          условные запросы (ETag/Last-Modified) и импорт только тех глав, которых еще нет в chapters
+Args: conn - подключение к БД; manhwa_id, source_url и параметры команд parse_chapters / sync_chapters
+Returns: ingest_chapters - сводка: сколько глав у источника, сколько уже есть, что импортировано и что не удалось
+
+Парсеры ссылок VK/Boosty повторяют upload-chapter: функции деплоятся отдельно и не делят код
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from urllib.parse import urljoin, urlsplit
+
+from psycopg2.extras import RealDictCursor, execute_values
+
+INGEST_CONCURRENCY = int(os.environ.get('INGEST_CONCURRENCY', '8'))
+# Запросов в секунду к одному хосту - источники банят за частые запросы
+INGEST_HOST_RATE = float(os.environ.get('INGEST_HOST_RATE', '4'))
+INGEST_TIMEOUT = 15
+INGEST_RETRIES = 2
+MAX_RESPONSE_BYTES = 5 * 1024 * 1024
+MAX_INGEST_CHAPTERS = 200
+MAX_CHAPTER_PAGES = 500
+USER_AGENT = 'ManhwaReaderBot/1.0'
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CHAPTER_NUMBER_PATTERN = re.compile(r'(?:глава|chapter|гл\.?|ch\.?)\s*(\d+)', re.IGNORECASE)
+
+class IngestError(Exception):
+    pass
+
+def parse_vk_url(url: str) -> Optional[Dict[str, Any]]:
+    vk_pattern = r'vk\.com/wall(-?\d+)_(\d+)'
+    match = re.search(vk_pattern, url)
+    if match:
+        return {'platform': 'vk', 'owner_id': match.group(1), 'post_id': match.group(2)}
+    return None
+
+def parse_boosty_url(url: str) -> Optional[Dict[str, Any]]:
+    boosty_pattern = r'boosty\.to/([^/]+)/posts/([^/?]+)'
+    match = re.search(boosty_pattern, url)
+    if match:
+        return {'platform': 'boosty', 'username': match.group(1), 'post_id': match.group(2)}
+    return None
+
+def safe_url(url: str) -> str:
+    """Адрес для сообщений об ошибках: без query и fragment - в них бывают токены (access_token VK)"""
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}{parts.path}' if parts.netloc else parts.path
+
+class Fetcher:
+    """
+    HTTP-клиент импорта: не больше concurrency запросов одновременно и не чаще host_rate в секунду к хосту.
+    Блокирующий urllib выполняется в собственном пуле потоков размером concurrency, очередность и паузы ведет asyncio
+    """
+
+    def __init__(self, concurrency: int = INGEST_CONCURRENCY, host_rate: float = INGEST_HOST_RATE,
+                 timeout: float = INGEST_TIMEOUT, retries: int = INGEST_RETRIES):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ingest')
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._host_next: Dict[str, float] = {}
+        self.min_interval = 1.0 / host_rate if host_rate > 0 else 0.0
+        self.timeout = timeout
+        self.retries = retries
+        self.requests = 0
+        self.not_modified = 0
+
+    async def _wait_for_host(self, host: str):
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            start = max(now, self._host_next.get(host, now))
+            self._host_next[host] = start + self.min_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            await self._wait_for_host(host)
+            async with self._semaphore:
+                self.requests += 1
+                response = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._request, url, headers or {}
+                )
+
+            if response['status'] in RETRY_STATUSES and attempt < self.retries:
+                retry_after = response['retry_after']
+                await asyncio.sleep(min(retry_after if retry_after is not None else 0.5 * 2 ** attempt, 10.0))
+                continue
+            if response['status'] == 304:
+                self.not_modified += 1
+            return response
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def get_json(self, url: str) -> Any:
+        response = await self.get(url)
+        if response['status'] != 200:
+            raise IngestError(f'{safe_url(url)}: HTTP {response["status"]}')
+        return parse_json(url, response['body'])
+
+    def _request(self, url: str, headers: Dict[str, str]) -> Dict[str, Any]:
+        request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT, 'Accept': 'application/json', **headers})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as raw:
+                status, response_headers = raw.status, raw.headers
+                body = raw.read(MAX_RESPONSE_BYTES + 1)
+        except urllib.error.HTTPError as e:
+            status, response_headers = e.code, e.headers
+            body = e.read(MAX_RESPONSE_BYTES + 1) if status != 304 else b''
+        except (urllib.error.URLError, OSError) as e:
+            raise IngestError(f'{safe_url(url)}: {getattr(e, "reason", e)}')
+
+        if len(body) > MAX_RESPONSE_BYTES:
+            raise IngestError(f'{safe_url(url)}: response larger than {MAX_RESPONSE_BYTES} bytes')
+
+        retry_after = response_headers.get('Retry-After') if response_headers else None
+        return {
+            'status': status,
+            'body': body,
+            'etag': response_headers.get('ETag') if response_headers else None,
+            'last_modified': response_headers.get('Last-Modified') if response_headers else None,
+            'retry_after': float(retry_after) if retry_after and retry_after.isdigit() else None,
+            'hash': hashlib.sha256(body).hexdigest()
+        }
+
+def parse_json(url: str, body: bytes) -> Any:
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise IngestError(f'{safe_url(url)}: invalid JSON')
+
+def page_urls(base_url: str, pages: Any) -> List[str]:
+    """Страницы главы: список строк, относительные адреса - от base_url"""
+    if not isinstance(pages, list):
+        raise IngestError(f'{safe_url(base_url)}: pages list not found')
+    return [urljoin(base_url, page) for page in pages if isinstance(page, str) and page]
+
+def chapter_number_from_text(text: Optional[str]) -> Optional[int]:
+    match = CHAPTER_NUMBER_PATTERN.search(text or '')
+    return int(match.group(1)) if match else None
+
+class JsonFeedAdapter:
+    """
+    Источник с JSON-лентой: {"chapters": [{"number": 12, "title": "...", "pages": [...]} | {"number": 12, "url": "..."}]}.
+    Страницы главы - в ленте или по url главы: {"pages": [...]} либо просто список
+    """
+
+    name = 'json_feed'
+
+    def matches(self, url: str) -> bool:
+        return urlsplit(url).scheme in ('http', 'https')
+
+    async def list_chapters(self, fetcher: Fetcher, url: str, headers: Dict[str, str],
+                            options: Dict[str, Any]) -> Dict[str, Any]:
+        response = await fetcher.get(url, headers)
+        if response['status'] == 304:
+            return {**response, 'chapters': []}
+        if response['status'] != 200:
+            raise IngestError(f'{safe_url(url)}: HTTP {response["status"]}')
+
+        feed = parse_json(url, response['body'])
+        items = feed.get('chapters') if isinstance(feed, dict) else feed
+        if not isinstance(items, list):
+            raise IngestError(f'{safe_url(url)}: chapters list not found')
+
+        chapters = []
+        for item in items:
+            if not isinstance(item, dict) or item.get('number') is None:
+                continue
+            chapters.append({
+                'number': item['number'],
+                'title': item.get('title'),
+                'url': urljoin(url, item['url']) if isinstance(item.get('url'), str) and item['url'] else None,
+                'pages': item.get('pages'),
+                'feed_url': url
+            })
+        return {**response, 'chapters': chapters}
+
+    async def fetch_pages(self, fetcher: Fetcher, chapter: Dict[str, Any]) -> List[str]:
+        # Страницы прямо в ленте проверяются так же, как полученные по url главы
+        if chapter.get('pages') is not None:
+            return page_urls(chapter['feed_url'], chapter['pages'])
+        if not chapter.get('url'):
+            return []
+        data = await fetcher.get_json(chapter['url'])
+        return page_urls(chapter['url'], data.get('pages') if isinstance(data, dict) else data)
+
+class VkPostAdapter:
+    """Пост VK - одна глава, страницы - фото вложений в наибольшем размере. Нужен VK_ACCESS_TOKEN"""
+
+    name = 'vk'
+    API_URL = 'https://api.vk.com/method/wall.getById'
+
+    def matches(self, url: str) -> bool:
+        return parse_vk_url(url) is not None
+
+    async def list_chapters(self, fetcher: Fetcher, url: str, headers: Dict[str, str],
+                            options: Dict[str, Any]) -> Dict[str, Any]:
+        token = os.environ.get('VK_ACCESS_TOKEN')
+        if not token:
+            raise IngestError('VK_ACCESS_TOKEN not configured')
+
+        parsed = parse_vk_url(url)
+        api_url = f'{self.API_URL}?posts={parsed["owner_id"]}_{parsed["post_id"]}&v=5.199&access_token={token}'
+        response = await fetcher.get(api_url)
+        if response['status'] != 200:
+            raise IngestError(f'VK API: HTTP {response["status"]}')
+
+        data = parse_json('VK API', response['body'])
+        if 'error' in data:
+            raise IngestError(f'VK API: {data["error"].get("error_msg")}')
+        items = data.get('response', {})
+        items = items.get('items', []) if isinstance(items, dict) else items
+        if not items:
+            raise IngestError('VK post not found')
+
+        post = items[0]
+        pages = []
+        for attachment in post.get('attachments', []):
+            if attachment.get('type') == 'photo':
+                sizes = attachment['photo'].get('sizes') or []
+                if sizes:
+                    pages.append(max(sizes, key=lambda s: s.get('width', 0) * s.get('height', 0))['url'])
+
+        number = options.get('chapter_number') or chapter_number_from_text(post.get('text'))
+        if number is None:
+            raise IngestError('chapter_number required: not found in post text')
+        return {**response, 'chapters': [{'number': number, 'title': options.get('title'), 'url': None, 'pages': pages}]}
+
+    async def fetch_pages(self, fetcher: Fetcher, chapter: Dict[str, Any]) -> List[str]:
+        return chapter.get('pages') or []
+
+class BoostyPostAdapter:
+    """Пост Boosty - одна глава, страницы - блоки-изображения поста; закрытые посты не импортируются"""
+
+    name = 'boosty'
+    API_URL = 'https://api.boosty.to/v1/blog/{username}/post/{post_id}'
+
+    def matches(self, url: str) -> bool:
+        return parse_boosty_url(url) is not None
+
+    async def list_chapters(self, fetcher: Fetcher, url: str, headers: Dict[str, str],
+                            options: Dict[str, Any]) -> Dict[str, Any]:
+        parsed = parse_boosty_url(url)
+        response = await fetcher.get(self.API_URL.format(**parsed), headers)
+        if response['status'] == 304:
+            return {**response, 'chapters': []}
+        if response['status'] != 200:
+            raise IngestError(f'Boosty API: HTTP {response["status"]}')
+
+        post = parse_json('Boosty API', response['body'])
+        if post.get('hasAccess') is False:
+            raise IngestError('Boosty post is not accessible')
+
+        pages = [block['url'] for block in post.get('data', []) if block.get('type') == 'image' and block.get('url')]
+        number = options.get('chapter_number') or chapter_number_from_text(post.get('title'))
+        if number is None:
+            raise IngestError('chapter_number required: not found in post title')
+        return {**response, 'chapters': [{
+            'number': number,
+            'title': options.get('title') or post.get('title'),
+            'url': None,
+            'pages': pages
+        }]}
+
+    async def fetch_pages(self, fetcher: Fetcher, chapter: Dict[str, Any]) -> List[str]:
+        return chapter.get('pages') or []
+
+# Порядок важен: JSON-лента принимает любой http(s)-адрес и стоит последней
+ADAPTERS = [VkPostAdapter(), BoostyPostAdapter(), JsonFeedAdapter()]
+
+def pick_adapter(url: str):
+    for adapter in ADAPTERS:
+        if adapter.matches(url):
+            return adapter
+    return None
+
+def read_validators(cursor, manhwa_id: int, url: str) -> Optional[Dict[str, Any]]:
+    cursor.execute(
+        "SELECT etag, last_modified, content_hash FROM ingest_http_cache WHERE manhwa_id = %s AND url = %s",
+        (manhwa_id, url)
+    )
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+def save_validators(cursor, manhwa_id: int, url: str, listing: Dict[str, Any]):
+    cursor.execute("""
+        INSERT INTO ingest_http_cache (manhwa_id, url, etag, last_modified, content_hash, fetched_at, validated_at)
+        VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        ON CONFLICT (manhwa_id, url) DO UPDATE
+        SET etag = EXCLUDED.etag,
+            last_modified = EXCLUDED.last_modified,
+            content_hash = EXCLUDED.content_hash,
+            fetched_at = EXCLUDED.fetched_at,
+            validated_at = EXCLUDED.validated_at
+    """, (manhwa_id, url, listing.get('etag'), listing.get('last_modified'), listing.get('hash')))
+
+def touch_validators(cursor, manhwa_id: int, url: str):
+    cursor.execute(
+        "UPDATE ingest_http_cache SET validated_at = CURRENT_TIMESTAMP WHERE manhwa_id = %s AND url = %s",
+        (manhwa_id, url)
+    )
+
+def feed_imported(cursor, manhwa_id: int, chapters: List[Dict[str, Any]]) -> bool:
+    """Все главы списка источника уже есть у манхвы (глава с дробным номером не импортируется - значит, нет)"""
+    numbers = set()
+    for chapter in chapters:
+        number = chapter['number']
+        if isinstance(number, bool) or not isinstance(number, (int, float)) or not float(number).is_integer():
+            return False
+        numbers.add(int(number))
+    if not numbers:
+        return True
+
+    cursor.execute(
+        "SELECT COUNT(*) AS found FROM chapters WHERE manhwa_id = %s AND chapter_number = ANY(%s)",
+        (manhwa_id, list(numbers))
+    )
+    return cursor.fetchone()['found'] == len(numbers)
+
+def select_new_chapters(cursor, manhwa_id: int, chapters: List[Dict[str, Any]], options: Dict[str, Any],
+                        skipped: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Главы источника, которых нет в chapters: одна выборка по списку номеров"""
+    start, end = options.get('start_chapter'), options.get('end_chapter')
+    wanted: Dict[int, Dict[str, Any]] = {}
+    for chapter in chapters:
+        number = chapter['number']
+        if not isinstance(number, int) or isinstance(number, bool):
+            if isinstance(number, float) and number.is_integer():
+                number = int(number)
+            else:
+                skipped.append({'chapter_number': number, 'error': 'only integer chapter numbers are supported'})
+                continue
+        if (start is not None and number < start) or (end is not None and number > end):
+            continue
+        wanted.setdefault(number, dict(chapter, number=number))
+
+    cursor.execute(
+        "SELECT chapter_number FROM chapters WHERE manhwa_id = %s AND chapter_number = ANY(%s)",
+        (manhwa_id, list(wanted))
+    )
+    existing = {row['chapter_number'] for row in cursor.fetchall()}
+    missing = [wanted[number] for number in sorted(wanted) if number not in existing]
+
+    return {
+        'in_range': len(wanted),
+        'existing': len(existing),
+        'new': missing[:MAX_INGEST_CHAPTERS],
+        'remaining': max(len(missing) - MAX_INGEST_CHAPTERS, 0)
+    }
+
+async def collect_chapters(cursor, adapter, manhwa_id: int, source_url: str, validators: Optional[Dict[str, Any]],
+                           options: Dict[str, Any]) -> Dict[str, Any]:
+    """Сетевая часть импорта: список глав (условным запросом) и страницы новых глав параллельно"""
+    fetcher = Fetcher()
+    try:
+        return await collect_with(fetcher, cursor, adapter, manhwa_id, source_url, validators, options)
+    finally:
+        fetcher.close()
+
+async def collect_with(fetcher: Fetcher, cursor, adapter, manhwa_id: int, source_url: str,
+                       validators: Optional[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Any]:
+    request_headers = {}
+    if validators:
+        if validators.get('etag'):
+            request_headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            request_headers['If-Modified-Since'] = validators['last_modified']
+
+    listing = await adapter.list_chapters(fetcher, source_url, request_headers, options)
+    not_modified = listing['status'] == 304 or bool(
+        validators and validators.get('content_hash') and validators['content_hash'] == listing['hash']
+    )
+    result = {'listing': listing, 'not_modified': not_modified, 'fetcher': fetcher, 'pages': {}, 'failed': [],
+              'diff': {'in_range': 0, 'existing': 0, 'new': [], 'remaining': 0}}
+    if not_modified:
+        return result
+
+    result['diff'] = select_new_chapters(cursor, manhwa_id, listing['chapters'], options, result['failed'])
+    new_chapters = result['diff']['new']
+
+    pages = await asyncio.gather(
+        *[adapter.fetch_pages(fetcher, chapter) for chapter in new_chapters],
+        return_exceptions=True
+    )
+    for chapter, chapter_pages in zip(new_chapters, pages):
+        if isinstance(chapter_pages, Exception):
+            result['failed'].append({'chapter_number': chapter['number'], 'error': str(chapter_pages)})
+        elif not chapter_pages:
+            result['failed'].append({'chapter_number': chapter['number'], 'error': 'no pages'})
+        elif len(chapter_pages) > MAX_CHAPTER_PAGES:
+            result['failed'].append({'chapter_number': chapter['number'],
+                                     'error': f'more than {MAX_CHAPTER_PAGES} pages'})
+        else:
+            result['pages'][chapter['number']] = chapter_pages
+    return result
+
+def insert_chapters(cursor, manhwa_id: int, chapters: List[Dict[str, Any]],
+                    pages: Dict[int, List[str]]) -> List[Dict[str, Any]]:
+    """Главы и их страницы двумя многострочными INSERT; главу, добавленную параллельно, пропускает ON CONFLICT"""
+    if not chapters:
+        return []
+
+    inserted = execute_values(cursor, """
+        INSERT INTO chapters (manhwa_id, chapter_number, title, created_at)
+        VALUES %s
+        ON CONFLICT (manhwa_id, chapter_number) DO NOTHING
+        RETURNING id, chapter_number
+    """, [(manhwa_id, c['number'], (c.get('title') or f'Глава {c["number"]}')[:255]) for c in chapters],
+        template='(%s, %s, %s, CURRENT_TIMESTAMP)', fetch=True)
+
+    imported = [{'chapter_id': row['id'], 'chapter_number': row['chapter_number'],
+                 'pages': len(pages[row['chapter_number']])} for row in inserted]
+    page_rows = [(row['id'], index, url)
+                 for row in inserted
+                 for index, url in enumerate(pages[row['chapter_number']], start=1)]
+    if page_rows:
+        execute_values(cursor, "INSERT INTO pages (chapter_id, page_number, image_url) VALUES %s",
+                       page_rows, page_size=1000)
+
+    return sorted(imported, key=lambda c: c['chapter_number'])
+
+def ingest_chapters(conn, manhwa_id: int, source_url: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Импорт новых глав источника в текущей транзакции (коммитит вызывающий).
+    options: conditional - условный запрос по сохраненным валидаторам, dry_run - только показать разницу,
+    start_chapter/end_chapter - диапазон, chapter_number/title - для источников-постов (VK, Boosty)
+    """
+    adapter = pick_adapter(source_url)
+    if not adapter:
+        raise IngestError('Unsupported source URL')
+
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    validators = read_validators(cursor, manhwa_id, source_url) if options.get('conditional') else None
+
+    started = time.monotonic()
+    collected = asyncio.run(collect_chapters(cursor, adapter, manhwa_id, source_url, validators, options))
+    diff = collected['diff']
+
+    imported = []
+    if not options.get('dry_run'):
+        chapters = [c for c in diff['new'] if c['number'] in collected['pages']]
+        imported = insert_chapters(cursor, manhwa_id, chapters, collected['pages'])
+
+        # Валидаторы сохраняются, только когда источник импортирован целиком - иначе 304 спрятал бы недоимпортированное:
+        # не после импорта диапазона и только если у манхвы есть все главы списка
+        narrowed = options.get('start_chapter') is not None or options.get('end_chapter') is not None
+        if collected['not_modified']:
+            touch_validators(cursor, manhwa_id, source_url)
+        elif (not narrowed and not collected['failed'] and not diff['remaining']
+              and feed_imported(cursor, manhwa_id, collected['listing']['chapters'])):
+            save_validators(cursor, manhwa_id, source_url, collected['listing'])
+
+    cursor.close()
+
+    return {
+        'source': adapter.name,
+        'not_modified': collected['not_modified'],
+        'found': len(collected['listing']['chapters']),
+        'in_range': diff['in_range'],
+        'existing': diff['existing'],
+        'new': [c['number'] for c in diff['new']],
+        'imported': imported,
+        'failed': collected['failed'],
+        'remaining': diff['remaining'],
+        'dry_run': bool(options.get('dry_run')),
+        'requests': collected['fetcher'].requests,
+        'elapsed_ms': round((time.monotonic() - started) * 1000)
+    }
@@ -0,0 +1,126 @@
+"""
+Business: Кэш ролей пользователей в памяти инстанса с коротким TTL и сбросом по NOTIFY из триггера user_roles (V0022)
+Args: dsn - строка подключения к БД для LISTEN; conn - подключение запроса для чтения роли при промахе
+Returns: RoleCache.role - роль пользователя или None
+"""
+
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+CHANNEL = 'user_roles_changed'
+
+ROLE_CACHE_TTL = float(os.environ.get('ROLE_CACHE_TTL', '30'))
+ROLE_CACHE_MAX_KEYS = 10000
+
+class RoleCache:
+    """
+    Роль читается из user_roles на подключении запроса и живет в памяти ttl секунд.
+    Изменение user_roles сразу сбрасывает запись через LISTEN; TTL ограничивает устаревание,
+    если слушатель отстал или переподключается
+    """
+
+    def __init__(self, dsn: str, ttl: float = ROLE_CACHE_TTL, max_keys: int = ROLE_CACHE_MAX_KEYS):
+        self.dsn = dsn
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._roles: OrderedDict = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._listen_forever, name='role-cache', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def role(self, conn, user_id: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._roles.get(user_id)
+            if cached and cached[1] > now:
+                self._roles.move_to_end(user_id)
+                self.hits += 1
+                return cached[0]
+            generation = self._generation
+            self.misses += 1
+
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor.execute("SELECT role FROM user_roles WHERE user_id = %s", (user_id,))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+        role = row['role'] if row else None
+
+        with self._lock:
+            # Сброс, пришедший во время чтения, мог относиться к этой строке - такое значение не кэшируется
+            if generation == self._generation:
+                self._roles[user_id] = (role, now + self.ttl)
+                self._roles.move_to_end(user_id)
+                while len(self._roles) > self.max_keys:
+                    self._roles.popitem(last=False)
+        return role
+
+    def invalidate(self, user_id: Optional[str] = None):
+        """Сброс одной записи или всего кэша (user_id=None)"""
+        with self._lock:
+            self._generation += 1
+            if user_id is None:
+                self._roles.clear()
+            else:
+                self._roles.pop(user_id, None)
+
+    def _listen_forever(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except psycopg2.Error:
+                # Уведомления за время переподключения потеряны - кэш сбрасывается целиком
+                self.invalidate()
+                self._stopped.wait(1.0)
+
+    def _listen(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'LISTEN {CHANNEL}')
+            # Изменения до начала прослушивания могли пройти мимо
+            self.invalidate()
+
+            while not self._stopped.is_set():
+                if select.select([conn], [], [], 5.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    self.invalidate(notification.payload or None)
+        finally:
+            conn.close()
+
+_cache: Optional[RoleCache] = None
+_cache_lock = threading.Lock()
+
+def get_role_cache(dsn: str) -> RoleCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RoleCache(dsn)
+        _cache.start()
+        return _cache
@@ -0,0 +1,257 @@
+"""
+Business: Ящик уведомлений пользователя - страницы уведомлений, счетчик непрочитанных и отметка прочтения
+Args: event - dict с httpMethod, headers (X-User-Id, If-None-Match), queryStringParameters, body
+      context - object с request_id
+Returns: HTTP response dict с уведомлениями или 304, если ящик не менялся
+"""
+
+import base64
+import json
+import math
+import os
+from typing import Dict, Any, List, Optional
+from datetime import datetime
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+def get_db_connection():
+    """Создает подключение к БД"""
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        raise Exception('DATABASE_URL not found')
+    return psycopg2.connect(dsn)
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_READ_BATCH = 500
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    # CORS headers
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, If-None-Match',
+        'Access-Control-Expose-Headers': 'ETag'
+    }
+
+    if method == 'OPTIONS':
+        return {'statusCode': 200, 'headers': headers, 'body': ''}
+
+    request_headers = event.get('headers', {}) or {}
+    user_id = request_headers.get('X-User-Id') or request_headers.get('x-user-id')
+
+    if not user_id:
+        return {
+            'statusCode': 401,
+            'headers': headers,
+            'body': json.dumps({'error': 'User ID required'})
+        }
+
+    try:
+        conn = get_db_connection()
+
+        if method == 'GET':
+            return get_inbox(event, conn, headers, user_id)
+        elif method == 'POST':
+            params = event.get('queryStringParameters') or {}
+            if params.get('action') != 'read':
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Unknown action, use ?action=read'})
+                }
+            return mark_read(event, conn, headers, user_id)
+        else:
+            return {
+                'statusCode': 405,
+                'headers': headers,
+                'body': json.dumps({'error': 'Method not allowed'})
+            }
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+def encode_cursor(values: List[Any]) -> str:
+    """Курсор keyset-пагинации: (created_at, id) последнего уведомления страницы"""
+    raw = json.dumps(values, default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def cursor_value(value: Any, kind: Optional[str]) -> Any:
+    """Значение курсора ожидаемого типа (number, timestamp, id, text; None - без проверки); ValueError - курсор испорчен"""
+    if kind is None:
+        return value
+    if kind in ('timestamp', 'text'):
+        if not isinstance(value, str):
+            raise ValueError(f'{kind} expected')
+        return datetime.fromisoformat(value) if kind == 'timestamp' else value
+    expected = int if kind == 'id' else (int, float)
+    if isinstance(value, bool) or not isinstance(value, expected) or not math.isfinite(value):
+        raise ValueError(f'{kind} expected')
+    return value
+
+def decode_cursor(cursor: str, kinds: List[Optional[str]]) -> Optional[List[Any]]:
+    """Значения курсора по типам ключей сортировки или None, если курсор некорректен"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(kinds):
+            return None
+        return [cursor_value(value, kind) for value, kind in zip(values, kinds)]
+    except (ValueError, TypeError):
+        return None
+
+def parse_limit(params: Dict[str, Any], default: int) -> int:
+    try:
+        limit = int(params.get('limit', default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def read_counter(cursor, user_id: str) -> Dict[str, int]:
+    """Счетчик непрочитанных и версия ящика (триггеры на notifications, V0020) - одна строка по ключу"""
+    cursor.execute(
+        "SELECT unread, version FROM notification_counters WHERE user_id = %s",
+        (user_id,)
+    )
+    row = cursor.fetchone()
+    return {'unread': row['unread'], 'version': row['version']} if row else {'unread': 0, 'version': 0}
+
+def get_inbox(event: Dict[str, Any], conn, headers: Dict, user_id: str) -> Dict[str, Any]:
+    """
+    Страница уведомлений или только счетчик (view=count).
+    ETag - версия ящика: любая запись в уведомления пользователя ее увеличивает,
+    поэтому повторный опрос без изменений стоит одного чтения по ключу и отвечает 304
+    """
+    params = event.get('queryStringParameters', {}) or {}
+    request_headers = event.get('headers', {}) or {}
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+    counter = read_counter(cursor, user_id)
+    etag = f'W/"{counter["version"]}"'
+    response_headers = {**headers, 'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if_none_match = request_headers.get('If-None-Match') or request_headers.get('if-none-match')
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        cursor.close()
+        return {'statusCode': 304, 'headers': response_headers, 'body': ''}
+
+    if params.get('view') == 'count':
+        cursor.close()
+        return {
+            'statusCode': 200,
+            'headers': response_headers,
+            'body': json.dumps(counter)
+        }
+
+    limit = parse_limit(params, PAGE_SIZE)
+    unread_only = params.get('unread_only') in ('1', 'true')
+
+    after = None
+    if params.get('cursor'):
+        after = decode_cursor(params['cursor'], ['timestamp', 'id'])
+        if after is None:
+            cursor.close()
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'invalid cursor'})
+            }
+
+    filters = ['user_id = %s']
+    query_params: List[Any] = [user_id]
+    if unread_only:
+        filters.append('NOT COALESCE(is_read, FALSE)')
+    if after:
+        filters.append('(created_at, id) < (%s::timestamp, %s)')
+        query_params.extend(after)
+    query_params.append(limit + 1)
+
+    cursor.execute(f"""
+        SELECT id, type, title, message, link, COALESCE(is_read, FALSE) AS is_read, created_at
+        FROM notifications
+        WHERE {' AND '.join(filters)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, query_params)
+    notifications = [dict(row) for row in cursor.fetchall()]
+    cursor.close()
+
+    next_cursor = None
+    if len(notifications) > limit:
+        notifications = notifications[:limit]
+        last = notifications[-1]
+        next_cursor = encode_cursor([last['created_at'].isoformat(), last['id']])
+
+    return {
+        'statusCode': 200,
+        'headers': response_headers,
+        'body': json.dumps({
+            'notifications': notifications,
+            'unread': counter['unread'],
+            'version': counter['version'],
+            'next_cursor': next_cursor
+        }, default=str)
+    }
+
+def mark_read(event: Dict[str, Any], conn, headers: Dict, user_id: str) -> Dict[str, Any]:
+    """Отметка прочтения одним запросом: список ids или все непрочитанные (all=true)"""
+    body = json.loads(event.get('body') or '{}')
+    ids = body.get('ids') or []
+    mark_all = bool(body.get('all'))
+
+    if not mark_all and not ids:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'ids or all required'})
+        }
+
+    if len(ids) > MAX_READ_BATCH:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': f'At most {MAX_READ_BATCH} ids per request'})
+        }
+
+    try:
+        ids = [int(notification_id) for notification_id in ids]
+    except (TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'ids must be integers'})
+        }
+
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+    # Уже прочитанные не обновляются: лишняя запись не меняет счетчик, но увеличила бы версию ящика
+    cursor.execute(f"""
+        UPDATE notifications
+        SET is_read = TRUE
+        WHERE user_id = %s
+          AND NOT COALESCE(is_read, FALSE)
+          {'' if mark_all else 'AND id = ANY(%s)'}
+    """, (user_id,) if mark_all else (user_id, ids))
+    updated = cursor.rowcount
+
+    counter = read_counter(cursor, user_id)
+    conn.commit()
+    cursor.close()
+
+    return {
+        'statusCode': 200,
+        'headers': {**headers, 'ETag': f'W/"{counter["version"]}"'},
+        'body': json.dumps({
+            'updated': updated,
+            'unread': counter['unread'],
+            'version': counter['version']
+        })
+    }
@@ -0,0 +1,256 @@
+'''
+Business: Бенчмарк пайплайна загрузки главы (multipart -> zip -> stitch_images) на синтетических архивах
+Args: параметры командной строки - сетка страниц, ширин, форматов и цветовых режимов
+Returns: JSON-отчет с wall/CPU временем, пиковой памятью и размером результата для каждого кейса
+
+Пример:
+    python benchmark.py --pages 10,40 --widths 720,1080 --formats png,jpeg,webp --modes rgb,mix -o bench.json
+    python benchmark.py --baseline old.json -o new.json
+'''
+
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Dict, Any, List, Optional, Tuple
+
+from PIL import Image
+
+from index import get_multipart_boundary, parse_multipart, extract_images, stitch_images
+
+FORMATS = {
+    'png': ('PNG', 'png'),
+    'jpeg': ('JPEG', 'jpg'),
+    'webp': ('WEBP', 'webp')
+}
+
+# Режим "mix" чередует страницы RGB, оттенки серого и RGBA - как в реальных архивах сканлейтеров
+MODES = {
+    'rgb': ['RGB'],
+    'gray': ['L'],
+    'rgba': ['RGBA'],
+    'mix': ['RGB', 'L', 'RGBA']
+}
+
+BOUNDARY = 'benchBoundary7MA4YWxkTrZu0gW'
+
+def make_page(width: int, height: int, mode: str, fmt: str, seed: int) -> bytes:
+    '''Генерирует страницу: шумовые полосы сжимаются примерно как реальные сканы'''
+    rnd = random.Random(seed)
+    noise = Image.effect_noise((width, height), rnd.randint(20, 80))
+    page = Image.merge('RGB', (noise, noise.rotate(180), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+    if mode == 'L':
+        page = page.convert('L')
+    elif mode == 'RGBA':
+        page = page.convert('RGBA')
+        page.putalpha(noise.point(lambda v: 255 if v > 30 else v * 8))
+
+    pil_format = FORMATS[fmt][0]
+    if pil_format == 'JPEG' and page.mode == 'RGBA':
+        page = page.convert('RGB')
+
+    output = io.BytesIO()
+    page.save(output, format=pil_format, quality=90)
+    return output.getvalue()
+
+def make_archive(pages: int, width: int, height: int, fmt: str, modes: List[str], seed: int = 0) -> bytes:
+    '''Собирает zip-архив главы; ширина страниц слегка варьируется, чтобы задеть центрирование'''
+    extension = FORMATS[fmt][1]
+    archive = io.BytesIO()
+
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zip_ref:
+        for idx in range(pages):
+            page_width = width if idx % 5 else max(1, width - width // 10)
+            mode = modes[idx % len(modes)]
+            data = make_page(page_width, height, mode, fmt, seed + idx)
+            zip_ref.writestr(f'{idx + 1:03d}.{extension}', data)
+
+    return archive.getvalue()
+
+def make_multipart(archive: bytes, manhwa_id: int = 1, chapter_number: int = 1) -> Tuple[bytes, str]:
+    '''Оборачивает архив в multipart/form-data так же, как это делает фронтенд'''
+    fields = [
+        (b'manhwa_id', str(manhwa_id).encode()),
+        (b'chapter_number', str(chapter_number).encode()),
+        (b'title', 'Глава {}'.format(chapter_number).encode('utf-8'))
+    ]
+
+    chunks = []
+    for name, value in fields:
+        chunks.append(b'--' + BOUNDARY.encode() + b'\r\n')
+        chunks.append(b'Content-Disposition: form-data; name="' + name + b'"\r\n\r\n')
+        chunks.append(value + b'\r\n')
+
+    chunks.append(b'--' + BOUNDARY.encode() + b'\r\n')
+    chunks.append(b'Content-Disposition: form-data; name="archive"; filename="chapter.zip"\r\n')
+    chunks.append(b'Content-Type: application/zip\r\n\r\n')
+    chunks.append(archive + b'\r\n')
+    chunks.append(b'--' + BOUNDARY.encode() + b'--\r\n')
+
+    return b''.join(chunks), f'multipart/form-data; boundary={BOUNDARY}'
+
+def ingest(body: bytes, content_type: str) -> str:
+    '''Путь загрузки из handler без записи в БД'''
+    boundary = get_multipart_boundary(content_type)
+    form_data, archive_data = parse_multipart(body, boundary)
+    image_files = extract_images(archive_data)
+    return stitch_images(image_files)
+
+def run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    '''Прогоняет один кейс; запускается в отдельном процессе, чтобы ru_maxrss не смешивался между кейсами'''
+    archive = make_archive(case['pages'], case['width'], case['height'], case['format'], MODES[case['mode']])
+    body, content_type = make_multipart(archive)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    wall_times = []
+    cpu_times = []
+    py_peaks = []
+    output_bytes = 0
+
+    for _ in range(case['repeats']):
+        tracemalloc.start()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+
+        stitched = ingest(body, content_type)
+
+        cpu_times.append(time.process_time() - cpu_start)
+        wall_times.append(time.perf_counter() - wall_start)
+        py_peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        output_bytes = len(stitched)
+        del stitched
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # На Linux ru_maxrss в килобайтах, на macOS - в байтах
+    rss_scale = 1 if sys.platform == 'darwin' else 1024
+
+    return {
+        **case,
+        'input_bytes': len(body),
+        'archive_bytes': len(archive),
+        'output_bytes': output_bytes,
+        'wall_s': statistics.median(wall_times),
+        'wall_s_min': min(wall_times),
+        'cpu_s': statistics.median(cpu_times),
+        'py_peak_bytes': max(py_peaks),
+        'peak_rss_bytes': rss_after * rss_scale,
+        'rss_growth_bytes': (rss_after - rss_before) * rss_scale
+    }
+
+def build_cases(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    cases = []
+    for pages, width, fmt, mode in itertools.product(args.pages, args.widths, args.formats, args.modes):
+        cases.append({
+            'id': f'{fmt}-{mode}-w{width}-p{pages}',
+            'pages': pages,
+            'width': width,
+            'height': args.page_height,
+            'format': fmt,
+            'mode': mode,
+            'repeats': args.repeats
+        })
+    return cases
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results: List[Dict[str, Any]], baseline_path: str) -> List[Dict[str, Any]]:
+    '''Сравнение с отчетом другого коммита по id кейса'''
+    with open(baseline_path) as f:
+        baseline = {r['id']: r for r in json.load(f)['results']}
+
+    diff = []
+    for result in results:
+        old = baseline.get(result['id'])
+        if not old:
+            continue
+        diff.append({
+            'id': result['id'],
+            'wall_ratio': round(result['wall_s'] / old['wall_s'], 3) if old['wall_s'] else None,
+            'cpu_ratio': round(result['cpu_s'] / old['cpu_s'], 3) if old['cpu_s'] else None,
+            'peak_rss_ratio': round(result['peak_rss_bytes'] / old['peak_rss_bytes'], 3) if old['peak_rss_bytes'] else None,
+            'output_bytes_ratio': round(result['output_bytes'] / old['output_bytes'], 3) if old['output_bytes'] else None
+        })
+    return diff
+
+def csv_list(cast):
+    return lambda value: [cast(v.strip()) for v in value.split(',') if v.strip()]
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark upload-chapter image pipeline')
+    parser.add_argument('--pages', type=csv_list(int), default=[10, 40])
+    parser.add_argument('--widths', type=csv_list(int), default=[720, 1080])
+    parser.add_argument('--page-height', type=int, default=1600)
+    parser.add_argument('--formats', type=csv_list(str), default=list(FORMATS))
+    parser.add_argument('--modes', type=csv_list(str), default=['rgb', 'mix'])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--baseline', help='JSON-отчет предыдущего прогона для сравнения')
+    parser.add_argument('-o', '--output', help='Файл для JSON-отчета (по умолчанию stdout)')
+    args = parser.parse_args()
+
+    for fmt in args.formats:
+        if fmt not in FORMATS:
+            parser.error(f'unknown format: {fmt}')
+    for mode in args.modes:
+        if mode not in MODES:
+            parser.error(f'unknown mode: {mode}')
+
+    results = []
+    for case in build_cases(args):
+        # Свежий процесс на каждый кейс - иначе пиковый RSS накапливается
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            result = pool.submit(run_case, case).result()
+        results.append(result)
+        print(f"{result['id']}: wall={result['wall_s']:.3f}s cpu={result['cpu_s']:.3f}s "
+              f"rss={result['peak_rss_bytes'] // (1024 * 1024)}MB out={result['output_bytes']}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'pillow': Image.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': results
+    }
+
+    if args.baseline:
+        report['comparison'] = compare(results, args.baseline)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -41,6 +41,57 @@ def stitch_images(image_files):
     
     return base64.b64encode(output.getvalue()).decode('utf-8')
 
+def get_multipart_boundary(content_type: str) -> Optional[str]:
+    for part in content_type.split(';'):
+        if 'boundary=' in part:
+            return part.split('boundary=')[1].strip()
+    return None
+
+def parse_multipart(body, boundary: str):
+    '''Разбирает multipart/form-data: возвращает поля формы и содержимое архива'''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    
+    parts = body.split(f'--{boundary}'.encode())
+    
+    form_data = {}
+    archive_data = None
+    
+    for part in parts:
+        if b'Content-Disposition' not in part:
+            continue
+        
+        headers_body = part.split(b'\r\n\r\n', 1)
+        if len(headers_body) < 2:
+            continue
+        
+        headers, content = headers_body
+        content = content.rstrip(b'\r\n')
+        
+        headers_str = headers.decode('utf-8', errors='ignore')
+        
+        if 'name="manhwa_id"' in headers_str:
+            form_data['manhwa_id'] = content.decode('utf-8').strip()
+        elif 'name="chapter_number"' in headers_str:
+            form_data['chapter_number'] = content.decode('utf-8').strip()
+        elif 'name="title"' in headers_str:
+            form_data['title'] = content.decode('utf-8').strip()
+        elif 'name="archive"' in headers_str:
+            archive_data = content
+    
+    return form_data, archive_data
+
+def extract_images(archive_data: bytes) -> List[bytes]:
+    '''Достает изображения из zip-архива в порядке имен файлов'''
+    image_files = []
+    
+    with zipfile.ZipFile(io.BytesIO(archive_data), 'r') as zip_ref:
+        for filename in sorted(zip_ref.namelist()):
+            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
+                image_files.append(zip_ref.read(filename))
+    
+    return image_files
+
 def parse_vk_url(url: str) -> Optional[Dict[str, Any]]:
     vk_pattern = r'vk\.com/wall(-?\d+)_(\d+)'
     match = re.search(vk_pattern, url)
@@ -160,12 +211,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             body = base64.b64decode(body)
         
         content_type = event.get('headers', {}).get('content-type', '')
-        
-        boundary = None
-        for part in content_type.split(';'):
-            if 'boundary=' in part:
-                boundary = part.split('boundary=')[1].strip()
-                break
+        boundary = get_multipart_boundary(content_type)
         
         if not boundary:
             return {
@@ -175,32 +221,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        parts = body.split(f'--{boundary}'.encode())
-        
-        form_data = {}
-        archive_data = None
-        
-        for part in parts:
-            if b'Content-Disposition' not in part:
-                continue
-            
-            headers_body = part.split(b'\r\n\r\n', 1)
-            if len(headers_body) < 2:
-                continue
-            
-            headers, content = headers_body
-            content = content.rstrip(b'\r\n')
-            
-            headers_str = headers.decode('utf-8', errors='ignore')
-            
-            if 'name="manhwa_id"' in headers_str:
-                form_data['manhwa_id'] = content.decode('utf-8').strip()
-            elif 'name="chapter_number"' in headers_str:
-                form_data['chapter_number'] = content.decode('utf-8').strip()
-            elif 'name="title"' in headers_str:
-                form_data['title'] = content.decode('utf-8').strip()
-            elif 'name="archive"' in headers_str:
-                archive_data = content
+        form_data, archive_data = parse_multipart(body, boundary)
         
         if not archive_data or not form_data.get('manhwa_id') or not form_data.get('chapter_number'):
             return {
@@ -210,13 +231,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        archive_file = io.BytesIO(archive_data)
-        image_files = []
-        
-        with zipfile.ZipFile(archive_file, 'r') as zip_ref:
-            for filename in sorted(zip_ref.namelist()):
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
-                    image_files.append(zip_ref.read(filename))
+        image_files = extract_images(archive_data)
         
         if not image_files:
             return {
@@ -1,10 +1,45 @@
+import base64
 import json
+import math
 import os
 import re
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+from datetime import datetime
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+# Страница списка загрузок по курсору (created_at, id) - проход по индексу (moderation_status, created_at, id)
+MAX_UPLOADS_PAGE_SIZE = 200
+# Страница списка команд по курсору (created_at, id) - проход по индексу idx_teams_created
+MAX_TEAMS_PAGE_SIZE = 200
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values, default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def cursor_value(value: Any, kind: Optional[str]) -> Any:
+    """Значение курсора ожидаемого типа (number, timestamp, id, text; None - без проверки); ValueError - курсор испорчен"""
+    if kind is None:
+        return value
+    if kind in ('timestamp', 'text'):
+        if not isinstance(value, str):
+            raise ValueError(f'{kind} expected')
+        return datetime.fromisoformat(value) if kind == 'timestamp' else value
+    expected = int if kind == 'id' else (int, float)
+    if isinstance(value, bool) or not isinstance(value, expected) or not math.isfinite(value):
+        raise ValueError(f'{kind} expected')
+    return value
+
+def decode_cursor(cursor: str, kinds: List[Optional[str]]) -> Optional[List[Any]]:
+    """Значения курсора по типам ключей сортировки или None, если курсор некорректен"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(kinds):
+            return None
+        return [cursor_value(value, kind) for value, kind in zip(values, kinds)]
+    except (ValueError, TypeError):
+        return None
+
 def create_slug(text: str) -> str:
     slug = text.lower()
     slug = re.sub(r'[^a-z0-9а-яё]+', '-', slug)
@@ -62,16 +97,10 @@ def handle_teams(method: str, event: Dict[str, Any], cursor, conn) -> Dict[str,
     if method == 'GET':
         team_id = params.get('team_id')
         
+        # member_count и manhwa_count ведутся при записи участников и загрузок
         if team_id:
             cursor.execute('''
-                SELECT t.*, 
-                       COUNT(DISTINCT tm.user_id) as member_count,
-                       COUNT(DISTINCT uu.id) as manhwa_count
-                FROM teams t
-                LEFT JOIN team_members tm ON t.id = tm.team_id
-                LEFT JOIN user_uploads uu ON t.id = uu.team_id
-                WHERE t.id = %s
-                GROUP BY t.id
+                SELECT * FROM teams WHERE id = %s
             ''', (team_id,))
             team = cursor.fetchone()
             
@@ -101,23 +130,49 @@ def handle_teams(method: str, event: Dict[str, Any], cursor, conn) -> Dict[str,
                 }, default=str)
             }
         else:
-            cursor.execute('''
-                SELECT t.*, 
-                       COUNT(DISTINCT tm.user_id) as member_count,
-                       COUNT(DISTINCT uu.id) as manhwa_count
-                FROM teams t
-                LEFT JOIN team_members tm ON t.id = tm.team_id
-                LEFT JOIN user_uploads uu ON t.id = uu.team_id
-                GROUP BY t.id
-                ORDER BY t.created_at DESC
-            ''')
-            teams = cursor.fetchall()
+            query = 'SELECT * FROM teams'
+            query_params = []
+            
+            # limit/cursor - постраничная выдача, без них - весь список как раньше
+            limit = None
+            if params.get('limit') or params.get('cursor'):
+                try:
+                    limit = max(1, min(int(params.get('limit', 50)), MAX_TEAMS_PAGE_SIZE))
+                except ValueError:
+                    limit = 50
+            
+            if params.get('cursor'):
+                after = decode_cursor(params['cursor'], ['timestamp', 'id'])
+                if after is None:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'isBase64Encoded': False,
+                        'body': json.dumps({'error': 'Invalid cursor'})
+                    }
+                query += ' WHERE (created_at, id) < (%s::timestamp, %s)'
+                query_params.extend(after)
+            
+            query += ' ORDER BY created_at DESC, id DESC'
+            if limit:
+                query += ' LIMIT %s'
+                query_params.append(limit + 1)
+            
+            cursor.execute(query, query_params)
+            teams = [dict(t) for t in cursor.fetchall()]
+            
+            result = {'teams': teams}
+            if limit:
+                result['next_cursor'] = None
+                if len(teams) > limit:
+                    teams = result['teams'] = teams[:limit]
+                    result['next_cursor'] = encode_cursor([teams[-1]['created_at'].isoformat(), teams[-1]['id']])
             
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                 'isBase64Encoded': False,
-                'body': json.dumps({'teams': [dict(t) for t in teams]}, default=str)
+                'body': json.dumps(result, default=str)
             }
     
     elif method == 'POST':
@@ -147,10 +202,13 @@ def handle_teams(method: str, event: Dict[str, Any], cursor, conn) -> Dict[str,
         
         slug = create_slug(name)
         
+        # Владелец - первый участник: member_count = 1 вместе с его строкой в team_members
         cursor.execute('''
-            INSERT INTO teams (name, slug, description, logo_url, website_url, discord_url, created_by)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            RETURNING id, name, slug, description, logo_url, website_url, discord_url, created_at
+            INSERT INTO teams (name, slug, description, logo_url, website_url, discord_url, created_by,
+                               member_count, manhwa_count)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, 1, 0)
+            RETURNING id, name, slug, description, logo_url, website_url, discord_url, created_at,
+                      member_count, manhwa_count
         ''', (name, slug, description, logo_url, website_url, discord_url, user_id))
         
         team = cursor.fetchone()
@@ -312,16 +370,46 @@ def handle_uploads(method: str, event: Dict[str, Any], cursor, conn) -> Dict[str
             query += ' AND uu.moderation_status = %s'
             query_params.append(status)
         
-        query += ' ORDER BY uu.created_at DESC'
+        # limit/cursor - постраничная выдача, без них - весь список как раньше
+        limit = None
+        if params.get('limit') or params.get('cursor'):
+            try:
+                limit = max(1, min(int(params.get('limit', 50)), MAX_UPLOADS_PAGE_SIZE))
+            except ValueError:
+                limit = 50
+        
+        if params.get('cursor'):
+            after = decode_cursor(params['cursor'], ['timestamp', 'id'])
+            if after is None:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'Invalid cursor'})
+                }
+            query += ' AND (uu.created_at, uu.id) < (%s::timestamp, %s)'
+            query_params.extend(after)
+        
+        query += ' ORDER BY uu.created_at DESC, uu.id DESC'
+        if limit:
+            query += ' LIMIT %s'
+            query_params.append(limit + 1)
         
         cursor.execute(query, query_params)
-        uploads = cursor.fetchall()
+        uploads = [dict(u) for u in cursor.fetchall()]
+        
+        result = {'uploads': uploads}
+        if limit:
+            result['next_cursor'] = None
+            if len(uploads) > limit:
+                uploads = result['uploads'] = uploads[:limit]
+                result['next_cursor'] = encode_cursor([uploads[-1]['created_at'].isoformat(), uploads[-1]['id']])
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'isBase64Encoded': False,
-            'body': json.dumps({'uploads': [dict(u) for u in uploads]}, default=str)
+            'body': json.dumps(result, default=str)
         }
     
     elif method == 'POST':
@@ -373,6 +461,11 @@ def handle_uploads(method: str, event: Dict[str, Any], cursor, conn) -> Dict[str
         upload = cursor.fetchone()
         upload_id = upload['id']
         
+        if upload['team_id']:
+            cursor.execute('''
+                UPDATE teams SET manhwa_count = manhwa_count + 1 WHERE id = %s
+            ''', (upload['team_id'],))
+        
         genre_ids = body.get('genre_ids', [])
         if genre_ids:
             for genre_id in genre_ids:
@@ -413,9 +506,7 @@ def handle_uploads(method: str, event: Dict[str, Any], cursor, conn) -> Dict[str
                 'body': json.dumps({'error': 'Upload ID required'})
             }
         
-        cursor.execute('''
-            SELECT uploaded_by FROM user_uploads WHERE id = %s
-        ''', (upload_id,))
+        cursor.execute('SELECT uploaded_by FROM user_uploads WHERE id = %s', (upload_id,))
         
         upload = cursor.fetchone()
         if not upload:
@@ -440,6 +531,8 @@ def handle_uploads(method: str, event: Dict[str, Any], cursor, conn) -> Dict[str
             
             is_approved = moderation_status == 'approved'
             
+            # Проверка аренды в самом UPDATE: claim_queue в moderator-bot может забрать заявку
+            # между чтением и записью, отдельный SELECT этого не увидел бы
             cursor.execute('''
                 UPDATE user_uploads 
                 SET moderation_status = %s, 
@@ -447,12 +540,21 @@ def handle_uploads(method: str, event: Dict[str, Any], cursor, conn) -> Dict[str
                     moderation_notes = %s,
                     updated_at = CURRENT_TIMESTAMP
                 WHERE id = %s
+                  AND NOT COALESCE(claim_expires_at > CURRENT_TIMESTAMP AND claimed_by IS DISTINCT FROM %s, FALSE)
                 RETURNING *
-            ''', (moderation_status, is_approved, moderation_notes, upload_id))
+            ''', (moderation_status, is_approved, moderation_notes, upload_id, user_id))
             
             updated_upload = cursor.fetchone()
             conn.commit()
             
+            if not updated_upload:
+                return {
+                    'statusCode': 409,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'isBase64Encoded': False,
+                    'body': json.dumps({'error': 'Claimed by another moderator'})
+                }
+            
             return {
                 'statusCode': 200,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -0,0 +1,28 @@
+-- Счетчик ответов на комментарий (для превью и пагинации ответов)
+ALTER TABLE comments ADD COLUMN IF NOT EXISTS reply_count INTEGER NOT NULL DEFAULT 0;
+
+-- Счетчик корневых комментариев ветки: манхва целиком (chapter_key = 0) или конкретная глава
+CREATE TABLE IF NOT EXISTS comment_threads (
+    manhwa_id INTEGER NOT NULL,
+    chapter_key INTEGER NOT NULL,
+    root_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (manhwa_id, chapter_key)
+);
+
+-- Заполняем счетчики по существующим данным
+UPDATE comments c
+SET reply_count = r.total
+FROM (
+    SELECT reply_to, COUNT(*) AS total
+    FROM comments
+    WHERE reply_to IS NOT NULL
+    GROUP BY reply_to
+) r
+WHERE c.id = r.reply_to;
+
+INSERT INTO comment_threads (manhwa_id, chapter_key, root_count)
+SELECT manhwa_id, COALESCE(chapter_id, 0), COUNT(*)
+FROM comments
+WHERE reply_to IS NULL AND manhwa_id IS NOT NULL
+GROUP BY manhwa_id, COALESCE(chapter_id, 0)
+ON CONFLICT (manhwa_id, chapter_key) DO UPDATE SET root_count = EXCLUDED.root_count;
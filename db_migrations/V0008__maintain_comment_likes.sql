@@ -0,0 +1,16 @@
+-- comments.likes становится поддерживаемым счетчиком вместо COUNT по comment_likes при каждом чтении
+UPDATE comments c
+SET likes = 0
+WHERE c.likes IS DISTINCT FROM 0
+  AND NOT EXISTS (SELECT 1 FROM comment_likes cl WHERE cl.comment_id = c.id);
+
+UPDATE comments c
+SET likes = l.total
+FROM (
+    SELECT comment_id, COUNT(*) AS total
+    FROM comment_likes
+    GROUP BY comment_id
+) l
+WHERE c.id = l.comment_id AND c.likes IS DISTINCT FROM l.total;
+
+ALTER TABLE comments ALTER COLUMN likes SET NOT NULL;
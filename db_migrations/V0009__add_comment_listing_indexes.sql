@@ -0,0 +1,18 @@
+-- Индексы под каждый режим листинга корневых комментариев: фильтр ветки + порядок сортировки,
+-- чтобы страница читалась из индекса без сортировки. Ключ ветки COALESCE(chapter_id, 0)
+-- совпадает с comment_threads.chapter_key и с фильтром в backend/comments
+CREATE INDEX IF NOT EXISTS idx_comments_roots_new
+    ON comments (manhwa_id, (COALESCE(chapter_id, 0)), created_at DESC, id DESC)
+    WHERE reply_to IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_comments_roots_popular
+    ON comments (manhwa_id, (COALESCE(chapter_id, 0)), likes DESC, created_at DESC, id DESC)
+    WHERE reply_to IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_comments_roots_rating
+    ON comments (manhwa_id, (COALESCE(chapter_id, 0)), (COALESCE(rating, 0)) DESC, created_at DESC, id DESC)
+    WHERE reply_to IS NULL;
+
+-- Превью и постраничная загрузка ответов
+CREATE INDEX IF NOT EXISTS idx_comments_replies ON comments (reply_to, created_at, id);
+
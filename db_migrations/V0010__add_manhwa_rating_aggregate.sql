@@ -0,0 +1,30 @@
+-- Накопительный агрегат пользовательских оценок из комментариев
+ALTER TABLE manhwa ADD COLUMN IF NOT EXISTS rating_sum BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE manhwa ADD COLUMN IF NOT EXISTS rating_count INTEGER NOT NULL DEFAULT 0;
+
+-- Рейтинг со сглаживанием к априорному среднему (байесовское среднее).
+-- При prior_weight = 0 это обычное среднее; NULL, пока оценок нет
+CREATE OR REPLACE FUNCTION manhwa_rating_score(
+    rating_sum NUMERIC,
+    rating_count NUMERIC,
+    prior_mean NUMERIC,
+    prior_weight NUMERIC
+) RETURNS NUMERIC AS $$
+    SELECT CASE
+        WHEN rating_count > 0
+        THEN ROUND((prior_mean * prior_weight + rating_sum) / (prior_weight + rating_count), 1)
+    END
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- Заполняем агрегат по существующим оценкам; рейтинг без оценок остается заданным вручную
+UPDATE manhwa m
+SET rating_sum = r.total,
+    rating_count = r.votes,
+    rating = manhwa_rating_score(r.total, r.votes, 0, 0)
+FROM (
+    SELECT manhwa_id, SUM(rating) AS total, COUNT(rating) AS votes
+    FROM comments
+    WHERE rating IS NOT NULL
+    GROUP BY manhwa_id
+) r
+WHERE m.id = r.manhwa_id;
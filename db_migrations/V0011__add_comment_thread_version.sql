@@ -0,0 +1,2 @@
+-- Версия ветки комментариев: увеличивается каждой записью в ветку и входит в ключ кэша страниц
+ALTER TABLE comment_threads ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,9 @@
+-- Общие token-bucket корзины ограничения записей (THROTTLE_BACKEND=postgres).
+-- UNLOGGED: состояние лимитов не пишется в WAL и после сбоя просто начинается заново
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limits (
+    bucket VARCHAR(300) PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limits_updated_at ON rate_limits(updated_at);
@@ -0,0 +1,11 @@
+-- Время последнего изменения закладки: по нему пакетная синхронизация решает конфликты (last-writer-wins)
+ALTER TABLE t_p15993318_manhwa_reader_platfo.bookmarks
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;
+
+UPDATE t_p15993318_manhwa_reader_platfo.bookmarks
+SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)
+WHERE updated_at IS NULL;
+
+ALTER TABLE t_p15993318_manhwa_reader_platfo.bookmarks
+    ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP,
+    ALTER COLUMN updated_at SET NOT NULL;
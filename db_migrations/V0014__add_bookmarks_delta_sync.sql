@@ -0,0 +1,29 @@
+-- Дельта-синхронизация закладок:
+--   updated_at - серверное время последней записи, по нему отдаются изменения (updated_since);
+--   changed_at - время изменения на клиенте для last-writer-wins (раньше эту роль играл updated_at);
+--   deleted_at - tombstone удаленной закладки, чтобы удаление дошло до других устройств
+ALTER TABLE t_p15993318_manhwa_reader_platfo.bookmarks
+    ADD COLUMN IF NOT EXISTS changed_at TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+
+UPDATE t_p15993318_manhwa_reader_platfo.bookmarks
+SET changed_at = updated_at
+WHERE changed_at IS NULL;
+
+UPDATE t_p15993318_manhwa_reader_platfo.bookmarks
+SET created_at = updated_at
+WHERE created_at IS NULL;
+
+ALTER TABLE t_p15993318_manhwa_reader_platfo.bookmarks
+    ALTER COLUMN changed_at SET DEFAULT CURRENT_TIMESTAMP,
+    ALTER COLUMN changed_at SET NOT NULL,
+    ALTER COLUMN created_at SET NOT NULL;
+
+-- Полный список: keyset по (created_at, id) только среди живых закладок
+CREATE INDEX IF NOT EXISTS idx_bookmarks_user_created
+    ON t_p15993318_manhwa_reader_platfo.bookmarks(user_id, created_at DESC, id DESC)
+    WHERE deleted_at IS NULL;
+
+-- Дельта: изменения и tombstone после updated_since
+CREATE INDEX IF NOT EXISTS idx_bookmarks_user_updated
+    ON t_p15993318_manhwa_reader_platfo.bookmarks(user_id, updated_at, id);
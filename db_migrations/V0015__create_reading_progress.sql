@@ -0,0 +1,15 @@
+-- Прогресс чтения: одна строка на пользователя и манхву, обновляется пачками из буфера функции bookmarks.
+-- client_time - время пинга на клиенте, запоздавшая пачка не перетирает более свежий прогресс
+CREATE TABLE IF NOT EXISTS t_p15993318_manhwa_reader_platfo.reading_progress (
+    user_id VARCHAR(255) NOT NULL,
+    manhwa_id INTEGER NOT NULL REFERENCES t_p15993318_manhwa_reader_platfo.manhwa(id),
+    chapter_id INTEGER REFERENCES t_p15993318_manhwa_reader_platfo.chapters(id),
+    page INTEGER NOT NULL DEFAULT 0,
+    page_offset REAL NOT NULL DEFAULT 0,
+    client_time TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, manhwa_id)
+) WITH (fillfactor = 80);
+
+CREATE INDEX IF NOT EXISTS idx_reading_progress_user_updated
+    ON t_p15993318_manhwa_reader_platfo.reading_progress(user_id, updated_at DESC);
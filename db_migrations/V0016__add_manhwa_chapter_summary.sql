@@ -0,0 +1,63 @@
+-- Сводка глав манхвы для ленты "Продолжить чтение": номер последней главы, время последнего релиза и число глав.
+-- Главы пишут несколько функций (upload-chapter, moderator-bot), поэтому сводку ведет триггер
+ALTER TABLE manhwa ADD COLUMN IF NOT EXISTS latest_chapter_number INTEGER;
+ALTER TABLE manhwa ADD COLUMN IF NOT EXISTS last_chapter_at TIMESTAMP;
+ALTER TABLE manhwa ADD COLUMN IF NOT EXISTS chapter_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION refresh_manhwa_chapter_summary(target_manhwa_id INTEGER) RETURNS VOID AS $$
+    UPDATE manhwa m
+    SET latest_chapter_number = s.latest_number,
+        last_chapter_at = s.last_at,
+        chapter_count = s.total
+    FROM (
+        SELECT MAX(chapter_number) AS latest_number,
+               MAX(COALESCE(created_at, CURRENT_TIMESTAMP)) AS last_at,
+               COUNT(*) AS total
+        FROM chapters
+        WHERE manhwa_id = target_manhwa_id
+    ) s
+    WHERE m.id = target_manhwa_id
+$$ LANGUAGE SQL;
+
+CREATE OR REPLACE FUNCTION maintain_manhwa_chapter_summary() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        -- Новая глава только сдвигает максимум - без пересчета по всем главам
+        UPDATE manhwa
+        SET latest_chapter_number = GREATEST(latest_chapter_number, NEW.chapter_number),
+            last_chapter_at = GREATEST(last_chapter_at, COALESCE(NEW.created_at, CURRENT_TIMESTAMP)),
+            chapter_count = chapter_count + 1
+        WHERE id = NEW.manhwa_id;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'DELETE' OR OLD.manhwa_id IS DISTINCT FROM NEW.manhwa_id THEN
+        PERFORM refresh_manhwa_chapter_summary(OLD.manhwa_id);
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM refresh_manhwa_chapter_summary(NEW.manhwa_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_chapters_summary ON chapters;
+CREATE TRIGGER trg_chapters_summary
+    AFTER INSERT OR DELETE OR UPDATE OF manhwa_id, chapter_number, created_at ON chapters
+    FOR EACH ROW EXECUTE FUNCTION maintain_manhwa_chapter_summary();
+
+UPDATE manhwa m
+SET latest_chapter_number = s.latest_number,
+    last_chapter_at = s.last_at,
+    chapter_count = s.total
+FROM (
+    SELECT manhwa_id,
+           MAX(chapter_number) AS latest_number,
+           MAX(COALESCE(created_at, CURRENT_TIMESTAMP)) AS last_at,
+           COUNT(*) AS total
+    FROM chapters
+    GROUP BY manhwa_id
+) s
+WHERE m.id = s.manhwa_id;
+
+CREATE INDEX IF NOT EXISTS idx_manhwa_last_chapter ON manhwa(last_chapter_at DESC);
@@ -0,0 +1,71 @@
+-- Счетчики строк для статистики сайта вместо COUNT(*) по большим таблицам.
+-- Каждый счетчик разбит на 8 шардов: параллельные записи разных сессий не ждут одну строку,
+-- итог - сумма шардов
+CREATE TABLE IF NOT EXISTS site_counters (
+    name VARCHAR(100) NOT NULL,
+    shard SMALLINT NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, shard)
+);
+
+-- Триггеры уровня оператора: загрузка главы со 100 страницами - одно обновление счетчика, а не сто
+CREATE OR REPLACE FUNCTION bump_site_counter() RETURNS TRIGGER AS $$
+DECLARE
+    delta BIGINT;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM site_counters WHERE name = TG_ARGV[0];
+        RETURN NULL;
+    ELSIF TG_OP = 'INSERT' THEN
+        SELECT COUNT(*) INTO delta FROM new_rows;
+    ELSE
+        SELECT -COUNT(*) INTO delta FROM old_rows;
+    END IF;
+
+    IF delta <> 0 THEN
+        INSERT INTO site_counters (name, shard, value)
+        VALUES (TG_ARGV[0], pg_backend_pid() % 8, delta)
+        ON CONFLICT (name, shard) DO UPDATE SET value = site_counters.value + EXCLUDED.value;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    counted TEXT;
+BEGIN
+    FOREACH counted IN ARRAY ARRAY['manhwa', 'chapters', 'pages', 'comments'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_count_insert ON %1$I', counted);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_count_delete ON %1$I', counted);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_count_truncate ON %1$I', counted);
+
+        EXECUTE format('CREATE TRIGGER trg_%1$s_count_insert AFTER INSERT ON %1$I '
+                       'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT '
+                       'EXECUTE FUNCTION bump_site_counter(%1$L)', counted);
+        EXECUTE format('CREATE TRIGGER trg_%1$s_count_delete AFTER DELETE ON %1$I '
+                       'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT '
+                       'EXECUTE FUNCTION bump_site_counter(%1$L)', counted);
+        EXECUTE format('CREATE TRIGGER trg_%1$s_count_truncate AFTER TRUNCATE ON %1$I '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION bump_site_counter(%1$L)', counted);
+
+        -- Начальное значение; расхождения из-за записей во время миграции исправляет reconcile_counters
+        EXECUTE format('DELETE FROM site_counters WHERE name = %L', counted);
+        EXECUTE format('INSERT INTO site_counters (name, shard, value) SELECT %L, 0, COUNT(*) FROM %I',
+                       counted, counted);
+    END LOOP;
+END;
+$$;
+
+-- Ежедневный срез итогов для графиков; прирост за день - разница соседних срезов
+CREATE TABLE IF NOT EXISTS site_stats_daily (
+    day DATE PRIMARY KEY,
+    total_manhwa BIGINT NOT NULL,
+    total_chapters BIGINT NOT NULL,
+    total_pages BIGINT NOT NULL,
+    total_comments BIGINT NOT NULL,
+    captured_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Последние обновления в get_stats
+CREATE INDEX IF NOT EXISTS idx_chapters_created ON chapters(created_at DESC);
@@ -0,0 +1,25 @@
+-- Инкрементальная проверка целостности каталога: позиция сканера по каждой проверке
+CREATE TABLE IF NOT EXISTS integrity_scan_state (
+    check_name VARCHAR(100) PRIMARY KEY,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    rows_scanned BIGINT NOT NULL DEFAULT 0,
+    pass_started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_pass_completed_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Найденные нарушения; исправленные помечаются resolved_at при следующем проходе по их диапазону
+CREATE TABLE IF NOT EXISTS integrity_findings (
+    id SERIAL PRIMARY KEY,
+    check_name VARCHAR(100) NOT NULL,
+    entity_id INTEGER NOT NULL,
+    details JSONB,
+    first_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    resolved_at TIMESTAMP,
+    UNIQUE (check_name, entity_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_integrity_findings_open
+    ON integrity_findings(check_name, id)
+    WHERE resolved_at IS NULL;
@@ -0,0 +1,30 @@
+-- Рассылка уведомлений о новой главе: подписчики манхвы выбираются по индексу пачками по id
+CREATE INDEX IF NOT EXISTS idx_subscriptions_manhwa_chapters
+    ON notifications_subscriptions(manhwa_id, id)
+    WHERE notify_new_chapters = TRUE;
+
+-- Задания рассылки: небольшие выполняются сразу одним INSERT ... SELECT,
+-- большие - пачками фоновым потоком или командой process_fanout; прогресс и скорость видны здесь
+CREATE TABLE IF NOT EXISTS notification_fanout_jobs (
+    id SERIAL PRIMARY KEY,
+    manhwa_id INTEGER NOT NULL,
+    chapter_id INTEGER NOT NULL,
+    type VARCHAR(50) NOT NULL DEFAULT 'new_chapter',
+    title VARCHAR(500),
+    message TEXT,
+    link VARCHAR(500),
+    mode VARCHAR(20) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    last_subscription_id INTEGER NOT NULL DEFAULT 0,
+    delivered BIGINT NOT NULL DEFAULT 0,
+    batches INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_fanout_jobs_open
+    ON notification_fanout_jobs(id)
+    WHERE status IN ('pending', 'running');
@@ -0,0 +1,72 @@
+-- Счетчик непрочитанных уведомлений и версия ящика пользователя для ETag функции notifications.
+-- Уведомления пишут moderator-bot и notifications, поэтому счетчик ведут триггеры уровня оператора:
+-- рассылка на 200 тысяч подписчиков - одно групповое обновление, а не 200 тысяч
+CREATE TABLE IF NOT EXISTS notification_counters (
+    user_id VARCHAR(255) PRIMARY KEY,
+    unread INTEGER NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION maintain_notification_counters() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO notification_counters AS nc (user_id, unread, version)
+        SELECT user_id, COUNT(*) FILTER (WHERE NOT COALESCE(is_read, FALSE)), 1
+        FROM new_rows
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET unread = nc.unread + EXCLUDED.unread,
+            version = nc.version + 1;
+    ELSIF TG_OP = 'UPDATE' THEN
+        UPDATE notification_counters nc
+        SET unread = GREATEST(nc.unread + d.delta, 0),
+            version = nc.version + 1
+        FROM (
+            SELECT n.user_id,
+                   SUM((NOT COALESCE(n.is_read, FALSE))::int - (NOT COALESCE(o.is_read, FALSE))::int) AS delta
+            FROM new_rows n
+            JOIN old_rows o ON o.id = n.id
+            GROUP BY n.user_id
+        ) d
+        WHERE nc.user_id = d.user_id;
+    ELSE
+        UPDATE notification_counters nc
+        SET unread = GREATEST(nc.unread - d.unread, 0),
+            version = nc.version + 1
+        FROM (
+            SELECT user_id, COUNT(*) FILTER (WHERE NOT COALESCE(is_read, FALSE)) AS unread
+            FROM old_rows
+            GROUP BY user_id
+        ) d
+        WHERE nc.user_id = d.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notifications_counters_insert ON notifications;
+DROP TRIGGER IF EXISTS trg_notifications_counters_update ON notifications;
+DROP TRIGGER IF EXISTS trg_notifications_counters_delete ON notifications;
+
+CREATE TRIGGER trg_notifications_counters_insert AFTER INSERT ON notifications
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION maintain_notification_counters();
+CREATE TRIGGER trg_notifications_counters_update AFTER UPDATE ON notifications
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION maintain_notification_counters();
+CREATE TRIGGER trg_notifications_counters_delete AFTER DELETE ON notifications
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION maintain_notification_counters();
+
+INSERT INTO notification_counters (user_id, unread, version)
+SELECT user_id, COUNT(*) FILTER (WHERE NOT COALESCE(is_read, FALSE)), 1
+FROM notifications
+GROUP BY user_id
+ON CONFLICT (user_id) DO UPDATE SET unread = EXCLUDED.unread, version = notification_counters.version + 1;
+
+-- Ящик: keyset по (created_at, id) для всех и отдельно для непрочитанных
+CREATE INDEX IF NOT EXISTS idx_notifications_inbox
+    ON notifications(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_notifications_inbox_unread
+    ON notifications(user_id, created_at DESC, id DESC)
+    WHERE NOT COALESCE(is_read, FALSE);
@@ -0,0 +1,83 @@
+-- Индекс поиска дубликатов тайтлов: нормализованные ключи названий и альтернативных названий с триграммами
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Ключ названия: нижний регистр, кириллица в латиницу, любая пунктуация и пробелы - один пробел.
+-- "Solo Leveling!", "solo-leveling" и "Соло левелинг" дают одинаковый или близкий ключ
+CREATE OR REPLACE FUNCTION normalize_title_key(title TEXT) RETURNS TEXT AS $$
+    SELECT btrim(regexp_replace(
+        translate(
+            replace(replace(replace(replace(replace(replace(replace(replace(replace(
+                lower(title),
+                'щ', 'shch'), 'ж', 'zh'), 'х', 'kh'), 'ц', 'ts'), 'ч', 'ch'), 'ш', 'sh'),
+                'ю', 'yu'), 'я', 'ya'), 'ё', 'e'),
+            'абвгдезийклмнопрстуфыэàáâãäåèéêëìíîïòóôõöùúûüýñçъь',
+            'abvgdeziiklmnoprstufyeaaaaaaeeeeiiiiooooouuuuync'
+        ),
+        '[^a-z0-9]+', ' ', 'g'
+    ))
+$$ LANGUAGE SQL IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS manhwa_title_keys (
+    manhwa_id INTEGER NOT NULL REFERENCES manhwa(id) ON DELETE CASCADE,
+    title_key TEXT NOT NULL,
+    title TEXT NOT NULL,
+    source VARCHAR(20) NOT NULL,
+    PRIMARY KEY (manhwa_id, title_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_manhwa_title_keys_key ON manhwa_title_keys(title_key);
+CREATE INDEX IF NOT EXISTS idx_manhwa_title_keys_trgm ON manhwa_title_keys USING GIN (title_key gin_trgm_ops);
+
+-- Основное название манхвы пишут несколько функций, поэтому ключ ведет триггер
+CREATE OR REPLACE FUNCTION maintain_manhwa_title_key() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        DELETE FROM manhwa_title_keys WHERE manhwa_id = NEW.id AND source = 'title';
+    END IF;
+
+    INSERT INTO manhwa_title_keys (manhwa_id, title_key, title, source)
+    SELECT NEW.id, normalize_title_key(NEW.title), NEW.title, 'title'
+    WHERE normalize_title_key(NEW.title) <> ''
+    ON CONFLICT (manhwa_id, title_key) DO UPDATE SET title = EXCLUDED.title, source = 'title';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_manhwa_title_key ON manhwa;
+CREATE TRIGGER trg_manhwa_title_key
+    AFTER INSERT OR UPDATE OF title ON manhwa
+    FOR EACH ROW EXECUTE FUNCTION maintain_manhwa_title_key();
+
+-- Альтернативные названия есть только у заявок: попадают в индекс, когда заявка одобрена
+CREATE OR REPLACE FUNCTION maintain_submission_title_keys() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO manhwa_title_keys (manhwa_id, title_key, title, source)
+    SELECT NEW.manhwa_id, normalize_title_key(alt), btrim(alt), 'alternative'
+    FROM unnest(string_to_array(NEW.alternative_titles, ',')) AS alt
+    WHERE normalize_title_key(alt) <> ''
+    ON CONFLICT (manhwa_id, title_key) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_submission_title_keys ON manhwa_submissions;
+CREATE TRIGGER trg_submission_title_keys
+    AFTER INSERT OR UPDATE OF status, manhwa_id, alternative_titles ON manhwa_submissions
+    FOR EACH ROW
+    WHEN (NEW.status = 'approved' AND NEW.manhwa_id IS NOT NULL AND NEW.alternative_titles IS NOT NULL)
+    EXECUTE FUNCTION maintain_submission_title_keys();
+
+INSERT INTO manhwa_title_keys (manhwa_id, title_key, title, source)
+SELECT id, normalize_title_key(title), title, 'title'
+FROM manhwa
+WHERE normalize_title_key(title) <> ''
+ON CONFLICT (manhwa_id, title_key) DO NOTHING;
+
+INSERT INTO manhwa_title_keys (manhwa_id, title_key, title, source)
+SELECT s.manhwa_id, normalize_title_key(alt), btrim(alt), 'alternative'
+FROM manhwa_submissions s
+JOIN manhwa m ON m.id = s.manhwa_id
+CROSS JOIN LATERAL unnest(string_to_array(s.alternative_titles, ',')) AS alt
+WHERE s.status = 'approved'
+  AND normalize_title_key(alt) <> ''
+ON CONFLICT (manhwa_id, title_key) DO NOTHING;
@@ -0,0 +1,30 @@
+-- Сброс кэша ролей moderator-bot: каждое изменение user_roles уведомляет слушателей по user_id
+CREATE OR REPLACE FUNCTION notify_user_roles_changed() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('user_roles_changed', OLD.user_id);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('user_roles_changed', NEW.user_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_user_roles_notify ON user_roles;
+CREATE TRIGGER trg_user_roles_notify
+    AFTER INSERT OR UPDATE OR DELETE ON user_roles
+    FOR EACH ROW EXECUTE FUNCTION notify_user_roles_changed();
+
+-- TRUNCATE не дает строк: пустое уведомление сбрасывает кэш целиком
+CREATE OR REPLACE FUNCTION notify_user_roles_truncated() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('user_roles_changed', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_user_roles_notify_truncate ON user_roles;
+CREATE TRIGGER trg_user_roles_notify_truncate
+    AFTER TRUNCATE ON user_roles
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_user_roles_truncated();
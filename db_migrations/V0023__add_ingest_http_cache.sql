@@ -0,0 +1,10 @@
+-- Валидаторы условных запросов импорта глав: список глав источника, не изменившийся с прошлого импорта,
+-- отдает 304 (или тот же хэш тела) и не разбирается заново. Запись обновляется только после успешного импорта
+CREATE TABLE IF NOT EXISTS ingest_http_cache (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash VARCHAR(64),
+    fetched_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    validated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,81 @@
+-- История изменений секционируется по месяцам created_at: чтение за период и по сущности затрагивает
+-- только нужные секции, а старые месяцы можно отсоединять целиком без DELETE по всей таблице
+ALTER TABLE change_history RENAME TO change_history_legacy;
+ALTER INDEX IF EXISTS idx_change_history_entity RENAME TO idx_change_history_legacy_entity;
+
+CREATE TABLE change_history (
+    id INTEGER NOT NULL DEFAULT nextval('change_history_id_seq'),
+    entity_type VARCHAR(50) NOT NULL,
+    entity_id INTEGER NOT NULL,
+    action VARCHAR(50) NOT NULL,
+    user_id VARCHAR(255) NOT NULL,
+    username VARCHAR(255),
+    changes TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE change_history_id_seq OWNED BY change_history.id;
+
+-- Страховка: строки месяца без секции попадают сюда, ensure_change_history_partitions переносит их в секцию
+CREATE TABLE IF NOT EXISTS change_history_default PARTITION OF change_history DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_change_history_entity
+    ON change_history(entity_type, entity_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_change_history_created
+    ON change_history(created_at DESC, id DESC);
+
+-- Секция одного месяца: если строки этого месяца уже лежат в секции по умолчанию, они переносятся
+CREATE OR REPLACE FUNCTION create_change_history_partition(month_start DATE) RETURNS TEXT AS $$
+DECLARE
+    from_date DATE := date_trunc('month', month_start)::date;
+    to_date DATE := (date_trunc('month', month_start) + interval '1 month')::date;
+    partition_name TEXT := 'change_history_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE change_history INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM change_history_default WHERE created_at >= %L AND created_at < %L RETURNING *)
+         INSERT INTO %I SELECT * FROM moved',
+        from_date, to_date, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE change_history ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, from_date, to_date
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Секции текущего и следующих months_ahead месяцев, а также месяцев, чьи строки попали в секцию по умолчанию;
+-- запускается командой maintain_history_partitions
+CREATE OR REPLACE FUNCTION ensure_change_history_partitions(months_ahead INTEGER) RETURNS TEXT[] AS $$
+    SELECT COALESCE(array_agg(created ORDER BY created) FILTER (WHERE created IS NOT NULL), ARRAY[]::TEXT[])
+    FROM (
+        SELECT create_change_history_partition(month::date) AS created
+        FROM (
+            SELECT date_trunc('month', CURRENT_DATE) + make_interval(months => m) AS month
+            FROM generate_series(0, months_ahead) AS m
+            UNION
+            SELECT DISTINCT date_trunc('month', created_at) FROM change_history_default
+        ) months
+    ) s
+$$ LANGUAGE SQL;
+
+-- Секции для месяцев существующей истории, затем перенос строк
+SELECT create_change_history_partition(month::date)
+FROM (
+    SELECT DISTINCT date_trunc('month', COALESCE(created_at, CURRENT_TIMESTAMP)) AS month
+    FROM change_history_legacy
+) months;
+
+SELECT ensure_change_history_partitions(3);
+
+INSERT INTO change_history (id, entity_type, entity_id, action, user_id, username, changes, created_at)
+SELECT id, entity_type, entity_id, action, user_id, username, changes, COALESCE(created_at, CURRENT_TIMESTAMP)
+FROM change_history_legacy;
+
+DROP TABLE change_history_legacy;
@@ -0,0 +1,30 @@
+-- Очередь модерации: модератор забирает пачку ожидающих заявок в аренду (claim_queue в moderator-bot),
+-- чужие действующие аренды пропускаются, истекшие освобождаются сами - следующий claim забирает их снова
+ALTER TABLE manhwa_submissions ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(255);
+ALTER TABLE manhwa_submissions ADD COLUMN IF NOT EXISTS claim_expires_at TIMESTAMP;
+
+ALTER TABLE translator_change_requests ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(255);
+ALTER TABLE translator_change_requests ADD COLUMN IF NOT EXISTS claim_expires_at TIMESTAMP;
+
+ALTER TABLE user_uploads ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(255);
+ALTER TABLE user_uploads ADD COLUMN IF NOT EXISTS claim_expires_at TIMESTAMP;
+
+-- Ключ keyset-пагинации не должен содержать NULL: сравнение (submitted_at, id) с NULL теряет строки
+UPDATE manhwa_submissions SET submitted_at = CURRENT_TIMESTAMP WHERE submitted_at IS NULL;
+ALTER TABLE manhwa_submissions ALTER COLUMN submitted_at SET NOT NULL;
+UPDATE translator_change_requests SET submitted_at = CURRENT_TIMESTAMP WHERE submitted_at IS NULL;
+ALTER TABLE translator_change_requests ALTER COLUMN submitted_at SET NOT NULL;
+UPDATE user_uploads SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE user_uploads ALTER COLUMN created_at SET NOT NULL;
+
+-- Выдача очереди (старые сначала) и страницы списков (новые сначала) - проход по одному индексу
+CREATE INDEX IF NOT EXISTS idx_submissions_status_submitted
+    ON manhwa_submissions(status, submitted_at, id);
+CREATE INDEX IF NOT EXISTS idx_translator_requests_status_submitted
+    ON translator_change_requests(status, submitted_at, id);
+CREATE INDEX IF NOT EXISTS idx_user_uploads_status_created
+    ON user_uploads(moderation_status, created_at, id);
+
+DROP INDEX IF EXISTS idx_submissions_status;
+DROP INDEX IF EXISTS idx_translator_requests_status;
+DROP INDEX IF EXISTS idx_user_uploads_status;
@@ -0,0 +1,16 @@
+-- Счетчики участников и загрузок команды ведет функция uploads в транзакции записи (единственный писатель
+-- team_members и user_uploads), расхождения исправляет команда reconcile_team_counters в moderator-bot.
+-- Список команд читает только teams, без соединения с участниками и загрузками
+UPDATE teams t
+SET member_count = COALESCE((SELECT COUNT(*) FROM team_members tm WHERE tm.team_id = t.id), 0),
+    manhwa_count = COALESCE((SELECT COUNT(*) FROM user_uploads uu WHERE uu.team_id = t.id), 0);
+
+ALTER TABLE teams ALTER COLUMN member_count SET DEFAULT 0;
+ALTER TABLE teams ALTER COLUMN member_count SET NOT NULL;
+ALTER TABLE teams ALTER COLUMN manhwa_count SET NOT NULL;
+
+-- Страницы списка команд по курсору (created_at, id)
+UPDATE teams SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE teams ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_teams_created ON teams(created_at DESC, id DESC);
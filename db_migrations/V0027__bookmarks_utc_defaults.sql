@@ -0,0 +1,6 @@
+-- Время закладок хранится в UTC без зоны, как и время изменений с клиента (parse_client_time):
+-- значения по умолчанию не должны зависеть от часового пояса сервера БД
+ALTER TABLE t_p15993318_manhwa_reader_platfo.bookmarks
+    ALTER COLUMN created_at SET DEFAULT timezone('UTC', now()),
+    ALTER COLUMN updated_at SET DEFAULT timezone('UTC', now()),
+    ALTER COLUMN changed_at SET DEFAULT timezone('UTC', now());
@@ -0,0 +1,50 @@
+-- Счетчики уведомлений блокируются в порядке user_id: параллельные пачки рассылки с пересекающимися
+-- подписчиками (add_chapter, фоновый воркер, process_fanout) иначе могли взять строки в разном порядке
+-- и упасть во взаимную блокировку
+CREATE OR REPLACE FUNCTION maintain_notification_counters() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO notification_counters AS nc (user_id, unread, version)
+        SELECT user_id, COUNT(*) FILTER (WHERE NOT COALESCE(is_read, FALSE)), 1
+        FROM new_rows
+        GROUP BY user_id
+        ORDER BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET unread = nc.unread + EXCLUDED.unread,
+            version = nc.version + 1;
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM 1 FROM notification_counters
+        WHERE user_id IN (SELECT user_id FROM new_rows)
+        ORDER BY user_id
+        FOR UPDATE;
+
+        UPDATE notification_counters nc
+        SET unread = GREATEST(nc.unread + d.delta, 0),
+            version = nc.version + 1
+        FROM (
+            SELECT n.user_id,
+                   SUM((NOT COALESCE(n.is_read, FALSE))::int - (NOT COALESCE(o.is_read, FALSE))::int) AS delta
+            FROM new_rows n
+            JOIN old_rows o ON o.id = n.id
+            GROUP BY n.user_id
+        ) d
+        WHERE nc.user_id = d.user_id;
+    ELSE
+        PERFORM 1 FROM notification_counters
+        WHERE user_id IN (SELECT user_id FROM old_rows)
+        ORDER BY user_id
+        FOR UPDATE;
+
+        UPDATE notification_counters nc
+        SET unread = GREATEST(nc.unread - d.unread, 0),
+            version = nc.version + 1
+        FROM (
+            SELECT user_id, COUNT(*) FILTER (WHERE NOT COALESCE(is_read, FALSE)) AS unread
+            FROM old_rows
+            GROUP BY user_id
+        ) d
+        WHERE nc.user_id = d.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
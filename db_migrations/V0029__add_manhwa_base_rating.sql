@@ -0,0 +1,8 @@
+-- Рейтинг без оценок: base_rating задается вручную (update_manhwa) и показывается, пока оценок нет.
+-- Раньше при удалении последней оценки оставалось среднее удаленных оценок
+ALTER TABLE manhwa ADD COLUMN IF NOT EXISTS base_rating DECIMAL(3,1);
+
+-- Ручной рейтинг известен только у манхв без оценок; у остальных он уже перезаписан средним
+UPDATE manhwa SET base_rating = rating WHERE rating_count = 0;
+
+UPDATE manhwa SET rating = COALESCE(base_rating, 0) WHERE rating_count = 0 AND rating IS DISTINCT FROM COALESCE(base_rating, 0);
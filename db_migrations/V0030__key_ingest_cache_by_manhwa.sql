@@ -0,0 +1,8 @@
+-- Валидаторы импорта принадлежат паре (манхва, источник): одна ссылка может импортироваться в разные манхвы,
+-- и 304 для одной не значит, что у другой есть все главы. Старые записи не привязать к манхве - сбрасываем,
+-- следующий sync_chapters каждой манхвы просто сделает полный запрос
+TRUNCATE ingest_http_cache;
+
+ALTER TABLE ingest_http_cache ADD COLUMN IF NOT EXISTS manhwa_id INTEGER NOT NULL;
+ALTER TABLE ingest_http_cache DROP CONSTRAINT IF EXISTS ingest_http_cache_pkey;
+ALTER TABLE ingest_http_cache ADD PRIMARY KEY (manhwa_id, url);